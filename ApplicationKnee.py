@@ -1,14 +1,43 @@
-import vtk
-import sys
 import time
-
-# Function to create a volume render with as input the scalars, colors, opacity and piecewise function
+#Start of the startup timing, before the imports
+startupBegin = time.perf_counter()
+import KneeVTK as vtk
+import os
+import sys
+import argparse
+import threading
+import subprocess
+from TimestepCache import TimestepCache
+from RegionIndex import RegionIndex
+from KneePlayer import AnimationPlayer, playbackModes
+from KneePrefetch import Prefetcher, Refiner
+from KneeResident import ResidentFrames, residentBytes
+from KneeLevels import LevelOfDetail
+from KneeRender import RenderScheduler
+from KneeMemory import MemoryBudget
+from KneeProfiler import PipelineProfiler, StartupProfiler
+from KneeBenchmark import InteractionBenchmark
+from KneeExport import frameTimesteps, readCameraPath, exportFrames, writeVideo, splitExport, framePattern
+from KneeStore import openStore
+from MeshCache import MeshCache
+from KneeInbetween import InbetweenCache
+from KneeMetrics import computeMetrics, metricsText, MetricsStore, metricsPath
+from KneeContact import ContactAnalysis, contactPairs, distanceLookupTable, colourByDistance
+from KneeServer import RenderServer, serve
+from KneeSurface import contourEngines, lodFractions
+from LabelMap import LabelVolume, mergeLabels
+startup = StartupProfiler(startupBegin)
+startup.mark("import")
+from KneeStructures import skin_list, bone_list, muscle_list1, muscle_list2, ligament1_list, ligament2_list, tendon1_list, tendon2_list, menis_list
+from KneeStructures import structureSettings, allStructureFiles
+
+#Volume sampling while a slider is dragged: a ray for every second pixel in x and y, and half the samples along a ray
+draftImageSampleDistance = 2.0
+draftSampleDistance = 2.0
+
+# Function to create a volume render with as input the scalars, colors, opacity and piecewise function.
+# Its mapper is created by createVolumeMapper on first use of the volume render style.
 def createVolumeRender(File, ScalarList, ColorList, OpacList, PieceList):
-  #Create the mappers
-  volumeMapper = vtk.vtkGPUVolumeRayCastMapper()
-  volumeMapper.SetInputConnection(File.GetOutputPort())
-  volumeMapper.SetBlendModeToComposite()
-
   #Create the color transfer function
   volumeCTF = vtk.vtkColorTransferFunction()
   volumeCTF.AddRGBPoint(ScalarList[0],  ColorList[0][0], ColorList[0][1], ColorList[0][2])
@@ -40,67 +69,43 @@ def createVolumeRender(File, ScalarList, ColorList, OpacList, PieceList):
   volumeProperty.SetDiffuse(0.5)
   volumeProperty.SetSpecular(0.5)
 
-  #Create volume and set mapper and property to volume
+  #Create volume and set property to volume
   volume = vtk.vtkVolume()
-  volume.SetMapper(volumeMapper)
   volume.SetProperty(volumeProperty)
 
   #Return volume
   return volume
 
-# Function to create a isosurface actor with the threshold value and smoothing iterations as input
-def createKneeSkin(reader, value, smooth):
-  #Function to select tissue at a threshold
-  selectTissue = vtk.vtkImageThreshold()
-  selectTissue.ThresholdBetween(5, 1150)
-  selectTissue.SetInValue(255)
-  selectTissue.SetOutValue(0)
-  selectTissue.SetInputConnection(reader.GetOutputPort())
-
-  #Gaussian function for marching cubes
-  gaussianRadius = 1
-  gaussianStandardDeviation = 2.0
-  gaussian = vtk.vtkImageGaussianSmooth()
-  gaussian.SetStandardDeviations(gaussianStandardDeviation, gaussianStandardDeviation, gaussianStandardDeviation)
-  gaussian.SetRadiusFactors(gaussianRadius, gaussianRadius, gaussianRadius)
-  gaussian.SetInputConnection(selectTissue.GetOutputPort())
-
-  #Marching cubes algorithm
-  isoValue = value
-  mcubes = vtk.vtkMarchingCubes()
-  mcubes.SetInputConnection(gaussian.GetOutputPort())
-  mcubes.ComputeScalarsOff()
-  mcubes.ComputeGradientsOff()
-  mcubes.ComputeNormalsOff()
-  mcubes.SetValue(0, isoValue)
-
-  #Smoothing function
-  smoothingIterations = smooth
-  passBand = 0.001
-  featureAngle = 90
-  smoother = vtk.vtkWindowedSincPolyDataFilter()
-  smoother.SetInputConnection(mcubes.GetOutputPort())
-  smoother.SetNumberOfIterations(smoothingIterations)
-  smoother.BoundarySmoothingOn()
-  smoother.FeatureEdgeSmoothingOn()
-  smoother.SetFeatureAngle(featureAngle)
-  smoother.SetPassBand(passBand)
-  smoother.NonManifoldSmoothingOff()
-  smoother.NormalizeCoordinatesOn()
-  smoother.Update()
-
-  #Function for vtk poly data normals
-  normals = vtk.vtkPolyDataNormals()
-  normals.SetInputConnection(smoother.GetOutputPort())
-  normals.SetFeatureAngle(featureAngle)
-
-  #Function for vtk stripper
-  stripper = vtk.vtkStripper()
-  stripper.SetInputConnection(normals.GetOutputPort())
+# Function to create the mapper of a volume render with as input the image of its structure
+def createVolumeMapper(volume, File):
+  volumeMapper = vtk.vtkGPUVolumeRayCastMapper()
+  volumeMapper.SetInputConnection(File.GetOutputPort())
+  volumeMapper.SetBlendModeToComposite()
+  volume.SetMapper(volumeMapper)
 
+# Function to build the mappers of the volume renders on first use of the volume render style, the isosurfaces are shown
+# at startup. Until then the volume rendering modules are not loaded.
+def buildVolumeMappers():
+  if labelVolume is not None:
+    volumes = [(labelVolume.volume, "labelmap")]
+    if labelVolume.volume.GetMapper() is None:
+      labelVolume.createMapper()
+  else:
+    volumes = [(volume, name) for name, (actor, volume) in structureProps.items()]
+    for volume, name in volumes:
+      if volume.GetMapper() is None:
+        createVolumeMapper(volume, volumeInputs[name])
+  if profiler is not None:
+    for volume, name in volumes:
+      if volume not in profiledVolumes:
+        profiler.watchMapper(volume.GetMapper(), name)
+        profiledVolumes.append(volume)
+
+# Function to create a isosurface actor, the surface itself is given by a producer that is updated per time step
+def createKneeSkin(surface):
   #Function for vtk mapper
   mapper = vtk.vtkPolyDataMapper()
-  mapper.SetInputConnection(stripper.GetOutputPort())
+  mapper.SetInputConnection(surface.GetOutputPort())
 
   #Create actor
   actor = vtk.vtkActor()
@@ -109,122 +114,275 @@ def createKneeSkin(reader, value, smooth):
   #Return actor
   return actor
 
+# Function to show a frame of the flexion, a time step or an in-between of two time steps with --inbetween.
+# The inputs of all anatomic structures are swapped to the images and surfaces of the frame.
+# In the resident animation only the props of the time step are made visible. Otherwise the frame comes from the prefetch buffer when it is used, and the time steps around this one are prefetched.
+# A draft frame can be asked for while a slider is dragged, it is used unless the final frame is prefetched already.
+# A prefetched frame that was loaded for other visible structures is loaded again, mostly from the caches.
+# Returns True when the frame that is shown has draft surfaces.
+def setTimestep(i, draft=False):
+  if profiler is not None:
+    profiler.timestep = i // framesPerTimestep
+  #In the resident animation all time steps are on the GPU already
+  if resident is not None:
+    resident.setFrame(i)
+    return False
+  if draft and (prefetcher is None or not prefetcher.isReady(i)):
+    frame = loadFrame(i, draft=True)
+  else:
+    frame = prefetcher.take(i) if prefetcher is not None else loadFrame(i)
+    if frame[5] != visibleParts():
+      frame = loadFrame(i)
+  showLoadedFrame(i, frame)
+  if prefetcher is not None:
+    prefetcher.prefetch(i)
+  return frame[4]
+
+# Function to swap the inputs of all anatomic structures to the images and surfaces of a loaded frame.
+# The parts that are not in the frame are detached from their data and hidden, so the caches can release it.
+def showLoadedFrame(i, frame):
+  global shownTimestep, shownParts
+  images, surfaces, levels, labelImage, draft, parts = frame
+  for (producer, fileList), image in zip(structureInputs, images):
+    producer.SetOutput(image if image is not None else vtk.vtkImageData())
+    structureProps[structureName(fileList)][1].SetVisibility(image is not None)
+  for (surface, settings), polyData, polyDatas in zip(surfaceInputs, surfaces, levels):
+    surface.SetOutput(polyData if polyData is not None else vtk.vtkPolyData())
+    for level, levelData in zip(surfaceLevels[surface], polyDatas or [None] * len(surfaceLevels[surface])):
+      level.SetOutput(levelData if levelData is not None else vtk.vtkPolyData())
+    structureProps[structureName(settings[0])][0].SetVisibility(polyData is not None)
+  if labelVolume is not None:
+    labelVolume.setLabelImage(labelImage if labelImage is not None else vtk.vtkImageData())
+    labelVolume.volume.SetVisibility(labelImage is not None)
+  shownTimestep = i
+  shownParts = parts
+  if metricsActor is not None:
+    metricsActor.SetInput(metricsText(metricsRows, (i + framesPerTimestep // 2) // framesPerTimestep + 1))
+  memoryBudget.enforce()
+
+# Function to swap in the final frame that was shown as a draft, if the slider is still at that frame
+def showRefinedFrame(i, frame):
+  if sliderFrame(StyleN1.GetValue()) == i:
+    if frame[5] != visibleParts():
+      frame = loadFrame(i)
+    showLoadedFrame(i, frame)
+
+# Function to get the name of the anatomic structure of a list of files
+def structureName(fileList):
+  for name, settings in structureSettings.items():
+    if settings[0] is fileList:
+      return name
+
+# Function to get the parts of the anatomic structures that are visible: ("surface", name) for the isosurfaces or ("volume", name)
+# for the volume renders of the structures that are not transparent, depending on the render style, and ("labelmap", None) for
+# the label map volume render. Only the visible parts of a time step are loaded and shown.
+def visibleParts():
+  parts = set()
+  for name, (actor, volume) in structureProps.items():
+    if actor.GetProperty().GetOpacity() > 0:
+      if not volumeStyle:
+        parts.add(("surface", name))
+      elif labelVolume is None:
+        parts.add(("volume", name))
+  if volumeStyle and labelVolume is not None:
+    parts.add(("labelmap", None))
+  return frozenset(parts)
+
+# Function to get all parts of the anatomic structures, whether they are visible or not
+def allParts():
+  parts = set([("surface", name) for name in structureSettings])
+  if labelVolume is None:
+    parts.update([("volume", name) for name in structureSettings])
+  else:
+    parts.add(("labelmap", None))
+  return frozenset(parts)
+
+# Function to show the parts that became visible, after an opacity slider left 0 or the render style changed.
+# They catch up to the time step on screen, the parts that became hidden are detached.
+def updateVisibleParts():
+  if resident is None and shownTimestep is not None and visibleParts() != shownParts:
+    showLoadedFrame(shownTimestep, loadFrame(shownTimestep))
+
+# Function to get the frame of the flexion at a value of the flexion slider, a time step has framesPerTimestep frames
+def sliderFrame(value):
+  return min(int(value * framesPerTimestep), frameCount - 1)
+
+# Function to load a frame of the flexion: the images of the anatomic structures, their isosurfaces with their levels of detail
+# and the label map when it is used. Only the visible parts are loaded unless other parts are asked for, the others are None.
+# It only touches the caches and not the pipelines on screen, so it can run on a worker thread.
+# A draft frame has the draft surface of every structure whose final surface is not extracted yet, also as its levels of detail.
+# An in-between frame has the in-between images and isosurfaces of the time steps before and after it, with their own levels of
+# detail, and the label map modes show the nearest time step.
+def loadFrame(i, draft=False, parts=None):
+  parts = visibleParts() if parts is None else parts
+  t, step = divmod(i, framesPerTimestep)
+  nearest = (i + framesPerTimestep // 2) // framesPerTimestep
+  weight = step / float(framesPerTimestep)
+  images = [None if ("volume", structureName(fileList)) not in parts else
+            volumeCache.getImage(fileList[t]) if step == 0 else inbetweenCache.getImage(fileList[t], fileList[t + 1], step)
+            for producer, fileList in structureInputs]
+  surfaces = [None] * len(surfaceInputs)
+  levels = [[] for surface in surfaceInputs]
+  drafted = False
+  if args.surface_mode == "labelmap":
+    #All surfaces from one sweep over the label map, surfaceInputs has the order of the labels
+    names = list(structureSettings)
+    if any(("surface", name) in parts for name in names):
+      fileNames = [fileList[nearest] for fileList, value, smooth in structureSettings.values()]
+      smooths = [smooth for fileList, value, smooth in structureSettings.values()]
+      allSurfaces = meshCache.getLabelSurfaces(fileNames, smooths, lambda: getLabelImage(nearest))
+      allLevels = meshCache.getLabelLevels(fileNames, smooths, lambda: getLabelImage(nearest)) if args.lod else levels
+      for n, name in enumerate(names):
+        if ("surface", name) in parts:
+          surfaces[n] = allSurfaces[n]
+          levels[n] = allLevels[n]
+  else:
+    for n, (surface, (fileList, value, smooth)) in enumerate(surfaceInputs):
+      if ("surface", structureName(fileList)) not in parts:
+        continue
+      if step == 0:
+        extracted = meshCache.hasSurface(fileList[t], value, smooth)
+      else:
+        extracted = meshCache.hasInbetweenSurface(fileList[t], fileList[t + 1], weight, value, smooth)
+      if draft and not extracted:
+        surfaces[n] = meshCache.getDraftSurface(fileList[nearest], value)
+        levels[n] = [surfaces[n]] * len(surfaceLevels[surface])
+        drafted = True
+      elif step == 0:
+        surfaces[n] = meshCache.getSurface(fileList[t], value, smooth)
+        levels[n] = meshCache.getLevels(fileList[t], value, smooth) if args.lod else []
+      else:
+        surfaces[n] = meshCache.getInbetweenSurface(fileList[t], fileList[t + 1], weight, value, smooth,
+                                                    lambda: inbetweenCache.getImage(fileList[t], fileList[t + 1], step))
+        levels[n] = meshCache.getInbetweenLevels(fileList[t], fileList[t + 1], weight, value, smooth,
+                                                 lambda: inbetweenCache.getImage(fileList[t], fileList[t + 1], step)) if args.lod else []
+  labelImage = getLabelImage(nearest) if ("labelmap", None) in parts else None
+  if contactAnalysis is not None and not drafted:
+    surfaces = contactSurfaces(i, surfaces)
+  return images, surfaces, levels, labelImage, drafted, parts
+
+# Function to colour the surfaces of the contact pairs by their distance to the other structure of their pair, when both
+# surfaces are loaded. The distances are computed with the surfaces as they were loaded, before any of them is coloured.
+def contactSurfaces(i, surfaces):
+  names = [structureName(settings[0]) for surface, settings in surfaceInputs]
+  coloured = list(surfaces)
+  for name, other in contactPairs:
+    surface, otherSurface = surfaces[names.index(name)], surfaces[names.index(other)]
+    if surface is not None and otherSurface is not None:
+      coloured[names.index(name)] = contactAnalysis.colouredSurface(name, other, i, surface, otherSurface)
+  return coloured
+
+# Function to get the label map of all structures of a time step, it is merged once and then kept
+def getLabelImage(i):
+  with labelLock:
+    if i not in labelImages:
+      labelImages[i] = mergeLabels([volumeCache.getImage(fileList[i]) for fileList, value, smooth in structureSettings.values()])
+    return labelImages[i]
+
+# Function to render the volumes with fewer rays and samples while a slider is dragged, and at full quality again after it
+def setDraftQuality(draft):
+  volumes = [volumeSkin, volumeBone, volumeMuscle1, volumeMuscle2, volumeLigament1, volumeLigament2, volumeTendon1, volumeTendon2, volumeMenis]
+  if labelVolume is not None:
+    volumes.append(labelVolume.volume)
+  if resident is not None:
+    volumes += [volume for frame in resident.volumeFrames for volume in frame]
+  for volume in volumes:
+    mapper = volume.GetMapper()
+    if mapper is None:
+      continue
+    mapper.SetAutoAdjustSampleDistances(0 if draft else 1)
+    mapper.SetImageSampleDistance(draftImageSampleDistance if draft else 1.0)
+    mapper.SetSampleDistance(draftSampleDistance if draft else 1.0)
+
+# Functions to start and end the draft quality of a slider drag, a refinement of the flexion that is pending is dropped
+def startDraft(caller, ev):
+  refiner.cancel()
+  setDraftQuality(True)
+
+def endDraft(caller, ev):
+  setDraftQuality(False)
+  scheduler.request()
+
+# Function to change the opacity of structures as their slider does: the isosurfaces get the value in percent
+# and the volume renders half of it between the edges of the scalars
+def setStructureOpacity(actors, volumes, scalar, names, value):
+  #Change opacity isosurface
+  for actor in actors:
+    actor.GetProperty().SetOpacity(value/100)
+  #Change opacity of volume render, the two inner nodes of its opacity function are edited in place
+  for volume in volumes:
+    volumeOTF = volume.GetProperty().GetScalarOpacity()
+    volumeOTF.SetNodeValue(1, [scalar[1], value/200, 0.5, 0.0])
+    volumeOTF.SetNodeValue(2, [scalar[2], value/200, 0.5, 0.0])
+  setLabelOpacity(names, value/200)
+  updateVisibleParts()
+
+# Function to change the opacity of structures in the label map volume render, if it is used
+def setLabelOpacity(names, opacity):
+  if labelVolume is not None:
+    for name in names:
+      labelVolume.setOpacity(name, opacity)
+
+# Function to stop the prefetch threads and report the profile when the application ends
+def finish():
+  if refiner is not None:
+    refiner.shutdown()
+  if prefetcher is not None:
+    prefetcher.shutdown()
+  if args.memory_report:
+    memoryBudget.printReport()
+  if contactAnalysis is not None:
+    contactAnalysis.printReport()
+  if profiler is not None:
+    if scheduler is not None:
+      print(scheduler.report())
+    profiler.printSummary()
+    if args.profile:
+      profiler.writeReport(args.profile)
+
 # Class for the interaction with the keyboard
 class MyInteractorStyle(vtk.vtkInteractorStyleTrackballCamera):
     def __init__(self,parent=None):
         self.parent = iren
         self.AddObserver("KeyPressEvent",self.keyPressEvent)
 
-    #On press of spacebar, loop through all time steps
+    #On press of spacebar, play or pause the animation of the time steps.
+    #Key l changes the playback mode, the plus and minus keys change the frame rate
     def keyPressEvent(self,obj,event):
       key = self.parent.GetKeySym()
       if key == 'space':
         text_widget.Off()
-        for i in range(len(muscle_list1)):
-          skin.SetFileName("Structures/"+skin_list[i])
-          bones.SetFileName("Structures/"+bone_list[i])
-          muscle1.SetFileName("Structures/"+muscle_list1[i])
-          muscle2.SetFileName("Structures/"+muscle_list2[i])
-          ligament1.SetFileName("Structures/"+ligament1_list[i])
-          ligament2.SetFileName("Structures/"+ligament2_list[i])
-          tendon1.SetFileName("Structures/"+tendon1_list[i])
-          tendon2.SetFileName("Structures/"+tendon2_list[i])
-          menis.SetFileName("Structures/"+menis_list[i])
-          iren.GetRenderWindow().Render()
+        player.toggle()
+      elif key == 'l':
+        player.setMode(playbackModes[(playbackModes.index(player.mode) + 1) % len(playbackModes)])
+        print("Playback mode " + player.mode)
+      elif key in ('plus', 'equal', 'KP_Add'):
+        player.setFps(player.fps * 1.5)
+        print("Target frame rate %.1f fps" % player.fps)
+      elif key in ('minus', 'KP_Subtract'):
+        player.setFps(player.fps / 1.5)
+        print("Target frame rate %.1f fps" % player.fps)
 
 # Slider created for the flexion of the Knee
 class SliderFlexion():
-  #Initialize all anantomic structures
-    def __init__(self, skin, bones, muscle1, muscle2, ligament1, ligament2, tendon1, tendon2, meniscus):
-        self.skin = skin
-        self.bones = bones
-        self.muscle1 = muscle1
-        self.muscle2 = muscle2
-        self.ligament1 = ligament1
-        self.ligament2 = ligament2
-        self.tendon1 = tendon1
-        self.tendon2 = tendon2
-        self.meniscus  = meniscus
-    #Depended on the value of the slider, visualize a time step
+    def __init__(self):
+        self.timestep = 0
+        self.draft = False
+
+    #Depended on the value of the slider, visualize a frame of the flexion, as a draft while the slider is dragged
     def __call__(self, caller, ev):
         sliderWidget = caller
         value = sliderWidget.GetRepresentation().GetValue()
-        if value >= 0 and value < 1:
-          self.skin.SetFileName("Structures/"+skin_list[0])
-          self.bones.SetFileName("Structures/"+bone_list[0])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[0])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[0])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[0])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[0])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[0])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[0])
-          self.meniscus.SetFileName("Structures/"+menis_list[0])
-
-        elif value >= 1 and value < 2:
-          self.skin.SetFileName("Structures/"+skin_list[1])
-          self.bones.SetFileName("Structures/"+bone_list[1])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[1])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[1])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[1])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[1])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[1])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[1])
-          self.meniscus.SetFileName("Structures/"+menis_list[1])
-
-        elif value >= 2 and value < 3:
-          self.skin.SetFileName("Structures/"+skin_list[2])
-          self.bones.SetFileName("Structures/"+bone_list[2])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[2])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[2])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[2])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[2])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[2])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[2])
-          self.meniscus.SetFileName("Structures/"+menis_list[2])
-
-        elif value >= 3 and value < 4:
-          self.skin.SetFileName("Structures/"+skin_list[3])
-          self.bones.SetFileName("Structures/"+bone_list[3])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[3])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[3])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[3])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[3])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[3])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[3])
-          self.meniscus.SetFileName("Structures/"+menis_list[3])
-
-        elif value >= 4 and value < 5:
-          self.skin.SetFileName("Structures/"+skin_list[4])
-          self.bones.SetFileName("Structures/"+bone_list[4])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[4])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[4])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[4])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[4])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[4])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[4])
-          self.meniscus.SetFileName("Structures/"+menis_list[4])
-
-        elif value >= 5 and value < 6:
-          self.skin.SetFileName("Structures/"+skin_list[5])
-          self.bones.SetFileName("Structures/"+bone_list[5])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[5])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[5])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[5])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[5])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[5])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[5])
-          self.meniscus.SetFileName("Structures/"+menis_list[5])
-
-        elif value >= 6 and value < 7:
-          self.skin.SetFileName("Structures/"+skin_list[6])
-          self.bones.SetFileName("Structures/"+bone_list[6])
-          self.muscle1.SetFileName("Structures/"+muscle_list1[6])
-          self.muscle2.SetFileName("Structures/"+muscle_list2[6])
-          self.ligament1.SetFileName("Structures/"+ligament1_list[6])
-          self.ligament2.SetFileName("Structures/"+ligament2_list[6])
-          self.tendon1.SetFileName("Structures/"+tendon1_list[6])
-          self.tendon2.SetFileName("Structures/"+tendon2_list[6])
-          self.meniscus.SetFileName("Structures/"+menis_list[6])
+        if value >= 0 and value < 7:
+          self.timestep = sliderFrame(value)
+          self.draft = setTimestep(self.timestep, draft=not args.no_draft)
+          player.seek(self.timestep)
+
+    #On release of the slider, load the final frame of a draft in the background and swap it in when it is done
+    def endInteraction(self, caller, ev):
+        if self.draft:
+          refiner.refine(self.timestep)
+          self.draft = False
 
 # Slider created for the opacity of the Skin
 class SliderOpacity():
@@ -235,17 +393,9 @@ class SliderOpacity():
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
       if value >= 0 and value < 100:
-        #Change opacity isosurface
-        skinActor.GetProperty().SetOpacity(value/100)
-        #Change opacity of volume render
-        volumeOTF = vtk.vtkPiecewiseFunction()
-        volumeOTF.AddPoint(self.scalar[0],  0)
-        volumeOTF.AddPoint(self.scalar[1],  value/200)
-        volumeOTF.AddPoint(self.scalar[2],  value/200)
-        volumeOTF.AddPoint(self.scalar[3],  0)
-        volumeSkin.GetProperty().SetScalarOpacity(volumeOTF)
-        #Render
-        renWin.Render()
+        setStructureOpacity([skinActor], [volumeSkin], self.scalar, ["skin"], value)
+        #Render at the next frame
+        scheduler.request()
 
 # Slider created for the opacity of the Bone
 class BoneOpacity():
@@ -256,17 +406,9 @@ class BoneOpacity():
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
       if value >= 0 and value < 100:
-        #Change opacity isosurface
-        boneActor.GetProperty().SetOpacity(value/100)
-        #Change opacity of volume render
-        volumeOTF = vtk.vtkPiecewiseFunction()
-        volumeOTF.AddPoint(self.scalar[0],  0)
-        volumeOTF.AddPoint(self.scalar[1],  value/200)
-        volumeOTF.AddPoint(self.scalar[2],  value/200)
-        volumeOTF.AddPoint(self.scalar[3],  0)
-        volumeBone.GetProperty().SetScalarOpacity(volumeOTF)
-        #Render
-        renWin.Render()
+        setStructureOpacity([boneActor], [volumeBone], self.scalar, ["bone"], value)
+        #Render at the next frame
+        scheduler.request()
 
 # Slider created for the opacity of the Tendon
 class TendonOpacity():
@@ -277,19 +419,9 @@ class TendonOpacity():
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
       if value >= 0 and value < 100:
-        #Change opacity isosurface
-        tendon1Actor.GetProperty().SetOpacity(value/100)
-        tendon2Actor.GetProperty().SetOpacity(value/100)
-        #Change opacity of volume render
-        volumeOTF = vtk.vtkPiecewiseFunction()
-        volumeOTF.AddPoint(self.scalar[0],  0)
-        volumeOTF.AddPoint(self.scalar[1],  value/200)
-        volumeOTF.AddPoint(self.scalar[2],  value/200)
-        volumeOTF.AddPoint(self.scalar[3],  0)
-        volumeTendon1.GetProperty().SetScalarOpacity(volumeOTF)
-        volumeTendon2.GetProperty().SetScalarOpacity(volumeOTF)
-        #Render
-        renWin.Render()
+        setStructureOpacity([tendon1Actor, tendon2Actor], [volumeTendon1, volumeTendon2], self.scalar, ["tendon1", "tendon2"], value)
+        #Render at the next frame
+        scheduler.request()
 
 # Slider created for the opacity of the Ligament
 class LigamentOpacity():
@@ -300,19 +432,9 @@ class LigamentOpacity():
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
       if value >= 0 and value < 100:
-        #Change opacity isosurface
-        ligament1Actor.GetProperty().SetOpacity(value/100)
-        ligament2Actor.GetProperty().SetOpacity(value/100)
-        #Change opacity of volume render
-        volumeOTF = vtk.vtkPiecewiseFunction()
-        volumeOTF.AddPoint(self.scalar[0],  0)
-        volumeOTF.AddPoint(self.scalar[1],  value/200)
-        volumeOTF.AddPoint(self.scalar[2],  value/200)
-        volumeOTF.AddPoint(self.scalar[3],  0)
-        volumeLigament1.GetProperty().SetScalarOpacity(volumeOTF)
-        volumeLigament2.GetProperty().SetScalarOpacity(volumeOTF)
-        #Render
-        renWin.Render()
+        setStructureOpacity([ligament1Actor, ligament2Actor], [volumeLigament1, volumeLigament2], self.scalar, ["ligament1", "ligament2"], value)
+        #Render at the next frame
+        scheduler.request()
 
 # Slider created for the opacity of the Meniscus
 class MeniscusOpacity():
@@ -323,18 +445,9 @@ class MeniscusOpacity():
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
       if value >= 0 and value < 100:
-        #Change opacity isosurface
-        menisActor.GetProperty().SetOpacity(value/100)
-        #Change opacity of volume render
-        volumeOTF = vtk.vtkPiecewiseFunction()
-        volumeOTF.AddPoint(self.scalar[0],  0)
-        volumeOTF.AddPoint(self.scalar[1],  value/200)
-        volumeOTF.AddPoint(self.scalar[2],  value/200)
-        volumeOTF.AddPoint(self.scalar[3],  0)
-        volumeMenis2.GetProperty().SetScalarOpacity(volumeOTF)
-        volumeMenis2.GetProperty().SetScalarOpacity(volumeOTF)
-        #Render
-        renWin.Render()
+        setStructureOpacity([menisActor], [volumeMenis], self.scalar, ["menis"], value)
+        #Render at the next frame
+        scheduler.request()
 
 # Slider created for the opacity of the Muscles
 class MuscleOpacity():
@@ -346,19 +459,9 @@ class MuscleOpacity():
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
       if value >= 0 and value < 100:
-        #Change opacity isosurface
-        muscleActor1.GetProperty().SetOpacity(value/100)
-        muscleActor2.GetProperty().SetOpacity(value/100)
-        #Change opacity of volume render
-        volumeOTF = vtk.vtkPiecewiseFunction()
-        volumeOTF.AddPoint(self.scalar[0],  0)
-        volumeOTF.AddPoint(self.scalar[1],  value/200)
-        volumeOTF.AddPoint(self.scalar[2],  value/200)
-        volumeOTF.AddPoint(self.scalar[3],  0)
-        volumeMuscle1.GetProperty().SetScalarOpacity(volumeOTF)
-        volumeMuscle2.GetProperty().SetScalarOpacity(volumeOTF)
-        #Render
-        renWin.Render()
+        setStructureOpacity([muscleActor1, muscleActor2], [volumeMuscle1, volumeMuscle2], self.scalar, ["muscle1", "muscle2"], value)
+        #Render at the next frame
+        scheduler.request()
 
 # Slider created to change the render style from Isosurface to Volume rendering or vice versa
 class ChangeRenderStyle():
@@ -367,46 +470,65 @@ class ChangeRenderStyle():
     def __call__(self, caller, ev):
       sliderWidget = caller
       value = sliderWidget.GetRepresentation().GetValue()
-      #If value of slider above 0.5 then change to Volume Rendering
-      if value >= 0.5:
-        ren.RemoveActor(boneActor)
-        ren.RemoveActor(skinActor)
-        ren.RemoveActor(muscleActor1)
-        ren.RemoveActor(muscleActor2)
-        ren.RemoveActor(ligament1Actor)
-        ren.RemoveActor(ligament2Actor)
-        ren.RemoveActor(tendon1Actor)
-        ren.RemoveActor(tendon2Actor)
-        ren.RemoveActor(menisActor)
-        ren.AddActor(volumeBone)
-        ren.AddActor(volumeLigament1)
-        ren.AddActor(volumeLigament2)
-        ren.AddActor(volumeMenis)
-        ren.AddActor(volumeMuscle1)
-        ren.AddActor(volumeMuscle2)
-        ren.AddActor(volumeTendon1)
-        ren.AddActor(volumeTendon2)
-        ren.AddActor(volumeSkin)
-      #If value of slider under 0.5 then change to Isosurface rendering
-      elif value < 0.5:
-        ren.RemoveActor(volumeBone)
-        ren.RemoveActor(volumeSkin)
-        ren.RemoveActor(volumeMuscle1)
-        ren.RemoveActor(volumeMuscle2)
-        ren.RemoveActor(volumeLigament1)
-        ren.RemoveActor(volumeLigament2)
-        ren.RemoveActor(volumeTendon1)
-        ren.RemoveActor(volumeTendon2)
-        ren.RemoveActor(volumeMenis)
-        ren.AddActor(ligament1Actor)
-        ren.AddActor(ligament2Actor)
-        ren.AddActor(boneActor)
-        ren.AddActor(muscleActor1)
-        ren.AddActor(muscleActor2)
-        ren.AddActor(tendon2Actor)
-        ren.AddActor(tendon1Actor)
-        ren.AddActor(menisActor)
-        ren.AddActor(skinActor)
+      #If value of slider above 0.5 then change to Volume Rendering, else to Isosurface rendering
+      setRenderStyle(value >= 0.5)
+
+# Function to change the render style, the volume render or the isosurfaces of all structures.
+# The structures of the new style catch up to the time step on screen.
+def setRenderStyle(style):
+  global volumeStyle
+  volumeStyle = style
+  #In the resident animation the props of both styles are in the renderer, only their visibility changes
+  if resident is not None:
+    resident.setVolumeStyle(volumeStyle)
+  #Change to Volume Rendering
+  elif volumeStyle:
+    buildVolumeMappers()
+    ren.RemoveActor(boneActor)
+    ren.RemoveActor(skinActor)
+    ren.RemoveActor(muscleActor1)
+    ren.RemoveActor(muscleActor2)
+    ren.RemoveActor(ligament1Actor)
+    ren.RemoveActor(ligament2Actor)
+    ren.RemoveActor(tendon1Actor)
+    ren.RemoveActor(tendon2Actor)
+    ren.RemoveActor(menisActor)
+    #All structures in one label map volume, or a volume per structure
+    if labelVolume is not None:
+      ren.AddActor(labelVolume.volume)
+    else:
+      ren.AddActor(volumeBone)
+      ren.AddActor(volumeLigament1)
+      ren.AddActor(volumeLigament2)
+      ren.AddActor(volumeMenis)
+      ren.AddActor(volumeMuscle1)
+      ren.AddActor(volumeMuscle2)
+      ren.AddActor(volumeTendon1)
+      ren.AddActor(volumeTendon2)
+      ren.AddActor(volumeSkin)
+  #Change to Isosurface rendering
+  else:
+    ren.RemoveActor(volumeBone)
+    ren.RemoveActor(volumeSkin)
+    ren.RemoveActor(volumeMuscle1)
+    ren.RemoveActor(volumeMuscle2)
+    ren.RemoveActor(volumeLigament1)
+    ren.RemoveActor(volumeLigament2)
+    ren.RemoveActor(volumeTendon1)
+    ren.RemoveActor(volumeTendon2)
+    ren.RemoveActor(volumeMenis)
+    if labelVolume is not None:
+      ren.RemoveActor(labelVolume.volume)
+    ren.AddActor(ligament1Actor)
+    ren.AddActor(ligament2Actor)
+    ren.AddActor(boneActor)
+    ren.AddActor(muscleActor1)
+    ren.AddActor(muscleActor2)
+    ren.AddActor(tendon2Actor)
+    ren.AddActor(tendon1Actor)
+    ren.AddActor(menisActor)
+    ren.AddActor(skinActor)
+  updateVisibleParts()
 
 # Function to create sliders easier
 # Input are max and min of slider, current value. Point1 and Point2 are coordinates of the endings of the slider.
@@ -431,17 +553,115 @@ def createSliderStyle(min,max,value,point1,point2,title,dim):
   return SliderStyle
 
 
-#List of all anatomic structures for different time steps
-skin_list       = ['skin_1.vti','skin_2.vti','skin_3.vti','skin_4.vti','skin_5.vti','skin_6.vti','skin_7.vti']
-bone_list       = ['bone1.vti','bone2.vti','bone3.vti','bone4.vti','bone5.vti','bone6.vti','bone7.vti']
-muscle_list1    = ['muscle1_1.vti','muscle1_2.vti','muscle1_3.vti','muscle1_4.vti','muscle1_5.vti','muscle1_6.vti','muscle1_7.vti']
-muscle_list2    = ['muscle2_1.vti','muscle2_2.vti','muscle2_3.vti','muscle2_4.vti','muscle2_5.vti','muscle2_6.vti','muscle2_7.vti']
-ligament1_list  = ['ligament1_1.vti','ligament1_2.vti','ligament1_3.vti','ligament1_4.vti','ligament1_5.vti','ligament1_6.vti','ligament1_7.vti']
-ligament2_list  = ['ligament2_1.vti','ligament2_2.vti','ligament2_3.vti','ligament2_4.vti','ligament2_5.vti','ligament2_6.vti','ligament2_7.vti']
-tendon1_list    = ['tendon1_1.vti','tendon1_2.vti','tendon1_3.vti','tendon1_4.vti','tendon1_5.vti','tendon1_6.vti','tendon1_7.vti']
-tendon2_list    = ['tendon2_1.vti','tendon2_2.vti','tendon2_3.vti','tendon2_4.vti','tendon2_5.vti','tendon2_6.vti','tendon2_7.vti']
-menis_list      = ['kneecap_1.vti','kneecap_2.vti','kneecap_3.vti','kneecap_4.vti','kneecap_5.vti','kneecap_6.vti','kneecap_7.vti']
-
+#Command line options
+parser = argparse.ArgumentParser(description="Visualization of the flexion of the knee")
+parser.add_argument("--cache-mb", type=int, default=256, help="memory cap of the time step cache in MB (default 256)")
+parser.add_argument("--preload", action="store_true", help="decode all time steps at startup instead of on first use")
+parser.add_argument("--no-store", action="store_true", help="read the .vti files even when the volume store of KneeStore.py exists")
+parser.add_argument("--no-crop", action="store_true", help="keep the full grid of every structure instead of cropping it to the structure")
+parser.add_argument("--region-index", default=".knee_cache/regions.json", help="file with the crop boxes of the structures (default .knee_cache/regions.json)")
+parser.add_argument("--mesh-cache", default=".knee_cache/meshes", help="directory of the stored isosurfaces (default .knee_cache/meshes)")
+parser.add_argument("--no-mesh-cache", action="store_true", help="do not store the isosurfaces on disk")
+parser.add_argument("--mesh-cache-mb", type=int, default=512, help="memory cap of the isosurfaces kept in memory in MB (default 512)")
+parser.add_argument("--memory-mb", type=int,
+                    help="memory cap in MB that the time step cache and the isosurface cache share, on top of their own caps")
+parser.add_argument("--memory-report", action="store_true", help="print the memory retained per stage and the peak memory at exit")
+parser.add_argument("--contour-engine", choices=contourEngines, default="marchingcubes",
+                    help="contour algorithm of the isosurfaces, marching cubes is the reference (default marchingcubes)")
+parser.add_argument("--volume-mode", choices=["separate", "labelmap"], default="separate",
+                    help="volume render a volume per structure, or all structures as one label map in a single pass, which is faster "
+                    "but has blocky edges and no gradient opacity, so thin structures such as the tendons are hard to see (default separate)")
+parser.add_argument("--surface-mode", choices=["separate", "labelmap"], default="separate",
+                    help="extract the isosurface of every structure separately, or all of them in one sweep over the label map (default separate)")
+parser.add_argument("--lod", action="store_true",
+                    help="give every isosurface actor decimated levels of detail (50%% and 10%% of the triangles) that are shown "
+                    "when a frame has to render fast, they are decimated once per time step and kept in the mesh cache")
+parser.add_argument("--precompute", type=int, nargs="?", const=os.cpu_count(), metavar="WORKERS",
+                    help="extract all isosurfaces on a pool of worker processes before the window opens (default: one per core)")
+parser.add_argument("--inbetween", type=int, default=0, metavar="N",
+                    help="frames interpolated between neighbouring time steps, for a smooth flexion on the slider and in the animation. "
+                    "They are blended from the signed distances of the structures and their isosurfaces are kept in the mesh cache (default 0)")
+parser.add_argument("--fps", type=float, default=5.0, help="target frame rate of the animation, late frames are dropped (default 5)")
+parser.add_argument("--playback", choices=playbackModes, default="once",
+                    help="play the animation once, in a loop or back and forth (default once)")
+parser.add_argument("--resident", action="store_true",
+                    help="keep a prop per structure and time step on the GPU, a time step change only switches visibility")
+parser.add_argument("--resident-mb", type=int, default=1024,
+                    help="GPU memory budget of --resident in MB, above it the time steps are loaded when shown (default 1024)")
+parser.add_argument("--prefetch", type=int, default=1, metavar="WORKERS",
+                    help="threads that load the time steps around the one on screen, 0 loads every time step when it is shown (default 1)")
+parser.add_argument("--no-draft", action="store_true",
+                    help="show the final surfaces and volume quality also while a slider is dragged, instead of drafts")
+parser.add_argument("--metrics", action="store_true",
+                    help="show the volume, surface area, length and movement of every structure at the time step on screen, "
+                    "the metrics are computed once per structure file and stored in %s" % metricsPath)
+parser.add_argument("--contact", action="store_true",
+                    help="colour the ligaments, tendons and meniscus by their distance to the bone or meniscus, red where they touch. "
+                    "The distances are computed once per frame, the times of the analysis are printed at exit")
+parser.add_argument("--profile", metavar="PATH",
+                    help="time every pipeline stage per structure and time step and write the report to PATH at exit (.json or .csv)")
+parser.add_argument("--profile-overlay", action="store_true", help="show the time of the last frames in the render window")
+parser.add_argument("--profile-startup", type=float, nargs="?", const=0, metavar="SECONDS",
+                    help="print the time of the startup phases up to the first frame, and whether it is within a target in seconds")
+parser.add_argument("--export", metavar="DIR", help="render the animation offscreen to a PNG sequence in DIR, without window or sliders")
+parser.add_argument("--export-video", metavar="PATH", help="with --export, also write the frames as an Ogg Theora video (.ogv)")
+parser.add_argument("--export-frames", type=int, default=7, metavar="N", help="frames of the export, spread over the time steps (default 7)")
+parser.add_argument("--export-style", choices=["iso", "volume"], default="iso", help="render style of the export (default iso)")
+parser.add_argument("--export-size", type=int, nargs=2, default=[1000, 1500], metavar=("WIDTH", "HEIGHT"),
+                    help="resolution of the export (default 1000 1500)")
+parser.add_argument("--export-opacity", nargs="+", default=[], metavar="STRUCTURE=PERCENT",
+                    help="opacity of structures in the export as on the sliders, e.g. skin=30 muscle=50")
+parser.add_argument("--camera-path", metavar="JSON", help="camera key frames of the export, a list of position, focalPoint and viewUp")
+parser.add_argument("--orbit", type=float, default=0.0, metavar="DEGREES", help="turn the camera of the export around the knee by DEGREES")
+parser.add_argument("--export-workers", type=int, default=1, help="processes that render a part of the export frames each (default 1)")
+parser.add_argument("--export-part", help=argparse.SUPPRESS)
+parser.add_argument("--serve", type=int, metavar="PORT",
+                    help="offscreen, serve the scene to local clients over HTTP on PORT: commands in, JPEG or PNG frames out")
+parser.add_argument("--serve-size", type=int, nargs=2, default=[500, 750], metavar=("WIDTH", "HEIGHT"),
+                    help="size of the frames of the server (default 500 750)")
+parser.add_argument("--serve-fps", type=float, default=30.0, help="most renders per second of the server, commands in between are merged (default 30)")
+parser.add_argument("--jpeg-quality", type=int, default=80, help="quality of the JPEG frames of the server (default 80)")
+parser.add_argument("--benchmark", metavar="JSON",
+                    help="offscreen, play a fixed script of slider moves and camera turns and write the frame times to JSON")
+args = parser.parse_args()
+if args.export is None and (args.export_video or args.export_part):
+  parser.error("--export-video and --export-part are only used with --export")
+if args.export and args.benchmark:
+  parser.error("--export and --benchmark cannot be used together")
+if args.serve is not None and (args.export or args.benchmark):
+  parser.error("--serve cannot be used with --export or --benchmark")
+if args.precompute and args.no_mesh_cache:
+  parser.error("--precompute stores the isosurfaces in the mesh cache, it cannot be used with --no-mesh-cache")
+if args.resident and args.contact:
+  parser.error("--resident keeps the props of the time steps without distance colours, it cannot be used with --contact")
+if args.resident and args.inbetween:
+  parser.error("--resident keeps the props of the time steps only, it cannot be used with --inbetween")
+if args.precompute and args.surface_mode == "labelmap":
+  parser.error("--precompute extracts the separate isosurfaces, it cannot be used with --surface-mode labelmap")
+
+#The opacities of the export as STRUCTURE=PERCENT, with the structures as the opacity sliders group them
+opacityGroupNames = ["skin", "bone", "muscle", "tendon", "ligament", "meniscus"]
+exportOpacities = []
+for item in args.export_opacity:
+  group, equals, value = item.partition("=")
+  if group not in opacityGroupNames:
+    parser.error("--export-opacity %s: unknown structure %s, choose from %s" % (item, group, ", ".join(opacityGroupNames)))
+  try:
+    percent = float(value)
+  except ValueError:
+    percent = None
+  if not equals or percent is None or not 0 <= percent <= 100:
+    parser.error("--export-opacity %s: the opacity is a percentage from 0 to 100" % item)
+  exportOpacities.append((group, percent))
+
+#Split the export over worker processes that run this script for a part of the frames each, then join the frames
+if args.export and args.export_workers > 1 and args.export_part is None:
+  seconds = splitExport(os.path.abspath(__file__), sys.argv[1:], args.export_workers)
+  print("Exported %d frames with %d workers in %.1f s: %.2f frames/s" % (args.export_frames, args.export_workers, seconds,
+                                                                       args.export_frames / seconds))
+  if args.export_video:
+    writeVideo(args.export, args.export_video, args.fps)
+  sys.exit(0)
 
 #Define the colors for the anatomic structures in RGBA 
 colors = vtk.vtkNamedColors()
@@ -464,37 +684,90 @@ tendonColor = [float(153)/255,float(153)/255,float(204)/255]
 ren = vtk.vtkRenderer()
 ren.SetBackground(0.2,0.2,0.2)
 
-#Define the renderwindow and size
+#Define the renderwindow and size, the export, the server and the benchmark render offscreen
 renWin = vtk.vtkRenderWindow()
 renWin.AddRenderer(ren)
-renWin.SetSize(1000, 1500)
-
-#Define the interactor
-iren = vtk.vtkRenderWindowInteractor()
-iren.SetInteractorStyle(MyInteractorStyle())
-iren.SetRenderWindow(renWin)
-
-#Define the VTI files data readers
-skin = vtk.vtkXMLImageDataReader()
-bones = vtk.vtkXMLImageDataReader()
-muscle1 = vtk.vtkXMLImageDataReader()
-muscle2 = vtk.vtkXMLImageDataReader()
-tendon1 = vtk.vtkXMLImageDataReader()
-tendon2 = vtk.vtkXMLImageDataReader()
-ligament1 = vtk.vtkXMLImageDataReader()
-ligament2 = vtk.vtkXMLImageDataReader()
-menis = vtk.vtkXMLImageDataReader()
-
-#Set per data reader the appropriate path to the file
-skin.SetFileName("Structures/"+skin_list[0])
-bones.SetFileName("Structures/"+bone_list[0])
-muscle1.SetFileName("Structures/"+muscle_list1[0])
-muscle2.SetFileName("Structures/"+muscle_list2[0])
-tendon1.SetFileName("Structures/"+tendon1_list[0])
-tendon2.SetFileName("Structures/"+tendon2_list[0])
-ligament1.SetFileName("Structures/"+ligament1_list[0])
-ligament2.SetFileName("Structures/"+ligament2_list[0])
-menis.SetFileName("Structures/"+menis_list[0])
+if args.export:
+  renWin.SetOffScreenRendering(1)
+  renWin.SetSize(args.export_size[0], args.export_size[1])
+elif args.serve is not None:
+  renWin.SetOffScreenRendering(1)
+  renWin.SetSize(args.serve_size[0], args.serve_size[1])
+else:
+  renWin.SetOffScreenRendering(1 if args.benchmark else 0)
+  renWin.SetSize(1000, 1500)
+
+#Define the interactor, the export and the server have none and the benchmark one without window system events
+if not args.export and args.serve is None:
+  iren = vtk.vtkGenericRenderWindowInteractor() if args.benchmark else vtk.vtkRenderWindowInteractor()
+  iren.SetInteractorStyle(MyInteractorStyle())
+  iren.SetRenderWindow(renWin)
+
+#Cache with the decoded VTI files of all time steps, so changing the time step does not read from disk again
+#The images are cropped to the box of their structure, the boxes are kept in a small index
+#The profiler times the readers and filters of the caches, the mappers and the renders
+profiler = PipelineProfiler() if args.profile or args.profile_overlay else None
+regionIndex = None if args.no_crop else RegionIndex(args.region_index)
+#The images come from the memory-mapped volume store when it was made with KneeStore.py
+volumeStore = None if args.no_store else openStore("Structures")
+volumeCache = TimestepCache("Structures", args.cache_mb*1024*1024, regionIndex, volumeStore, profiler)
+if args.preload:
+  volumeCache.preload(allStructureFiles())
+
+#Frames of the flexion: the time steps with --inbetween frames between every two of them, blended from the images of both.
+#The in-between images of two time steps are kept in memory up to the cap of the time step cache.
+framesPerTimestep = args.inbetween + 1
+frameCount = (len(skin_list) - 1) * framesPerTimestep + 1
+inbetweenCache = InbetweenCache(volumeCache, framesPerTimestep, args.cache_mb*1024*1024)
+
+#Define the inputs of the anatomic structures, they get their image of the current time step from the cache
+skin = vtk.vtkTrivialProducer()
+bones = vtk.vtkTrivialProducer()
+muscle1 = vtk.vtkTrivialProducer()
+muscle2 = vtk.vtkTrivialProducer()
+tendon1 = vtk.vtkTrivialProducer()
+tendon2 = vtk.vtkTrivialProducer()
+ligament1 = vtk.vtkTrivialProducer()
+ligament2 = vtk.vtkTrivialProducer()
+menis = vtk.vtkTrivialProducer()
+
+#Per input the list of files for the different time steps
+structureInputs = [(skin, skin_list), (bones, bone_list), (muscle1, muscle_list1), (muscle2, muscle_list2),
+                   (tendon1, tendon1_list), (tendon2, tendon2_list), (ligament1, ligament1_list),
+                   (ligament2, ligament2_list), (menis, menis_list)]
+
+#Extract all isosurfaces in parallel, in a separate process because the workers cannot start this script again
+if args.precompute:
+  subprocess.check_call([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "KneePrecompute.py"),
+                         "--directory", "Structures", "--mesh-cache", args.mesh_cache, "--workers", str(args.precompute),
+                         "--contour-engine", args.contour_engine])
+
+#Cache with the extracted isosurfaces, stored on disk so they are only extracted once per dataset
+meshCache = MeshCache(volumeCache, None if args.no_mesh_cache else args.mesh_cache, args.mesh_cache_mb*1024*1024, args.contour_engine, profiler)
+startup.mark("window and caches")
+
+#Define the surfaces of the anatomic structures for the isosurface render
+skinSurface = vtk.vtkTrivialProducer()
+boneSurface = vtk.vtkTrivialProducer()
+muscle1Surface = vtk.vtkTrivialProducer()
+muscle2Surface = vtk.vtkTrivialProducer()
+ligament1Surface = vtk.vtkTrivialProducer()
+ligament2Surface = vtk.vtkTrivialProducer()
+tendon1Surface = vtk.vtkTrivialProducer()
+tendon2Surface = vtk.vtkTrivialProducer()
+menisSurface = vtk.vtkTrivialProducer()
+
+#Per surface the list of files, the threshold value and the smoothing iterations
+surfaceInputs = [(skinSurface, structureSettings["skin"]), (boneSurface, structureSettings["bone"]),
+                 (muscle1Surface, structureSettings["muscle1"]), (muscle2Surface, structureSettings["muscle2"]),
+                 (ligament1Surface, structureSettings["ligament1"]), (ligament2Surface, structureSettings["ligament2"]),
+                 (tendon1Surface, structureSettings["tendon1"]), (tendon2Surface, structureSettings["tendon2"]),
+                 (menisSurface, structureSettings["menis"])]
+
+#Per surface the producers of its decimated levels of detail, from fine to coarse
+surfaceLevels = dict((surface, [vtk.vtkTrivialProducer() for fraction in lodFractions] if args.lod else [])
+                     for surface, settings in surfaceInputs)
+
 
 
 ### VOLUME RENDER ###
@@ -549,66 +822,270 @@ pieceMenis      = [0.1,0.9,1.0]
 volumeMenis     = createVolumeRender(menis,scalarMenis,colorMenis,opacMenis,pieceMenis)
 
 
+### Volume Rendering of all structures as one label map ###
+labelVolume = None
+labelImages = {}
+labelLock = threading.Lock()
+if args.volume_mode == "labelmap":
+  labelColors    = {"skin": skinColor, "bone": boneColor, "muscle1": muscleColor, "muscle2": muscleColor,
+                    "ligament1": ligamentColor, "ligament2": ligamentColor, "tendon1": tendonColor,
+                    "tendon2": tendonColor, "menis": meniscusColor}
+  labelOpacities = {"skin": opacSkin[1], "bone": opacBone[1], "muscle1": opacMuscle[1], "muscle2": opacMuscle[1],
+                    "ligament1": opacLigament[1], "ligament2": opacLigament[1], "tendon1": opacTendon[1],
+                    "tendon2": opacTendon[1], "menis": opacMenis[1]}
+  labelVolume    = LabelVolume(list(structureSettings), labelColors, labelOpacities)
+
+
+startup.mark("volume renders")
+
+
 ### ISOSURFACE RENDER ###
 
 # make the skin actor
-skinActor = createKneeSkin(skin, 10, 20)
+skinActor = createKneeSkin(skinSurface)
 skinActor.GetProperty().SetColor(colors.GetColor3d("SkinColor"))
 skinActor.GetProperty().SetOpacity(1)
 
 # make the bone actor:
-boneActor  = createKneeSkin(bones, 10, 10)
+boneActor  = createKneeSkin(boneSurface)
 boneActor.GetProperty().SetColor(colors.GetColor3d("white"))
 boneActor.GetProperty().SetOpacity(1)
 
 # make the muscle actor1:
-muscleActor1  = createKneeSkin(muscle1, 10, 15 )
+muscleActor1  = createKneeSkin(muscle1Surface)
 muscleActor1.GetProperty().SetColor(colors.GetColor3d("muscleColor"))
 muscleActor1.GetProperty().SetOpacity(1)
 
 # make the muscle actor2:
-muscleActor2  = createKneeSkin(muscle2, 10, 15 )
+muscleActor2  = createKneeSkin(muscle2Surface)
 muscleActor2.GetProperty().SetColor(colors.GetColor3d("muscleColor"))
 muscleActor2.GetProperty().SetOpacity(1)
 
 # make the ligament actors
-ligament1Actor = createKneeSkin(ligament1, 5, 5)
+ligament1Actor = createKneeSkin(ligament1Surface)
 ligament1Actor.GetProperty().SetColor(colors.GetColor3d("ligamentColor"))
 ligament1Actor.GetProperty().SetOpacity(1)
 
 # make the ligament actor:
-ligament2Actor  = createKneeSkin(ligament2, 5, 5)
+ligament2Actor  = createKneeSkin(ligament2Surface)
 ligament2Actor.GetProperty().SetColor(colors.GetColor3d("ligamentColor"))
 ligament2Actor.GetProperty().SetOpacity(1)
 
 # make the tendon actor:
-tendon1Actor  = createKneeSkin(tendon1, 10, 5)
+tendon1Actor  = createKneeSkin(tendon1Surface)
 tendon1Actor.GetProperty().SetColor(colors.GetColor3d("tendonColor"))
 tendon1Actor.GetProperty().SetOpacity(1)
 
 ### make the tendon actor2 with isosurface ###
-tendon2Actor = createKneeSkin(tendon2, 10, 5 )
+tendon2Actor = createKneeSkin(tendon2Surface)
 tendon2Actor.GetProperty().SetColor(colors.GetColor3d("tendonColor"))
 tendon2Actor.GetProperty().SetOpacity(1)
 
 # make the menis actor:
-menisActor  = createKneeSkin(menis, 10, 10)
+menisActor  = createKneeSkin(menisSurface)
 menisActor.GetProperty().SetColor(colors.GetColor3d("MeniscusColor"))
 menisActor.GetProperty().SetOpacity(1)
 
 
+#Per anatomic structure its isosurface actor and volume render
+structureProps = {"skin": (skinActor, volumeSkin), "bone": (boneActor, volumeBone), "muscle1": (muscleActor1, volumeMuscle1),
+                  "muscle2": (muscleActor2, volumeMuscle2), "ligament1": (ligament1Actor, volumeLigament1),
+                  "ligament2": (ligament2Actor, volumeLigament2), "tendon1": (tendon1Actor, volumeTendon1),
+                  "tendon2": (tendon2Actor, volumeTendon2), "menis": (menisActor, volumeMenis)}
+
+#Per anatomic structure the input of its volume render
+volumeInputs = {"skin": skin, "bone": bones, "muscle1": muscle1, "muscle2": muscle2, "ligament1": ligament1,
+                "ligament2": ligament2, "tendon1": tendon1, "tendon2": tendon2, "menis": menis}
+
+
+### Memory budget ###
+#The caches share the cap of --memory-mb, the report counts data that is cached and on screen in both stages
+memoryBudget = MemoryBudget(args.memory_mb*1024*1024 if args.memory_mb else None)
+memoryBudget.addCache(volumeCache, lambda: {"volume cache images": (len(volumeCache.images), volumeCache.bytes)})
+memoryBudget.addCache(inbetweenCache, lambda: {"in-between images": (sum(len(images) for images in inbetweenCache.pairs.values()),
+                                                                      inbetweenCache.bytes)})
+memoryBudget.addCache(meshCache, lambda: dict(("mesh cache " + kind, total) for kind, total in meshCache.kindBytes().items()))
+memoryBudget.addStage("label maps", lambda: list(labelImages.values()))
+memoryBudget.addStage("pipeline inputs on screen",
+                      lambda: [producer.GetOutputDataObject(0) for producer, fileList in structureInputs] +
+                              [surface.GetOutputDataObject(0) for surface, settings in surfaceInputs] +
+                              [level.GetOutputDataObject(0) for levels in surfaceLevels.values() for level in levels] +
+                              ([labelVolume.producer.GetOutputDataObject(0)] if labelVolume is not None else []))
+
+
+### Levels of detail ###
+#With --lod every isosurface actor renders the finest of its levels that fits in its share of the frame time
+if args.lod:
+  levelOfDetail = LevelOfDetail(renWin, ren)
+  for actor, surface in [(skinActor, skinSurface), (boneActor, boneSurface), (muscleActor1, muscle1Surface), (muscleActor2, muscle2Surface),
+                         (ligament1Actor, ligament1Surface), (ligament2Actor, ligament2Surface), (tendon1Actor, tendon1Surface),
+                         (tendon2Actor, tendon2Surface), (menisActor, menisSurface)]:
+    levelOfDetail.add(actor, surfaceLevels[surface])
+
+
+### Profiling of the mappers and renders ###
+#The volume mappers are watched when they are built
+profiledVolumes = []
+if profiler is not None:
+  for prop, name in [(skinActor, "skin"), (boneActor, "bone"), (muscleActor1, "muscle1"), (muscleActor2, "muscle2"),
+                     (ligament1Actor, "ligament1"), (ligament2Actor, "ligament2"), (tendon1Actor, "tendon1"),
+                     (tendon2Actor, "tendon2"), (menisActor, "menis")]:
+    profiler.watchMapper(prop.GetMapper(), name)
+  profiler.watchRender(renWin, ren if args.profile_overlay else None)
+
+
+### Contact analysis ###
+#With --contact the first structure of every contact pair is coloured by its distance to the second, the surfaces of the
+#drafts and the levels of detail are shown without colours
+contactAnalysis = None
+if args.contact:
+  contactAnalysis = ContactAnalysis()
+  distanceTable = distanceLookupTable()
+  for name in set(name for name, other in contactPairs):
+    colourByDistance(structureProps[name][0], distanceTable)
+
+
+### Metrics readout ###
+#With --metrics the metrics of the structures at the time step on screen are shown in the lower left corner.
+#The surface areas are only shown for isosurfaces that are in the mesh cache, they are not extracted for the readout.
+metricsActor = None
+if args.metrics:
+  metricsRows = computeMetrics("Structures", MetricsStore(metricsPath), meshCache, extract=False)
+  metricsActor = vtk.vtkTextActor()
+  metricsActor.GetTextProperty().SetFontFamilyToCourier()
+  metricsActor.GetTextProperty().SetFontSize(12)
+  metricsActor.GetTextProperty().SetColor(1, 1, 1)
+  metricsActor.GetPositionCoordinate().SetCoordinateSystemToNormalizedDisplay()
+  metricsActor.GetPositionCoordinate().SetValue(0.02, 0.27)
+  ren.AddViewProp(metricsActor)
+
+
+### Resident animation ###
+#A prop per structure and time step that shares the property of the structure, so the sliders change all time steps.
+#The templates are in the order they are added to the renderer.
+resident = None
+if args.resident:
+  buildVolumeMappers()
+  frames = [loadFrame(i, parts=allParts()) for i in range(len(skin_list))]
+  names = list(structureSettings)
+  surfaceTemplates = [(ligament1Actor, "ligament1"), (ligament2Actor, "ligament2"), (boneActor, "bone"), (muscleActor1, "muscle1"),
+                      (muscleActor2, "muscle2"), (tendon2Actor, "tendon2"), (tendon1Actor, "tendon1"), (menisActor, "menis"),
+                      (skinActor, "skin")]
+  surfaceData = [[frame[1][names.index(name)] for frame in frames] for actor, name in surfaceTemplates]
+  if labelVolume is not None:
+    volumeTemplates = [(labelVolume.volume, None)]
+    volumeData = [[frame[3] for frame in frames]]
+  else:
+    volumeTemplates = [(volumeBone, "bone"), (volumeLigament1, "ligament1"), (volumeLigament2, "ligament2"), (volumeMenis, "menis"),
+                       (volumeMuscle1, "muscle1"), (volumeMuscle2, "muscle2"), (volumeTendon1, "tendon1"), (volumeTendon2, "tendon2"),
+                       (volumeSkin, "skin")]
+    volumeData = [[volumeCache.getImage(fileName) for fileName in structureSettings[name][0]] for volume, name in volumeTemplates]
+
+  #Fall back to loading the time steps when they are shown if the props would not fit in the budget
+  #With --lod every surface prop also keeps its levels of detail, they are uploaded when they are first chosen
+  levelData = [[level for frame in frames for level in frame[2][names.index(name)]] for actor, name in surfaceTemplates]
+  estimate = residentBytes(surfaceData + levelData, volumeData)
+  if estimate > args.resident_mb*1024*1024:
+    print("Resident animation needs an estimated %.1f MB of GPU memory, more than the budget of %d MB: time steps are loaded when shown"
+          % (estimate/1024.0/1024.0, args.resident_mb))
+  else:
+    resident = ResidentFrames([actor for actor, name in surfaceTemplates], surfaceData,
+                              [volume for volume, name in volumeTemplates], volumeData)
+    print("Resident animation: %d props, estimated %.1f MB of GPU memory" % (resident.propCount, estimate/1024.0/1024.0))
+    #The levels of detail are chosen for the props of the time steps, the templates are not in the renderer
+    if args.lod:
+      for i, frame in enumerate(frames):
+        for prop, (actor, name) in zip(resident.surfaceFrames[i], surfaceTemplates):
+          levelOfDetail.addSurfaces(prop, frame[2][names.index(name)])
+
+#Time steps around the one on screen are loaded on worker threads while it is shown, not needed for the resident animation
+prefetcher = Prefetcher(loadFrame, frameCount, args.prefetch) if args.prefetch > 0 and resident is None else None
+refiner = None
+scheduler = None
+
+#The render style and the time step and parts of the structures on screen, the isosurfaces are shown first
+volumeStyle = False
+shownTimestep = None
+shownParts = None
+
+#Start at the first time step
+startup.mark("isosurface actors")
+setTimestep(0)
+startup.mark("first time step")
+
+
 ### ACTORS
 
-# Add the actors to the renderer
-ren.AddActor(ligament1Actor)
-ren.AddActor(ligament2Actor)
-ren.AddActor(boneActor)
-ren.AddActor(muscleActor1)
-ren.AddActor(muscleActor2)
-ren.AddActor(tendon2Actor)
-ren.AddActor(tendon1Actor)
-ren.AddActor(menisActor)
-ren.AddActor(skinActor)
+# Add the actors to the renderer, or the props of all time steps for the resident animation
+if resident is not None:
+  resident.addTo(ren)
+else:
+  ren.AddActor(ligament1Actor)
+  ren.AddActor(ligament2Actor)
+  ren.AddActor(boneActor)
+  ren.AddActor(muscleActor1)
+  ren.AddActor(muscleActor2)
+  ren.AddActor(tendon2Actor)
+  ren.AddActor(tendon1Actor)
+  ren.AddActor(menisActor)
+  ren.AddActor(skinActor)
+
+
+### Setup initial camera positon ###
+camera =  ren.GetActiveCamera()
+c = volumeCache.getCenter(skin_list[0])
+camera.SetFocalPoint(c[0], c[1], c[2])
+camera.SetPosition(315, 192, 1019)
+camera.SetViewUp(0.98, 0.094, -0.122)
+
+
+#The structures whose opacity the export and the server change, as the opacity sliders group them
+opacityGroups = {"skin": ([skinActor], [volumeSkin], scalarSkin, ["skin"]),
+                 "bone": ([boneActor], [volumeBone], scalarBone, ["bone"]),
+                 "muscle": ([muscleActor1, muscleActor2], [volumeMuscle1, volumeMuscle2], scalarMuscle, ["muscle1", "muscle2"]),
+                 "tendon": ([tendon1Actor, tendon2Actor], [volumeTendon1, volumeTendon2], scalarTendon, ["tendon1", "tendon2"]),
+                 "ligament": ([ligament1Actor, ligament2Actor], [volumeLigament1, volumeLigament2], scalarLigament, ["ligament1", "ligament2"]),
+                 "meniscus": ([menisActor], [volumeMenis], scalarMenis, ["menis"])}
+
+
+### EXPORT ###
+
+#Render the frames offscreen and stop, a worker of a split export only renders every n-th frame
+if args.export:
+  for group, percent in exportOpacities:
+    setStructureOpacity(*opacityGroups[group], value=percent)
+  setRenderStyle(args.export_style == "volume")
+
+  timesteps = frameTimesteps(args.export_frames, frameCount)
+  frames = list(range(args.export_frames))
+  if args.export_part:
+    part, parts = [int(n) for n in args.export_part.split("/")]
+    frames = frames[part::parts]
+  cameraPath = readCameraPath(args.camera_path) if args.camera_path else None
+  fps = exportFrames(renWin, ren, setTimestep, args.export, timesteps, frames, cameraPath, args.orbit)
+  print("Exported %d frames to %s at %.2f frames/s" % (len(frames), os.path.join(args.export, framePattern), fps))
+  if args.export_video and not args.export_part:
+    writeVideo(args.export, args.export_video, args.fps)
+  finish()
+  sys.exit(0)
+
+
+### SERVER ###
+
+#Serve the scene offscreen to local clients until interrupted, their commands change the flexion, render style, opacity and
+#camera and all clients share the caches and the renders of this process
+if args.serve is not None:
+  server = RenderServer(renWin, ren, setTimestep, setRenderStyle,
+                        lambda group, value: setStructureOpacity(*opacityGroups[group], value=value), frameCount, list(opacityGroups),
+                        args.serve_fps, args.jpeg_quality)
+  serve(server, args.serve)
+  server.printReport()
+  finish()
+  sys.exit(0)
+
+
+#Renders of the interactor and the sliders are merged into one render per frame
+scheduler = RenderScheduler(iren)
 
 
 ### SlIDERS ###
@@ -622,7 +1099,15 @@ sliderWidgetN1.SetInteractor(iren)
 sliderWidgetN1.SetRepresentation(StyleN1)
 sliderWidgetN1.SetAnimationModeToAnimate()
 sliderWidgetN1.EnabledOn()
-sliderWidgetN1.AddObserver(vtk.vtkCommand.InteractionEvent, SliderFlexion(skin, bones, muscle1, muscle2, ligament1, ligament2, tendon1, tendon2, menis))
+sliderFlexion = SliderFlexion()
+sliderWidgetN1.AddObserver(vtk.vtkCommand.InteractionEvent, sliderFlexion)
+sliderWidgetN1.AddObserver(vtk.vtkCommand.EndInteractionEvent, sliderFlexion.endInteraction)
+
+#Animation of the frames of the flexion on a timer of the interactor, the slider follows the frame that is shown
+def showFrame(i):
+  setTimestep(i)
+  StyleN1.SetValue(i / float(framesPerTimestep))
+player = AnimationPlayer(iren, frameCount, showFrame, args.fps, args.playback)
 
 ### Render Style Slider ###
 StyleDim = [0.008,0.008,0.015,0.015]
@@ -708,12 +1193,16 @@ sliderMeniscusWidget.EnabledOn()
 sliderMeniscusWidget.AddObserver(vtk.vtkCommand.InteractionEvent, MeniscusOpacity(scalarMenis))
 
 
-### Setup initial camera positon ###
-camera =  ren.GetActiveCamera()
-c = volumeSkin.GetCenter()
-camera.SetFocalPoint(c[0], c[1], c[2])
-camera.SetPosition(315, 192, 1019)
-camera.SetViewUp(0.98, 0.094, -0.122)
+
+### Draft quality while dragging ###
+#While a slider is dragged the volumes are rendered with fewer rays and the flexion shows draft surfaces,
+#the final quality is rendered on release and the final surfaces are swapped in when they are extracted
+refiner = Refiner(iren, loadFrame, showRefinedFrame)
+if not args.no_draft:
+  for widget in [sliderWidgetN1, SliderStyleWidget, sliderSkinWidget, sliderBoneWidget, sliderMuscleWidget,
+                 sliderTendonWidget, sliderLigamentWidget, sliderMeniscusWidget]:
+    widget.AddObserver(vtk.vtkCommand.StartInteractionEvent, startDraft)
+    widget.AddObserver(vtk.vtkCommand.EndInteractionEvent, endDraft)
 
 
 ### Text widget ###
@@ -737,7 +1226,25 @@ text_widget.SelectableOff()
 text_widget.On()
 
 ### Render and start ###
+startup.mark("widgets")
 renWin.Render()
+startup.mark("first render")
+if args.profile_startup is not None:
+  startup.printReport(args.profile_startup)
+
+#The benchmark drives the sliders and the camera by itself and stops
+if args.benchmark:
+  benchmark = InteractionBenchmark(renWin, ren)
+  opacityWidgets = [("skin", sliderSkinWidget), ("bone", sliderBoneWidget), ("muscle", sliderMuscleWidget), ("tendon", sliderTendonWidget),
+                    ("ligament", sliderLigamentWidget), ("meniscus", sliderMeniscusWidget)]
+  benchmark.run(sliderWidgetN1, SliderStyleWidget,
+                [(name, widget, lambda value, group=opacityGroups[name]: setStructureOpacity(*group, value=value))
+                 for name, widget in opacityWidgets], len(skin_list), refiner.flush)
+  benchmark.printReport()
+  benchmark.writeReport(args.benchmark)
+  finish()
+  sys.exit(0)
+
 iren.Initialize()
 iren.Start()
 
@@ -749,6 +1256,7 @@ mapper = None
 actor = None
 ren1 = None
 renWin = None
+finish()
 
 
 
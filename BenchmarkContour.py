@@ -0,0 +1,121 @@
+import KneeVTK as vtk
+import os
+import time
+import argparse
+from TimestepCache import readImage
+from KneeSurface import contourEngines, createContour, extractSurface, thresholdRange
+from KneeSurface import gaussianRadius, gaussianStandardDeviation
+from KneeStructures import structureSettings
+
+#Tolerances of the comparison with the reference engine: relative difference of the triangle count
+#and the surface area, and the difference of the bounds in voxels
+triangleTolerance = 0.01
+areaTolerance = 0.01
+boundsTolerance = 0.5
+
+# Function to create the input images of the contour stage: the thresholded labels and the gaussian of them
+def contourInputs(image):
+  selectTissue = vtk.vtkImageThreshold()
+  selectTissue.ThresholdBetween(thresholdRange[0], thresholdRange[1])
+  selectTissue.SetInValue(255)
+  selectTissue.SetOutValue(0)
+  selectTissue.SetInputData(image)
+  gaussian = vtk.vtkImageGaussianSmooth()
+  gaussian.SetStandardDeviations(gaussianStandardDeviation, gaussianStandardDeviation, gaussianStandardDeviation)
+  gaussian.SetRadiusFactors(gaussianRadius, gaussianRadius, gaussianRadius)
+  gaussian.SetInputConnection(selectTissue.GetOutputPort())
+  gaussian.Update()
+  return selectTissue.GetOutput(), gaussian.GetOutput()
+
+# Function to measure a mesh: non degenerate triangles, surface area and bounds
+def measureMesh(mesh):
+  #Degenerate triangles (flying edges makes some) become lines in the clean filter and are not counted
+  clean = vtk.vtkCleanPolyData()
+  clean.SetInputData(mesh)
+  clean.Update()
+  polys = vtk.vtkPolyData()
+  polys.SetPoints(clean.GetOutput().GetPoints())
+  polys.SetPolys(clean.GetOutput().GetPolys())
+  triangles = vtk.vtkTriangleFilter()
+  triangles.SetInputData(polys)
+  triangles.Update()
+  mass = vtk.vtkMassProperties()
+  mass.SetInputConnection(triangles.GetOutputPort())
+  mass.Update()
+  return triangles.GetOutput().GetNumberOfPolys(), mass.GetSurfaceArea(), mesh.GetBounds()
+
+# Function to time a filter, the best of a number of runs
+def timeFilter(filter, repeats):
+  best = None
+  for i in range(repeats):
+    filter.Modified()
+    start = time.perf_counter()
+    filter.Update()
+    seconds = time.perf_counter() - start
+    best = seconds if best is None else min(best, seconds)
+  return best
+
+# Function to compare a mesh measurement with the reference, returns the differences and if they are within the tolerances
+def compareMeshes(measured, reference, spacing):
+  triangles, area, bounds = measured
+  refTriangles, refArea, refBounds = reference
+  triangleDiff = abs(triangles - refTriangles) / float(max(refTriangles, 1))
+  areaDiff = abs(area - refArea) / max(refArea, 1e-9)
+  boundsDiff = max(abs(bounds[i] - refBounds[i]) / spacing[i // 2] for i in range(6)) if triangles and refTriangles else 0.0
+  equal = triangleDiff <= triangleTolerance and areaDiff <= areaTolerance and boundsDiff <= boundsTolerance
+  return triangleDiff, areaDiff, boundsDiff, equal
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Compare the contour engines on the structure files: equal meshes and timings")
+  parser.add_argument("--directory", default="Structures", help="directory with the structure files (default Structures)")
+  parser.add_argument("--engines", nargs="+", choices=contourEngines, default=contourEngines, help="engines to compare")
+  parser.add_argument("--timesteps", type=int, nargs="+", default=list(range(7)), help="time steps to use (default all)")
+  parser.add_argument("--repeats", type=int, default=3, help="runs per measurement, the best is reported (default 3)")
+  args = parser.parse_args()
+
+  reference = "marchingcubes"
+  contourTime = dict((engine, 0.0) for engine in args.engines)
+  totalTime = dict((engine, 0.0) for engine in args.engines)
+  failures = 0
+
+  print("%-16s %-14s %9s %8s %8s %7s %s" % ("file", "engine", "triangles", "d tri", "d area", "d box", "contour/total s"))
+  for name, (fileList, value, smooth) in structureSettings.items():
+    for timestep in args.timesteps:
+      fileName = fileList[timestep]
+      image = readImage(os.path.join(args.directory, fileName))
+      labels, gaussian = contourInputs(image)
+
+      #Contour stage alone on the same input, and the whole surface pipeline
+      results = {}
+      for engine in [reference] + [engine for engine in args.engines if engine != reference]:
+        contour = createContour(engine, value)
+        contour.SetInputData(labels if engine == "discrete" else gaussian)
+        seconds = timeFilter(contour, args.repeats)
+        start = time.perf_counter()
+        extractSurface(image, value, smooth, engine)
+        total = time.perf_counter() - start
+        results[engine] = (measureMesh(contour.GetOutput()), seconds, total)
+        if engine in contourTime:
+          contourTime[engine] += seconds
+          totalTime[engine] += total
+
+      for engine in args.engines:
+        measured, seconds, total = results[engine]
+        triangleDiff, areaDiff, boundsDiff, equal = compareMeshes(measured, results[reference][0], image.GetSpacing())
+        #The discrete engine contours the labels without the gaussian, its mesh is expected to differ
+        if engine == "discrete":
+          status = "(label surface)"
+        elif equal:
+          status = "ok"
+        else:
+          status = "DIFFERENT"
+          failures += 1
+        print("%-16s %-14s %9d %7.2f%% %7.2f%% %7.2f %.3f/%.3f %s" % (fileName, engine, measured[0], 100 * triangleDiff,
+                                                                     100 * areaDiff, boundsDiff, seconds, total, status))
+
+  print("")
+  print("%-14s %12s %12s %9s" % ("engine", "contour s", "total s", "speedup"))
+  for engine in args.engines:
+    speedup = contourTime[reference] / contourTime[engine] if reference in contourTime and contourTime[engine] else 0.0
+    print("%-14s %12.3f %12.3f %8.1fx" % (engine, contourTime[engine], totalTime[engine], speedup))
+  print("%d meshes outside the tolerances of the reference" % failures)
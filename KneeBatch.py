@@ -0,0 +1,206 @@
+import KneeVTK as vtk
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from TimestepCache import TimestepCache
+from MeshCache import MeshCache
+from KneeMetrics import computeMetrics, writeTable, MetricsStore
+from KneeBenchmark import peakMemory
+from KneeSurface import contourEngines
+from KneeStructures import structureSettings, allStructureFiles
+
+#Stages of the processing of a dataset, in order
+batchStages = ["read", "surfaces", "metrics", "thumbnails"]
+
+#Colours of the isosurfaces in the thumbnails, as in the application
+thumbnailColors = {"skin": [177, 122, 101], "bone": [255, 255, 255], "muscle1": [192, 104, 88], "muscle2": [192, 104, 88],
+                   "ligament1": [153, 255, 204], "ligament2": [153, 255, 204], "tendon1": [153, 153, 255],
+                   "tendon2": [153, 153, 255], "menis": [255, 255, 153]}
+
+#Size of the thumbnails in pixels, with the aspect of the application window
+thumbnailSize = [200, 300]
+
+# Function to get the modification time and size of the structure files of a dataset, the manifest of a dataset
+# is only valid for the files it was made from
+def datasetStamps(directory):
+  stamps = {}
+  for fileName in allStructureFiles():
+    stat = os.stat(os.path.join(directory, fileName))
+    stamps[fileName] = [stat.st_mtime, stat.st_size]
+  return stamps
+
+# Function to get the name of the result directory of a dataset, the name of its directory
+def datasetName(directory):
+  return os.path.basename(os.path.normpath(directory))
+
+# Function to read the manifest of a dataset, None when it has not been processed
+def readManifest(path):
+  if not os.path.isfile(path):
+    return None
+  with open(path) as f:
+    return json.load(f)
+
+# Function to render a thumbnail of the isosurfaces of a time step offscreen and write it as PNG
+def writeThumbnail(surfaces, path):
+  renderer = vtk.vtkRenderer()
+  renderer.SetBackground(0.2, 0.2, 0.2)
+  for name, surface in surfaces.items():
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(surface)
+    mapper.ScalarVisibilityOff()
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetColor([c / 255.0 for c in thumbnailColors[name]])
+    renderer.AddActor(actor)
+  renderWindow = vtk.vtkRenderWindow()
+  renderWindow.SetOffScreenRendering(1)
+  renderWindow.AddRenderer(renderer)
+  renderWindow.SetSize(thumbnailSize)
+  renderer.ResetCamera()
+  renderWindow.Render()
+  grabber = vtk.vtkWindowToImageFilter()
+  grabber.SetInput(renderWindow)
+  grabber.SetInputBufferTypeToRGB()
+  grabber.ReadFrontBufferOff()
+  writer = vtk.vtkPNGWriter()
+  writer.SetInputConnection(grabber.GetOutputPort())
+  writer.SetFileName(path)
+  writer.Write()
+  renderWindow.Finalize()
+
+# Function run by a worker process for one dataset: read its volumes, extract its isosurfaces with the parameters of the
+# application, compute its metrics and render its thumbnails. The caches of the worker are capped at memoryBytes, the volumes
+# and surfaces it does not hold are read again from disk. The isosurfaces are kept in the mesh cache of the dataset result,
+# so a dataset that was interrupted continues where it stopped. Returns the manifest of the dataset, it is also written.
+def processDataset(directory, output, thumbnails, memoryBytes, engine):
+  result = os.path.join(output, datasetName(directory))
+  os.makedirs(result, exist_ok=True)
+  manifest = {"dataset": os.path.abspath(directory), "status": "failed", "stamps": datasetStamps(directory), "seconds": {},
+              "files": {}}
+  begin = time.perf_counter()
+  try:
+    volumeCache = TimestepCache(directory, memoryBytes // 2)
+    meshCache = MeshCache(volumeCache, os.path.join(result, "meshes"), memoryBytes // 2, engine)
+    jobs = [(name, timestep, fileName, value, smooth) for name, (fileList, value, smooth) in structureSettings.items()
+            for timestep, fileName in enumerate(fileList)]
+    pending = [job for job in jobs if not meshCache.isStored(job[2], job[3], job[4])]
+
+    #The volumes are read for the surfaces that are not stored, the read stage is timed apart from the extraction
+    start = time.perf_counter()
+    for name, timestep, fileName, value, smooth in pending:
+      volumeCache.getImage(fileName)
+    manifest["seconds"]["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name, timestep, fileName, value, smooth in jobs:
+      meshCache.getSurface(fileName, value, smooth)
+    manifest["seconds"]["surfaces"] = time.perf_counter() - start
+    manifest["files"]["meshes"] = os.path.join(result, "meshes")
+
+    start = time.perf_counter()
+    rows = computeMetrics(directory, MetricsStore(os.path.join(result, "metrics.json")), meshCache)
+    writeTable(rows, os.path.join(result, "metrics.csv"))
+    manifest["seconds"]["metrics"] = time.perf_counter() - start
+    manifest["files"]["metrics"] = os.path.join(result, "metrics.csv")
+
+    if thumbnails:
+      start = time.perf_counter()
+      manifest["files"]["thumbnails"] = []
+      timestepCount = len(jobs) // len(structureSettings)
+      for timestep in range(timestepCount):
+        surfaces = dict((name, meshCache.getSurface(fileName, value, smooth)) for name, step, fileName, value, smooth in jobs
+                        if step == timestep)
+        path = os.path.join(result, "thumbnail_%d.png" % (timestep + 1))
+        writeThumbnail(surfaces, path)
+        manifest["files"]["thumbnails"].append(path)
+      manifest["seconds"]["thumbnails"] = time.perf_counter() - start
+
+    manifest["status"] = "done"
+    manifest["extracted"] = len(pending)
+  except Exception as error:
+    manifest["error"] = "%s: %s" % (type(error).__name__, error)
+  manifest["seconds"]["total"] = time.perf_counter() - begin
+  manifest["peakMemoryMB"] = peakMemory() / 1024.0 / 1024.0
+  with open(os.path.join(result, "manifest.json.tmp"), "w") as f:
+    json.dump(manifest, f, indent=1)
+  os.replace(os.path.join(result, "manifest.json.tmp"), os.path.join(result, "manifest.json"))
+  return manifest
+
+# Function to check if a dataset is done: its manifest says so, it has the thumbnails when they are asked for
+# and its structure files have not changed since
+def isDone(directory, output, thumbnails):
+  manifest = readManifest(os.path.join(output, datasetName(directory), "manifest.json"))
+  if manifest is None or manifest["status"] != "done" or (thumbnails and "thumbnails" not in manifest["files"]):
+    return False
+  try:
+    return manifest["stamps"] == datasetStamps(directory)
+  except OSError:
+    return False
+
+# Function to process datasets on a pool of worker processes, a worker process handles one dataset and is then replaced,
+# so the memory of a dataset is returned when it is done. Datasets that are done are skipped, unless forced.
+# Returns the aggregate report, it is also written to the output directory.
+def processDatasets(directories, output, workers, thumbnails=False, memoryBytes=512*1024*1024, engine="marchingcubes",
+                    force=False, log=sys.stdout):
+  os.makedirs(output, exist_ok=True)
+  pending = [directory for directory in directories if force or not isDone(directory, output, thumbnails)]
+  log.write("%d of %d datasets to process on %d workers\n" % (len(pending), len(directories), workers))
+
+  begin = time.perf_counter()
+  manifests = []
+  if pending:
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+      futures = dict((pool.submit(processDataset, directory, output, thumbnails, memoryBytes, engine), directory)
+                     for directory in pending)
+      for future in as_completed(futures):
+        manifest = future.result()
+        manifests.append(manifest)
+        log.write("  %-30s %-6s %7.2f s %7.1f MB%s\n" % (datasetName(futures[future]), manifest["status"], manifest["seconds"]["total"],
+                                                       manifest["peakMemoryMB"], "  " + manifest["error"] if "error" in manifest else ""))
+  wall = time.perf_counter() - begin
+
+  done = [manifest for manifest in manifests if manifest["status"] == "done"]
+  report = {"datasets": len(directories), "processed": len(manifests), "skipped": len(directories) - len(pending),
+            "failed": [manifest["dataset"] for manifest in manifests if manifest["status"] != "done"],
+            "workers": workers, "wallSeconds": wall, "datasetsPerMinute": 60.0 * len(done) / wall if done else 0.0,
+            "stageSeconds": dict((stage, sum(manifest["seconds"].get(stage, 0.0) for manifest in done)) for stage in batchStages),
+            "meanSecondsPerDataset": sum(manifest["seconds"]["total"] for manifest in done) / len(done) if done else 0.0,
+            "peakMemoryMB": max([manifest["peakMemoryMB"] for manifest in manifests] or [0.0])}
+  with open(os.path.join(output, "batch_report.json"), "w") as f:
+    json.dump(report, f, indent=1)
+  return report
+
+# Function to print the aggregate report
+def printReport(report):
+  print("Processed %d datasets (%d skipped, %d failed) in %.1f s with %d workers: %.2f datasets/min" %
+        (report["processed"], report["skipped"], len(report["failed"]), report["wallSeconds"], report["workers"],
+         report["datasetsPerMinute"]))
+  for stage in batchStages:
+    print("  %-12s %9.2f s" % (stage, report["stageSeconds"][stage]))
+  print("Mean %.2f s per dataset, worker peak memory %.1f MB" % (report["meanSecondsPerDataset"], report["peakMemoryMB"]))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Extract the isosurfaces, compute the metrics and render thumbnails of many datasets "
+                                   "with the layout of Structures, on a pool of worker processes")
+  parser.add_argument("datasets", nargs="+", help="directories with the structure files of a dataset")
+  parser.add_argument("--output", default="batch", help="directory of the results, a directory per dataset (default batch)")
+  parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: number of cores)")
+  parser.add_argument("--memory-mb", type=int, default=512, help="memory cap of the caches of a worker in MB (default 512)")
+  parser.add_argument("--thumbnails", action="store_true", help="render a thumbnail of the isosurfaces of every time step")
+  parser.add_argument("--contour-engine", choices=contourEngines, default="marchingcubes", help="contour algorithm of the isosurfaces (default marchingcubes)")
+  parser.add_argument("--force", action="store_true", help="process the datasets that are done again")
+  args = parser.parse_args()
+
+  names = [datasetName(directory) for directory in args.datasets]
+  if len(set(names)) != len(names):
+    parser.error("The dataset directories need different names, their results are stored by name")
+  missing = [directory for directory in args.datasets
+             if not all(os.path.isfile(os.path.join(directory, fileName)) for fileName in allStructureFiles())]
+  if missing:
+    parser.error("Not all structure files are in: " + ", ".join(missing))
+
+  printReport(processDatasets(args.datasets, args.output, args.workers, args.thumbnails, args.memory_mb*1024*1024,
+                              args.contour_engine, args.force))
@@ -0,0 +1,124 @@
+import KneeVTK as vtk
+import sys
+import json
+import time
+import numpy
+import resource
+
+# Function to get the peak resident memory of the process in bytes, ru_maxrss is in kilobytes on Linux and bytes on macOS
+def peakMemory():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if sys.platform == "darwin" else peak * 1024
+
+# Function to get the statistics of frame times in milliseconds
+def frameStatistics(seconds):
+  milliseconds = 1000 * numpy.array(seconds)
+  if milliseconds.size == 0:
+    return {"frames": 0}
+  return {"frames": int(milliseconds.size), "mean": float(milliseconds.mean()), "p50": float(numpy.percentile(milliseconds, 50)),
+          "p95": float(numpy.percentile(milliseconds, 95)), "p99": float(numpy.percentile(milliseconds, 99)),
+          "max": float(milliseconds.max())}
+
+# Class for the benchmark of the interaction: it moves the sliders as a user would, so their callbacks run,
+# and measures the latency of every frame from the slider change until the render is done.
+class InteractionBenchmark():
+    def __init__(self, renderWindow, renderer):
+        self.renderWindow = renderWindow
+        self.renderer = renderer
+        self.frames = []
+
+    #Measure an action and the render after it, as a frame of a phase of the script
+    def measure(self, phase, action):
+      start = time.perf_counter()
+      action()
+      self.renderWindow.Render()
+      self.frames.append({"phase": phase, "seconds": time.perf_counter() - start})
+
+    #Move a slider to a value and invoke its interaction event, as the slider widget does when it is dragged
+    def slide(self, phase, widget, value):
+      def action():
+        widget.GetRepresentation().SetValue(value)
+        widget.InvokeEvent(vtk.vtkCommand.InteractionEvent)
+      self.measure(phase, action)
+
+    #Press and release a slider, as the slider widget does at the start and end of a drag.
+    #The release is measured as a frame, the final quality is rendered then. The benchmark has no timer events,
+    #so the final surfaces of a draft are loaded and swapped in by the settle function within the frame.
+    def press(self, widget):
+      widget.InvokeEvent(vtk.vtkCommand.StartInteractionEvent)
+
+    def release(self, phase, widget, settle=None):
+      def action():
+        widget.InvokeEvent(vtk.vtkCommand.EndInteractionEvent)
+        if settle is not None:
+          settle()
+      self.measure(phase + " release", action)
+
+    #Move an opacity slider back to full opacity. The slider callbacks ignore 100, so the opacity is set by the function
+    #of the application, and the scene is the default scene again for the next phase.
+    def restore(self, phase, widget, value, setOpacity):
+      def action():
+        widget.GetRepresentation().SetValue(value)
+        setOpacity(value)
+      self.measure(phase, action)
+
+    #Turn the camera around the focal point, as the trackball style does
+    def orbit(self, phase, degrees):
+      def action():
+        self.renderer.GetActiveCamera().Azimuth(degrees)
+        self.renderer.ResetCameraClippingRange()
+      self.measure(phase, action)
+
+    #Play the script: scrub the flexion forth and back, switch the render style,
+    #sweep every opacity slider down and up again and orbit the camera once around the knee.
+    #Every slider is moved in one drag. The opacity widgets come with a function that sets their opacity, the settle function
+    #shows the final surfaces after the release of the flexion.
+    def run(self, flexionWidget, styleWidget, opacityWidgets, timestepCount, settle=None, orbitSteps=12):
+      self.press(flexionWidget)
+      for value in list(range(1, timestepCount)) + list(range(timestepCount - 2, -1, -1)):
+        self.slide("flexion", flexionWidget, value)
+      self.release("flexion", flexionWidget, settle)
+
+      self.press(styleWidget)
+      self.slide("style", styleWidget, 1 - round(styleWidget.GetRepresentation().GetValue()))
+      self.release("style", styleWidget)
+
+      for name, widget, setOpacity in opacityWidgets:
+        phase = "opacity " + name
+        original = widget.GetRepresentation().GetValue()
+        self.press(widget)
+        for value in [50, 0, 50]:
+          self.slide(phase, widget, value)
+        self.restore(phase, widget, original, setOpacity)
+        self.release(phase, widget)
+      for step in range(orbitSteps):
+        self.orbit("orbit", 360.0 / orbitSteps)
+
+    #Statistics of all frames and per phase, with the peak memory
+    def report(self):
+      phases = []
+      for frame in self.frames:
+        if frame["phase"] not in phases:
+          phases.append(frame["phase"])
+      return {"all": frameStatistics([frame["seconds"] for frame in self.frames]),
+              "phases": dict((phase, frameStatistics([frame["seconds"] for frame in self.frames if frame["phase"] == phase]))
+                             for phase in phases),
+              "peakMemoryMB": peakMemory() / 1024.0 / 1024.0,
+              "frames": self.frames}
+
+    #Print the statistics per phase in milliseconds
+    def printReport(self):
+      report = self.report()
+      rows = list(report["phases"].items()) + [("all", report["all"])]
+      #The phase column is as wide as the longest phase name
+      width = max(len(name) for name in ["phase"] + [phase for phase, statistics in rows])
+      print("%-*s %6s %9s %9s %9s %9s %9s" % (width, "phase", "frames", "mean", "p50", "p95", "p99", "max"))
+      for phase, statistics in rows:
+        print("%-*s %6d %9.1f %9.1f %9.1f %9.1f %9.1f" % (width, phase, statistics["frames"], statistics["mean"], statistics["p50"],
+                                                         statistics["p95"], statistics["p99"], statistics["max"]))
+      print("Peak memory %.1f MB" % report["peakMemoryMB"])
+
+    #Write the report as JSON
+    def writeReport(self, path):
+      with open(path, "w") as f:
+        json.dump(self.report(), f, indent=1)
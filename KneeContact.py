@@ -0,0 +1,206 @@
+import KneeVTK as vtk
+import csv
+import time
+import argparse
+import numpy
+import threading
+from collections import OrderedDict
+from vtkmodules.util import numpy_support
+from TimestepCache import TimestepCache
+from MeshCache import MeshCache
+from KneeSurface import contourEngines
+from KneeStructures import structureSettings
+
+#Pairs of structures of the contact analysis, the first structure is coloured by its distance to the second
+contactPairs = [("ligament1", "bone"), ("ligament2", "bone"), ("tendon1", "menis"), ("tendon2", "menis"), ("menis", "bone")]
+
+#Distance in mm below which two surfaces are in contact, and the range of the distances that are computed and coloured.
+#Points further away than the range get the range as distance.
+contactDistance = 1.0
+distanceRange = 10.0
+
+#Name of the point array with the distances on a coloured surface
+distanceArray = "Distance"
+
+#Columns of the report of the command line, a row per pair and time step
+contactFields = ["structure", "other", "timestep", "minimum", "contactArea", "contactPoints", "buildMs", "queryMs"]
+
+# Function to get the points of a surface that may be within a radius of the points of another surface.
+# The points of the other surface mark the cells of a grid with the radius as cell size, a point further than the radius
+# from all of them has no marked cell among the 27 cells around its own.
+def nearPoints(points, otherPoints, radius):
+  if len(points) == 0 or len(otherPoints) == 0:
+    return numpy.zeros(len(points), dtype=bool)
+  low = numpy.minimum(points.min(axis=0), otherPoints.min(axis=0)) - radius
+  shape = ((numpy.maximum(points.max(axis=0), otherPoints.max(axis=0)) - low) // radius).astype(int) + 3
+  marked = numpy.zeros(shape, dtype=bool)
+  cells = ((otherPoints - low) // radius).astype(int) + 1
+  for dx in (-1, 0, 1):
+    for dy in (-1, 0, 1):
+      for dz in (-1, 0, 1):
+        marked[cells[:, 0] + dx, cells[:, 1] + dy, cells[:, 2] + dz] = True
+  cells = ((points - low) // radius).astype(int) + 1
+  return marked[cells[:, 0], cells[:, 1], cells[:, 2]]
+
+# Function to get the triangles of a surface as point indices and their areas, the strips are split into triangles first
+def surfaceTriangles(surface):
+  triangles = vtk.vtkTriangleFilter()
+  triangles.SetInputData(surface)
+  triangles.Update()
+  indices = numpy_support.vtk_to_numpy(triangles.GetOutput().GetPolys().GetConnectivityArray()).reshape(-1, 3)
+  points = numpy_support.vtk_to_numpy(triangles.GetOutput().GetPoints().GetData())
+  corners = points[indices]
+  areas = 0.5 * numpy.linalg.norm(numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+  return indices, areas
+
+# Function to create the lookup table of the distance colours: red at contact, through yellow and green to blue at the range
+def distanceLookupTable():
+  table = vtk.vtkLookupTable()
+  table.SetHueRange(0.0, 0.66)
+  table.SetTableRange(0.0, distanceRange)
+  table.Build()
+  return table
+
+# Function to colour the isosurface actor of a structure by the distance array of its surface. A surface without the array,
+# for example when the other structure of its pair is hidden, is shown in the colour of the actor.
+def colourByDistance(actor, table):
+  mapper = actor.GetMapper()
+  mapper.SetLookupTable(table)
+  mapper.UseLookupTableScalarRangeOn()
+  mapper.SetScalarModeToUsePointFieldData()
+  mapper.SelectColorArray(distanceArray)
+  mapper.ScalarVisibilityOn()
+
+# Class for the contact analysis of pairs of surfaces. Every surface gets a cell locator, in an implicit distance function,
+# that is built once per frame and kept, so the distances of a frame are computed once and an animation only looks them up.
+# A surface is known by the frame and structure it is shown for, an entry is rebuilt when the surface of the frame changes,
+# for example when a draft is refined. The times to build the locators and to query them are recorded.
+# The analysis can be used from worker threads, one thread at a time computes distances.
+class ContactAnalysis():
+    def __init__(self, maxEntries=64):
+        self.maxEntries = maxEntries
+        self.locators = OrderedDict()
+        self.results = OrderedDict()
+        self.buildTimes = []
+        self.queryTimes = []
+        self.lock = threading.RLock()
+
+    #Return the distance function of the surface of a structure at a frame, its locator is built on first use
+    def locator(self, name, frame, surface):
+      key = (name, frame)
+      entry = self.locators.get(key)
+      if entry is not None and entry[0] is surface:
+        self.locators.move_to_end(key)
+        return entry[1]
+      start = time.perf_counter()
+      distance = vtk.vtkImplicitPolyDataDistance()
+      distance.SetInput(surface)
+      distance.SetNoValue(distanceRange)
+      self.buildTimes.append(time.perf_counter() - start)
+      self.locators[key] = (surface, distance)
+      while len(self.locators) > self.maxEntries:
+        self.locators.popitem(last=False)
+      return distance
+
+    #Return the contact of the surface of a structure with the surface of another at a frame: the signed distance of every point,
+    #negative inside the other surface and cut off at the range, the minimum, and the area and points in contact
+    def contact(self, name, other, frame, surface, otherSurface):
+      with self.lock:
+        return self.compute(name, other, frame, surface, otherSurface)
+
+    #Compute the contact of two surfaces, or look it up when it was computed for the same surfaces
+    def compute(self, name, other, frame, surface, otherSurface):
+      key = (name, other, frame)
+      entry = self.results.get(key)
+      if entry is not None and entry[0] is surface and entry[1] is otherSurface:
+        self.results.move_to_end(key)
+        return entry[2]
+
+      distance = self.locator(other, frame, otherSurface)
+      start = time.perf_counter()
+      points = numpy_support.vtk_to_numpy(surface.GetPoints().GetData()) if surface.GetNumberOfPoints() else numpy.zeros((0, 3))
+      otherPoints = numpy_support.vtk_to_numpy(otherSurface.GetPoints().GetData()) if otherSurface.GetNumberOfPoints() else numpy.zeros((0, 3))
+      distances = numpy.full(len(points), distanceRange)
+      near = nearPoints(points, otherPoints, distanceRange)
+      if near.any():
+        values = vtk.vtkDoubleArray()
+        distance.FunctionValue(numpy_support.numpy_to_vtk(numpy.ascontiguousarray(points[near]), deep=1), values)
+        distances[near] = numpy.clip(numpy_support.vtk_to_numpy(values), -distanceRange, distanceRange)
+      self.queryTimes.append(time.perf_counter() - start)
+
+      triangles, areas = surfaceTriangles(surface)
+      touching = distances < contactDistance
+      result = {"distances": distances, "minimum": float(distances.min()) if len(distances) else distanceRange,
+                "contactArea": float(areas[touching[triangles].all(axis=1)].sum()) if len(triangles) else 0.0,
+                "contactPoints": int(touching.sum())}
+      self.results[key] = (surface, otherSurface, result)
+      while len(self.results) > self.maxEntries:
+        self.results.popitem(last=False)
+      return result
+
+    #Return a copy of the surface of a structure with its distances to another as point array, for the colours of its actor.
+    #The copy shares the points, cells and arrays but has its own point data, so the surface in the mesh cache is not changed.
+    def colouredSurface(self, name, other, frame, surface, otherSurface):
+      result = self.contact(name, other, frame, surface, otherSurface)
+      coloured = vtk.vtkPolyData()
+      coloured.ShallowCopy(surface)
+      distances = numpy_support.numpy_to_vtk(result["distances"], deep=1)
+      distances.SetName(distanceArray)
+      coloured.GetPointData().AddArray(distances)
+      return coloured
+
+    #Number, mean and total time in ms of the locator builds and the queries
+    def report(self):
+      timings = {}
+      for stage, seconds in [("build", self.buildTimes), ("query", self.queryTimes)]:
+        timings[stage] = {"runs": len(seconds), "meanMs": 1000 * sum(seconds) / max(len(seconds), 1), "totalMs": 1000 * sum(seconds)}
+      return timings
+
+    #Print the times of the locator builds and the queries
+    def printReport(self):
+      for stage, timing in self.report().items():
+        print("Contact %-6s %5d runs %8.2f ms mean %9.1f ms total" % (stage, timing["runs"], timing["meanMs"], timing["totalMs"]))
+
+# Function to analyse the contact of pairs of structures at all time steps with the isosurfaces of the mesh cache,
+# returns a row per pair and time step
+def analyseContacts(meshCache, pairs, analysis):
+  rows = []
+  timestepCount = len(structureSettings[pairs[0][0]][0])
+  for timestep in range(timestepCount):
+    surfaces = {}
+    for name in set(name for pair in pairs for name in pair):
+      fileList, value, smooth = structureSettings[name]
+      surfaces[name] = meshCache.getSurface(fileList[timestep], value, smooth)
+    for name, other in pairs:
+      builds, queries = len(analysis.buildTimes), len(analysis.queryTimes)
+      result = analysis.contact(name, other, timestep, surfaces[name], surfaces[other])
+      rows.append({"structure": name, "other": other, "timestep": timestep + 1, "minimum": result["minimum"],
+                   "contactArea": result["contactArea"], "contactPoints": result["contactPoints"],
+                   "buildMs": 1000 * sum(analysis.buildTimes[builds:]), "queryMs": 1000 * sum(analysis.queryTimes[queries:])})
+  return rows
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Minimum distance and contact area between structures at every time step")
+  parser.add_argument("--directory", default="Structures", help="directory with the structure files (default Structures)")
+  parser.add_argument("--mesh-cache", default=".knee_cache/meshes", help="directory of the stored isosurfaces (default .knee_cache/meshes)")
+  parser.add_argument("--contour-engine", choices=contourEngines, default="marchingcubes", help="contour algorithm of the isosurfaces (default marchingcubes)")
+  parser.add_argument("--pairs", nargs="+", metavar="STRUCTURE:OTHER",
+                      help="pairs of structures (default %s)" % " ".join(name + ":" + other for name, other in contactPairs))
+  parser.add_argument("--output", default="contact.csv", help="table with a row per pair and time step (default contact.csv)")
+  args = parser.parse_args()
+
+  pairs = [tuple(pair.split(":")) for pair in args.pairs] if args.pairs else contactPairs
+  for pair in pairs:
+    for name in pair:
+      if name not in structureSettings:
+        parser.error("Unknown structure %s, choose from %s" % (name, ", ".join(structureSettings)))
+
+  meshCache = MeshCache(TimestepCache(args.directory, 256*1024*1024), args.mesh_cache, 256*1024*1024, args.contour_engine)
+  analysis = ContactAnalysis()
+  rows = analyseContacts(meshCache, pairs, analysis)
+  with open(args.output, "w", newline="") as f:
+    writer = csv.DictWriter(f, fieldnames=contactFields)
+    writer.writeheader()
+    writer.writerows(rows)
+  print("Contact of %d pairs at %d time steps written to %s" % (len(pairs), len(rows) // len(pairs), args.output))
+  analysis.printReport()
@@ -0,0 +1,93 @@
+import KneeVTK as vtk
+import os
+import sys
+import json
+import glob
+import time
+import subprocess
+
+#File names of the exported frames in the export directory
+framePattern = "frame_%04d.png"
+
+# Function to get the time step of every frame, the frames are spread evenly over the time steps
+def frameTimesteps(frameCount, timestepCount):
+  if frameCount == 1:
+    return [0]
+  return [int(round(frame * (timestepCount - 1) / float(frameCount - 1))) for frame in range(frameCount)]
+
+# Function to read a camera path: a JSON list of key frames with position, focalPoint and viewUp (and viewAngle).
+# The cameras between the key frames are interpolated with a spline.
+def readCameraPath(path):
+  with open(path) as f:
+    keyFrames = json.load(f)
+  if len(keyFrames) < 2:
+    raise ValueError("A camera path needs at least two key frames: " + path)
+  interpolator = vtk.vtkCameraInterpolator()
+  interpolator.SetInterpolationTypeToSpline()
+  for index, keyFrame in enumerate(keyFrames):
+    camera = vtk.vtkCamera()
+    camera.SetPosition(keyFrame["position"])
+    camera.SetFocalPoint(keyFrame["focalPoint"])
+    camera.SetViewUp(keyFrame["viewUp"])
+    camera.SetViewAngle(keyFrame.get("viewAngle", camera.GetViewAngle()))
+    interpolator.AddCamera(index, camera)
+  return interpolator
+
+# Function to render frames of the animation offscreen and write them as PNG files.
+# A frame shows its time step and the camera of the path, or the start camera turned around the focal point by the orbit.
+# Only the given frames are rendered, so the frames can be split over several processes. Returns the frames per second.
+def exportFrames(renderWindow, renderer, showFrame, directory, timesteps, frames, cameraPath=None, orbit=0.0):
+  os.makedirs(directory, exist_ok=True)
+  camera = renderer.GetActiveCamera()
+  start = vtk.vtkCamera()
+  start.DeepCopy(camera)
+  grabber = vtk.vtkWindowToImageFilter()
+  grabber.SetInput(renderWindow)
+  grabber.SetInputBufferTypeToRGB()
+  grabber.ReadFrontBufferOff()
+  writer = vtk.vtkPNGWriter()
+  writer.SetInputConnection(grabber.GetOutputPort())
+
+  began = time.perf_counter()
+  for frame in frames:
+    showFrame(timesteps[frame])
+    position = frame / float(max(len(timesteps) - 1, 1))
+    if cameraPath is not None:
+      cameraPath.InterpolateCamera(position * cameraPath.GetMaximumT(), camera)
+    elif orbit:
+      camera.DeepCopy(start)
+      camera.Azimuth(orbit * frame / float(len(timesteps)))
+    renderer.ResetCameraClippingRange()
+    renderWindow.Render()
+    grabber.Modified()
+    writer.SetFileName(os.path.join(directory, framePattern % frame))
+    writer.Write()
+  seconds = time.perf_counter() - began
+  return len(frames) / max(seconds, 1e-9)
+
+# Function to write the exported frames of a directory as an Ogg Theora video
+def writeVideo(directory, path, fps):
+  reader = vtk.vtkPNGReader()
+  writer = vtk.vtkOggTheoraWriter()
+  writer.SetInputConnection(reader.GetOutputPort())
+  writer.SetFileName(path)
+  writer.SetRate(max(int(round(fps)), 1))
+  writer.SetQuality(2)
+  for index, fileName in enumerate(sorted(glob.glob(os.path.join(directory, "frame_*.png")))):
+    reader.SetFileName(fileName)
+    reader.Update()
+    if index == 0:
+      writer.Start()
+    writer.Write()
+  writer.End()
+
+# Function to split the export over worker processes, every worker runs the script again with the same options
+# for a part of the frames. Returns the wall time in seconds, including the start of the workers.
+def splitExport(script, arguments, workers):
+  began = time.perf_counter()
+  processes = [subprocess.Popen([sys.executable, script] + arguments + ["--export-part", "%d/%d" % (part, workers)])
+               for part in range(workers)]
+  failed = [process for process in processes if process.wait() != 0]
+  if failed:
+    raise RuntimeError("%d of %d export workers failed" % (len(failed), workers))
+  return time.perf_counter() - began
@@ -0,0 +1,137 @@
+import KneeVTK as vtk
+import numpy
+import threading
+from collections import OrderedDict
+from vtkmodules.util import numpy_support
+from KneeSurface import thresholdRange
+from TimestepCache import PendingLoads
+
+# Function to get the voxels of an image over a larger extent as a numpy array [z, y, x], the voxels outside the image are zero
+def paddedVoxels(image, extent):
+  e = image.GetExtent()
+  values = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+  values = values.reshape(e[5] - e[4] + 1, e[3] - e[2] + 1, e[1] - e[0] + 1)
+  voxels = numpy.zeros((extent[5] - extent[4] + 1, extent[3] - extent[2] + 1, extent[1] - extent[0] + 1), dtype=values.dtype)
+  voxels[e[4] - extent[4]:e[5] - extent[4] + 1, e[2] - extent[2]:e[3] - extent[2] + 1, e[0] - extent[0]:e[1] - extent[0] + 1] = values
+  return voxels
+
+# Function to create an image of numpy voxels [z, y, x] on the grid of another image
+def voxelImage(voxels, extent, grid):
+  image = vtk.vtkImageData()
+  image.SetExtent(extent)
+  image.SetOrigin(grid.GetOrigin())
+  image.SetSpacing(grid.GetSpacing())
+  image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=1))
+  return image
+
+# Function to get the distance in world units from every voxel that is set in a mask to the nearest voxel that is not.
+# The distance filter does not handle negative extents, so the mask is placed at the zero extent of the same size.
+def maskDistance(mask, grid):
+  extent = [0, mask.shape[2] - 1, 0, mask.shape[1] - 1, 0, mask.shape[0] - 1]
+  distance = vtk.vtkImageEuclideanDistance()
+  distance.SetInputData(voxelImage(mask.astype(numpy.uint8), extent, grid))
+  distance.InitializeOn()
+  distance.ConsiderAnisotropyOn()
+  distance.SetAlgorithmToSaito()
+  distance.Update()
+  squared = numpy_support.vtk_to_numpy(distance.GetOutput().GetPointData().GetScalars())
+  return numpy.sqrt(squared).reshape(mask.shape).astype(numpy.float32)
+
+# Function to get the signed distance to the boundary of a mask, negative inside
+def signedDistance(mask, grid):
+  return maskDistance(~mask, grid) - maskDistance(mask, grid)
+
+# Function to get voxels [z, y, x] moved by a whole number of voxels, the voxels moved out are dropped and the voxels moved in
+# get the fill value
+def shiftedVoxels(voxels, shift, fill):
+  moved = numpy.full_like(voxels, fill)
+  source = tuple(slice(max(0, -s), voxels.shape[axis] - max(0, s)) for axis, s in enumerate(shift))
+  target = tuple(slice(max(0, s), voxels.shape[axis] - max(0, -s)) for axis, s in enumerate(shift))
+  moved[target] = voxels[source]
+  return moved
+
+# Function to get the in-between images of two structure images at the given weights, 0 for the first and 1 for the second.
+# Both tissues are moved to the centroid in between theirs, and the tissue of an in-between is where the blend of their signed
+# distances is negative, so a structure moves and changes from one shape to the other instead of fading or shrinking.
+# The tissue gets the value 255 and the background 0, like the images of the volume store, and the images cover the extents of
+# both, grown by the movement of the centroid.
+def blendImages(imageA, imageB, weights):
+  extents = [imageA.GetExtent(), imageB.GetExtent()]
+  extent = []
+  for axis in range(3):
+    extent += [min(e[2 * axis] for e in extents), max(e[2 * axis + 1] for e in extents)]
+  masks = []
+  for image in [imageA, imageB]:
+    voxels = paddedVoxels(image, extent)
+    masks.append((voxels >= thresholdRange[0]) & (voxels <= thresholdRange[1]))
+  if masks[0].any() and masks[1].any():
+    movement = numpy.array(numpy.nonzero(masks[1])).mean(axis=1) - numpy.array(numpy.nonzero(masks[0])).mean(axis=1)
+  else:
+    movement = numpy.zeros(3)
+  margin = [int(numpy.ceil(abs(m))) for m in movement[::-1]]
+  extent = [extent[2 * axis + side] + (margin[axis] if side else -margin[axis]) for axis in range(3) for side in range(2)]
+  distances = [signedDistance(numpy.pad(mask, [(m, m) for m in margin[::-1]]), imageA) for mask in masks]
+  far = max(distance.max() for distance in distances)
+  images = []
+  for weight in weights:
+    tissue = ((1.0 - weight) * shiftedVoxels(distances[0], numpy.round(weight * movement).astype(int), far) +
+              weight * shiftedVoxels(distances[1], numpy.round((weight - 1.0) * movement).astype(int), far)) < 0
+    images.append(voxelImage(numpy.where(tissue, 255, 0).astype(numpy.uint8), extent, imageA))
+  return images
+
+# Function to get the parameters that determine the in-between of two structures, used to key cached surfaces
+def inbetweenParameters(weight):
+  return ["inbetween", weight, "centroid", "signeddistance", thresholdRange]
+
+# Class for a cache of the in-between images of the structures. The in-betweens of two neighbouring time steps are blended
+# together, because the signed distances of both are shared, and kept in memory up to a cap with the least recently used
+# pairs evicted first. The cache can be used from worker threads. The lock only guards the dict of pairs, a pair is read and
+# blended without it, so a thread is only held up by a thread that blends the same pair.
+class InbetweenCache():
+    def __init__(self, volumeCache, steps, maxBytes):
+        self.volumeCache = volumeCache
+        self.steps = steps
+        self.maxBytes = maxBytes
+        self.pairs = OrderedDict()
+        self.bytes = 0
+        self.pending = PendingLoads()
+        self.lock = threading.RLock()
+
+    #Return the in-between image of two structure files at a step, from 1 up to the number of steps per time step
+    def getImage(self, fileNameA, fileNameB, step):
+      key = (fileNameA, fileNameB)
+      with self.lock:
+        images = self.pairs.get(key)
+        if images is not None:
+          self.pairs.move_to_end(key)
+          return images[step - 1]
+        future, loading = self.pending.claim(key)
+      if not loading:
+        return future.result()[step - 1]
+      return self.pending.load(key, future, self.lock, lambda: self.blend(fileNameA, fileNameB),
+                               lambda images: self.add(key, images))[step - 1]
+
+    #Blend the in-betweens of all steps of two structure files
+    def blend(self, fileNameA, fileNameB):
+      weights = [s / float(self.steps) for s in range(1, self.steps)]
+      return blendImages(self.volumeCache.getImage(fileNameA), self.volumeCache.getImage(fileNameB), weights)
+
+    #Add the blended in-betweens of a pair, called with the lock held
+    def add(self, key, images):
+      self.pairs[key] = images
+      self.bytes += sum(image.GetActualMemorySize() * 1024 for image in images)
+      self.evict()
+
+    #Drop the least recently used pairs until the cache fits in the memory cap again, the last pair is kept
+    def evict(self):
+      while self.bytes > self.maxBytes and len(self.pairs) > 1:
+        self.evictOldest()
+
+    #Drop the least recently used pair, returns False when the cache is empty
+    def evictOldest(self):
+      with self.lock:
+        if not self.pairs:
+          return False
+        key, images = self.pairs.popitem(last=False)
+        self.bytes -= sum(image.GetActualMemorySize() * 1024 for image in images)
+        return True
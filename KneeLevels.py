@@ -0,0 +1,92 @@
+import KneeVTK as vtk
+import time
+
+# Function to get the number of triangles of a surface of triangles and triangle strips
+def triangleCount(surface):
+  if surface is None:
+    return 0
+  strips = surface.GetStrips()
+  return surface.GetNumberOfPolys() + strips.GetNumberOfConnectivityIds() - 2 * strips.GetNumberOfCells()
+
+# Class for the levels of detail of the isosurface actors. Before every render each actor gets the mapper of the finest
+# level that fits in its share of the frame time: the frame time is one over the desired update rate of the render window,
+# which the interactor raises while the camera moves, and the share of an actor is its part of the screen coverage of all actors.
+# The time of a level is estimated from its triangles and the time per triangle of the frames rendered so far.
+class LevelOfDetail():
+    def __init__(self, renderWindow, renderer):
+        self.renderWindow = renderWindow
+        self.renderer = renderer
+        self.actors = []
+        self.secondsPerTriangle = 0.0
+        self.triangles = 0
+        self.start = None
+        renderer.AddObserver("StartEvent", self.select)
+        renderWindow.AddObserver("StartEvent", self.onStart)
+        renderWindow.AddObserver("EndEvent", self.onEnd)
+
+    #Add an actor with the producers of its levels from fine to coarse, the mapper of the actor renders the full surface
+    def add(self, actor, levels):
+      mappers = [actor.GetMapper()]
+      for level in levels:
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputConnection(level.GetOutputPort())
+        mappers.append(mapper)
+      self.actors.append((actor, mappers))
+
+    #Add an actor with the surfaces of its levels from fine to coarse, for an actor whose levels do not change
+    def addSurfaces(self, actor, surfaces):
+      mappers = [actor.GetMapper()]
+      for surface in surfaces:
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(surface)
+        mappers.append(mapper)
+      self.actors.append((actor, mappers))
+
+    #Part of the viewport that the bounding box of an actor covers, from 0 to 1
+    def coverage(self, actor):
+      bounds = actor.GetBounds()
+      if bounds is None or bounds[0] > bounds[1]:
+        return 0.0
+      xs, ys = [], []
+      for x in bounds[0:2]:
+        for y in bounds[2:4]:
+          for z in bounds[4:6]:
+            self.renderer.SetWorldPoint(x, y, z, 1.0)
+            self.renderer.WorldToDisplay()
+            display = self.renderer.GetDisplayPoint()
+            xs.append(display[0])
+            ys.append(display[1])
+      width, height = self.renderer.GetSize()
+      area = (min(max(xs), width) - max(min(xs), 0)) * (min(max(ys), height) - max(min(ys), 0))
+      return min(max(area / float(max(width * height, 1)), 0.0), 1.0)
+
+    #Select the level of every visible actor for the frame that is about to be rendered
+    def select(self, caller, event):
+      frameTime = 1.0 / max(self.renderWindow.GetDesiredUpdateRate(), 1e-6)
+      shown = [(actor, mappers) for actor, mappers in self.actors if actor.GetVisibility() and self.renderer.HasViewProp(actor)]
+      coverages = [self.coverage(actor) for actor, mappers in shown]
+      total = sum(coverages)
+      self.triangles = 0
+      for (actor, mappers), coverage in zip(shown, coverages):
+        share = frameTime * coverage / total if total > 0 else frameTime
+        #The finest level that fits in the share, the coarsest when none does
+        chosen = mappers[-1]
+        for mapper in mappers:
+          if triangleCount(mapper.GetInput()) * self.secondsPerTriangle <= share:
+            chosen = mapper
+            break
+        if actor.GetMapper() is not chosen:
+          actor.SetMapper(chosen)
+        self.triangles += triangleCount(chosen.GetInput())
+
+    def onStart(self, caller, event):
+      self.start = time.perf_counter()
+
+    #Update the time per triangle with the frame that was rendered. It is the time of the whole frame,
+    #so it also counts the rest of the scene and the levels are chosen on the safe side.
+    def onEnd(self, caller, event):
+      if self.start is None or self.triangles == 0:
+        return
+      estimate = (time.perf_counter() - self.start) / self.triangles
+      self.secondsPerTriangle = estimate if self.secondsPerTriangle == 0.0 else 0.5 * (self.secondsPerTriangle + estimate)
+      self.start = None
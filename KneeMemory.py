@@ -0,0 +1,55 @@
+from KneeBenchmark import peakMemory
+
+# Function to get the bytes of data objects, an object that is in the list more than once is counted once
+def dataBytes(dataObjects):
+  unique = dict((id(data), data) for data in dataObjects if data is not None)
+  return len(unique), sum(data.GetActualMemorySize() * 1024 for data in unique.values())
+
+# Class for the memory budget of the application. It reports the bytes retained per stage: the images and surfaces of the
+# caches and the data that is not cached, such as the label maps and the inputs of the pipelines on screen.
+# With a cap the caches share it: while they hold more, the least recently used entry of the largest cache is dropped.
+# Data on screen stays in its pipeline when it is dropped from a cache, it is released when the time step changes.
+class MemoryBudget():
+    def __init__(self, maxBytes=None):
+        self.maxBytes = maxBytes
+        self.caches = []
+        self.stages = []
+        self.evicted = 0
+
+    #Add a cache with its bytes and its least recently used entries to drop, a function gives its entries per stage
+    def addCache(self, cache, getStages):
+      self.caches.append(cache)
+      self.stages.append(getStages)
+
+    #Add a stage that is not a cache, a function gives the data objects it retains
+    def addStage(self, stage, getData):
+      self.stages.append(lambda: {stage: dataBytes(getData())})
+
+    #Total bytes of the caches
+    def cacheBytes(self):
+      return sum(cache.bytes for cache in self.caches)
+
+    #Drop entries from the caches until they fit in the cap
+    def enforce(self):
+      if self.maxBytes is None:
+        return
+      while self.cacheBytes() > self.maxBytes:
+        largest = max(self.caches, key=lambda cache: cache.bytes)
+        if not largest.evictOldest():
+          break
+        self.evicted += 1
+
+    #Number of data objects and bytes per stage
+    def report(self):
+      stages = {}
+      for getStages in self.stages:
+        stages.update(getStages())
+      return stages
+
+    #Print the bytes per stage, the total of the caches against the cap and the peak memory of the process
+    def printReport(self):
+      print("%-32s %8s %10s" % ("stage", "objects", "MB"))
+      for stage, (count, bytes) in self.report().items():
+        print("%-32s %8d %10.1f" % (stage, count, bytes / 1024.0 / 1024.0))
+      cap = "no cap" if self.maxBytes is None else "cap %.1f MB, %d entries dropped" % (self.maxBytes / 1024.0 / 1024.0, self.evicted)
+      print("Caches %.1f MB, %s, peak memory %.1f MB" % (self.cacheBytes() / 1024.0 / 1024.0, cap, peakMemory() / 1024.0 / 1024.0))
@@ -0,0 +1,198 @@
+import KneeVTK as vtk
+import os
+import csv
+import json
+import time
+import argparse
+import numpy
+from vtkmodules.util import numpy_support
+from TimestepCache import TimestepCache, readImage
+from MeshCache import MeshCache, shortHash
+from KneeStore import openStore
+from KneeSurface import thresholdRange, contourEngines
+from KneeStructures import structureSettings
+
+#File of the stored metrics
+metricsPath = ".knee_cache/metrics.json"
+
+#Version of the stored metrics, increase it when the metrics change in a way the key does not show
+metricsVersion = 1
+
+#Columns of the table, a row per structure and time step. The volume is in mm3, the centroid and length in mm, the area in mm2.
+#The length is the length of a rod with the spread of the tissue along its main axis, the mesh metrics are of the isosurface.
+metricFields = ["structure", "timestep", "file", "voxels", "volume", "centroidX", "centroidY", "centroidZ", "length",
+                "surfaceArea", "meshVolume"]
+
+# Function to get the voxel metrics of a stack of structure volumes [structure, z, y, x] on one grid, in a few vectorized passes:
+# the tissue voxels are counted and summed along the axes, the centroids and the spread come from these projections
+def voxelMetrics(volumes, spacing, origin):
+  #The upper threshold is only compared when the type of the volumes can exceed it, the sums of the bytes of the mask fit in int32
+  tissue = volumes >= thresholdRange[0]
+  if not numpy.issubdtype(volumes.dtype, numpy.integer) or numpy.iinfo(volumes.dtype).max > thresholdRange[1]:
+    tissue &= volumes <= thresholdRange[1]
+  tissue = tissue.view(numpy.uint8)
+  #World coordinates of the voxels along x, y and z
+  x, y, z = [origin[axis] + spacing[axis] * numpy.arange(volumes.shape[3 - axis]) for axis in range(3)]
+  yx = tissue.sum(axis=1, dtype=numpy.int32)
+  zx = tissue.sum(axis=2, dtype=numpy.int32)
+  zy = tissue.sum(axis=3, dtype=numpy.int32)
+  voxels = yx.sum(axis=(1, 2), dtype=numpy.int64)
+  count = numpy.maximum(voxels, 1).astype(numpy.float64)
+  px, py, pz = yx.sum(axis=1), yx.sum(axis=2), zx.sum(axis=2)
+  centroid = numpy.stack([px @ x, py @ y, pz @ z], axis=1) / count[:, None]
+
+  #Second moments of the tissue, their largest eigenvalue is the spread along the main axis
+  moments = numpy.empty((len(volumes), 3, 3))
+  moments[:, 0, 0] = px @ (x * x)
+  moments[:, 1, 1] = py @ (y * y)
+  moments[:, 2, 2] = pz @ (z * z)
+  moments[:, 0, 1] = moments[:, 1, 0] = numpy.einsum("syx,y,x->s", yx, y, x)
+  moments[:, 0, 2] = moments[:, 2, 0] = numpy.einsum("szx,z,x->s", zx, z, x)
+  moments[:, 1, 2] = moments[:, 2, 1] = numpy.einsum("szy,z,y->s", zy, z, y)
+  covariance = moments / count[:, None, None] - centroid[:, :, None] * centroid[:, None, :]
+  length = numpy.sqrt(12.0 * numpy.maximum(numpy.linalg.eigvalsh(covariance)[:, -1], 0.0))
+
+  rows = []
+  for n in range(len(volumes)):
+    empty = voxels[n] == 0
+    rows.append({"voxels": int(voxels[n]), "volume": float(voxels[n] * spacing[0] * spacing[1] * spacing[2]),
+                 "centroidX": None if empty else float(centroid[n, 0]), "centroidY": None if empty else float(centroid[n, 1]),
+                 "centroidZ": None if empty else float(centroid[n, 2]), "length": float(length[n])})
+  return rows
+
+# Function to get the voxel metrics of structure files, per time step of the memory-mapped store in one stack, or per file.
+# Returns the metrics per file name.
+def fileVoxelMetrics(directory, fileNames):
+  store = openStore(directory)
+  metrics = {}
+  if store is not None and all(store.has(fileName) for fileName in fileNames):
+    positions = {}
+    for fileName in fileNames:
+      timestep, structure = store.positions[fileName]
+      positions.setdefault(timestep, []).append((structure, fileName))
+    spacing, whole = store.header["spacing"], store.header["extent"]
+    origin = [store.header["origin"][axis] + whole[2 * axis] * spacing[axis] for axis in range(3)]
+    for timestep, files in positions.items():
+      volumes = store.volumes[timestep][[structure for structure, fileName in files]]
+      rows = voxelMetrics(volumes, spacing, origin)
+      metrics.update((fileName, row) for (structure, fileName), row in zip(files, rows))
+    return metrics
+
+  for fileName in fileNames:
+    image = readImage(os.path.join(directory, fileName))
+    e = image.GetExtent()
+    values = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(e[5] - e[4] + 1, e[3] - e[2] + 1, e[1] - e[0] + 1)
+    origin = [image.GetOrigin()[axis] + e[2 * axis] * image.GetSpacing()[axis] for axis in range(3)]
+    metrics[fileName] = voxelMetrics(values[None], image.GetSpacing(), origin)[0]
+  return metrics
+
+# Function to get the area and enclosed volume of a surface, its strips are split into triangles first
+def meshMetrics(surface):
+  triangles = vtk.vtkTriangleFilter()
+  triangles.SetInputData(surface)
+  properties = vtk.vtkMassProperties()
+  properties.SetInputConnection(triangles.GetOutputPort())
+  properties.Update()
+  return {"surfaceArea": properties.GetSurfaceArea(), "meshVolume": properties.GetVolume()}
+
+# Class for the stored metrics, a JSON file with the metrics of every structure file under a key with the hash of the file.
+# The mesh metrics have the key of their isosurface in the mesh cache, so they follow its parameters.
+class MetricsStore():
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.changed = False
+        if self.path is not None and os.path.isfile(self.path):
+          with open(self.path) as f:
+            self.entries = json.load(f)
+
+    #Return the stored metrics of a key, None when they are not stored
+    def get(self, key):
+      return self.entries.get(key)
+
+    #Add the metrics of a key
+    def put(self, key, metrics):
+      self.entries[key] = metrics
+      self.changed = True
+
+    #Write the file when metrics were added
+    def save(self):
+      if self.path is None or not self.changed:
+        return
+      os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+      with open(self.path + ".tmp", "w") as f:
+        json.dump(self.entries, f)
+      os.replace(self.path + ".tmp", self.path)
+      self.changed = False
+
+# Function to compute the metrics of all structures and time steps as rows of the table. Only the metrics that are not stored
+# are computed: the voxel metrics in one pass over the volumes, the mesh metrics from the isosurfaces of the mesh cache.
+# Without mesh cache the mesh metrics are left out, and without extract they are left out for isosurfaces that are not stored yet.
+def computeMetrics(directory, metricsStore, meshCache=None, extract=True):
+  #The mesh cache knows the hashes of the structure files, without it one is made for the hashes only
+  hasher = meshCache if meshCache is not None else MeshCache(TimestepCache(directory, 0), None, 0)
+  files = [(name, timestep, fileName, value, smooth) for name, (fileList, value, smooth) in structureSettings.items()
+           for timestep, fileName in enumerate(fileList)]
+
+  voxelKeys = dict((fileName, fileName + "-" + shortHash(json.dumps([metricsVersion, "voxels", thresholdRange])) + "-" +
+                    hasher.fileHash(fileName)) for name, timestep, fileName, value, smooth in files)
+  missing = [fileName for fileName, key in voxelKeys.items() if metricsStore.get(key) is None]
+  if missing:
+    for fileName, metrics in fileVoxelMetrics(directory, missing).items():
+      metricsStore.put(voxelKeys[fileName], metrics)
+
+  rows = []
+  for name, timestep, fileName, value, smooth in files:
+    row = {"structure": name, "timestep": timestep + 1, "file": fileName}
+    row.update(metricsStore.get(voxelKeys[fileName]))
+    if meshCache is not None and (extract or meshCache.hasSurface(fileName, value, smooth)):
+      meshKey = "mesh-" + str(metricsVersion) + "-" + meshCache.key(fileName, value, smooth)
+      if metricsStore.get(meshKey) is None:
+        metricsStore.put(meshKey, meshMetrics(meshCache.getSurface(fileName, value, smooth)))
+      row.update(metricsStore.get(meshKey))
+    rows.append(row)
+  metricsStore.save()
+  return rows
+
+# Function to write the table, CSV with a row per structure and time step or JSON with the rows
+def writeTable(rows, path):
+  if path.endswith(".csv"):
+    with open(path, "w", newline="") as f:
+      writer = csv.DictWriter(f, fieldnames=metricFields, extrasaction="ignore")
+      writer.writeheader()
+      writer.writerows(rows)
+  else:
+    with open(path, "w") as f:
+      json.dump(rows, f, indent=1)
+
+# Function to get the text of the readout of a time step: per structure its volume, surface area, length and how far its
+# centroid moved since the first time step
+def metricsText(rows, timestep):
+  first = dict((row["structure"], row) for row in rows if row["timestep"] == 1)
+  lines = ["%-10s %9s %9s %7s %8s" % ("structure", "vol mm3", "area mm2", "len mm", "moved mm")]
+  for row in rows:
+    if row["timestep"] != timestep:
+      continue
+    start = first[row["structure"]]
+    moved = 0.0
+    if row["centroidX"] is not None and start["centroidX"] is not None:
+      moved = numpy.linalg.norm([row[axis] - start[axis] for axis in ["centroidX", "centroidY", "centroidZ"]])
+    area = "%9.0f" % row["surfaceArea"] if "surfaceArea" in row else "%9s" % "-"
+    lines.append("%-10s %9.0f %s %7.1f %8.1f" % (row["structure"], row["volume"], area, row["length"], moved))
+  return "\n".join(lines)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Compute the volume, centroid, length and surface area of all structures and time steps")
+  parser.add_argument("--directory", default="Structures", help="directory with the structure files (default Structures)")
+  parser.add_argument("--output", default="metrics.csv", help="table of the metrics, .csv or .json (default metrics.csv)")
+  parser.add_argument("--metrics-cache", default=metricsPath, help="file of the stored metrics (default %s)" % metricsPath)
+  parser.add_argument("--mesh-cache", default=".knee_cache/meshes", help="directory of the stored isosurfaces (default .knee_cache/meshes)")
+  parser.add_argument("--no-mesh", action="store_true", help="leave out the surface area and volume of the isosurfaces")
+  parser.add_argument("--contour-engine", choices=contourEngines, default="marchingcubes", help="contour algorithm of the isosurfaces (default marchingcubes)")
+  args = parser.parse_args()
+
+  start = time.perf_counter()
+  meshCache = None if args.no_mesh else MeshCache(TimestepCache(args.directory, 256*1024*1024), args.mesh_cache, 0, args.contour_engine)
+  rows = computeMetrics(args.directory, MetricsStore(args.metrics_cache), meshCache)
+  writeTable(rows, args.output)
+  print("Metrics of %d structure files written to %s in %.3f s" % (len(rows), args.output, time.perf_counter() - start))
@@ -0,0 +1,126 @@
+import time
+
+#Playback modes: a single pass, starting over at the end, or back and forth
+playbackModes = ["once", "loop", "pingpong"]
+
+# Class for the animation of the time steps, driven by a repeating timer of the interactor so the event loop keeps running.
+# The frame to show follows the wall clock at the target frame rate. When showing a frame takes longer than a frame period
+# the frames that are due in the meantime are dropped, so the playback speed does not depend on the load time of a frame.
+class AnimationPlayer():
+    def __init__(self, interactor, frameCount, showFrame, fps=10.0, mode="once"):
+        self.interactor = interactor
+        self.frameCount = frameCount
+        self.showFrame = showFrame
+        self.fps = fps
+        self.mode = mode
+        self.timerId = None
+        self.startTime = None
+
+        #Position in the playback sequence, with ping-pong a position is a frame on the way forth or back
+        self.position = 0
+        self.frame = 0
+
+        #Measured time to show and render a frame in seconds, and the frames dropped to keep up
+        self.frameTimes = []
+        self.dropped = 0
+        self.interactor.AddObserver("TimerEvent", self.onTimer)
+
+    #Check if the animation is playing
+    def isPlaying(self):
+      return self.timerId is not None
+
+    #Start the animation at the current frame, or at the first frame when a single pass has ended
+    def play(self):
+      if self.isPlaying():
+        return
+      self.frameTimes = []
+      self.dropped = 0
+      if self.mode == "once" and self.position >= self.frameCount - 1:
+        self.seek(0)
+        self.showFrame(0)
+        self.interactor.GetRenderWindow().Render()
+      self.startTimer()
+
+    #Stop the animation at the frame it is showing and report the frame times
+    def pause(self):
+      if not self.isPlaying():
+        return
+      self.interactor.DestroyTimer(self.timerId)
+      self.timerId = None
+      print(self.report())
+
+    #Start the animation when it is paused, and pause it when it is playing
+    def toggle(self):
+      if self.isPlaying():
+        self.pause()
+      else:
+        self.play()
+
+    #Continue the animation from a frame, used when the frame is chosen with the slider
+    def seek(self, frame):
+      self.position = frame
+      self.frame = frame
+      if self.isPlaying():
+        self.startTimer()
+
+    #Change the target frame rate, the animation continues from the frame it is showing
+    def setFps(self, fps):
+      self.fps = max(fps, 0.1)
+      if self.isPlaying():
+        self.startTimer()
+
+    #Change the playback mode, the animation continues from the frame it is showing
+    def setMode(self, mode):
+      if mode not in playbackModes:
+        raise ValueError("Unknown playback mode: " + mode)
+      self.mode = mode
+      self.position = self.frame
+      if self.isPlaying():
+        self.startTimer()
+
+    #Create the repeating timer of the frame period, the clock starts at the current position
+    def startTimer(self):
+      if self.timerId is not None:
+        self.interactor.DestroyTimer(self.timerId)
+      self.startTime = time.perf_counter() - self.position / self.fps
+      self.timerId = self.interactor.CreateRepeatingTimer(max(int(1000 / self.fps), 1))
+
+    #Get the frame of a position in the playback sequence
+    def frameAt(self, position):
+      if self.mode == "once":
+        return min(position, self.frameCount - 1)
+      if self.mode == "loop":
+        return position % self.frameCount
+      period = max(2 * self.frameCount - 2, 1)
+      position = position % period
+      return position if position < self.frameCount else period - position
+
+    #On a tick of the timer, show the frame that is due by the clock and skip the ones that are too late
+    def onTimer(self, caller, event):
+      if self.timerId is None or caller.GetTimerEventId() != self.timerId:
+        return
+      due = int((time.perf_counter() - self.startTime) * self.fps)
+      if due <= self.position:
+        return
+      if self.mode == "once":
+        due = min(due, self.frameCount - 1)
+      self.dropped += max(due - self.position - 1, 0)
+      self.position = due
+
+      start = time.perf_counter()
+      self.frame = self.frameAt(due)
+      self.showFrame(self.frame)
+      self.interactor.GetRenderWindow().Render()
+      self.frameTimes.append(time.perf_counter() - start)
+
+      if self.mode == "once" and due >= self.frameCount - 1:
+        self.pause()
+
+    #Summary of the measured frame times
+    def report(self):
+      if not self.frameTimes:
+        return "No frames played"
+      shown = len(self.frameTimes)
+      mean = sum(self.frameTimes) / shown
+      return "Played %d frames, dropped %d, frame time mean %.1f ms max %.1f ms, target %.1f fps" % (
+        shown, self.dropped, 1000 * mean, 1000 * max(self.frameTimes), self.fps)
@@ -0,0 +1,82 @@
+import KneeVTK as vtk
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from TimestepCache import TimestepCache, readImage
+from MeshCache import MeshCache
+from RegionIndex import cropImage
+from KneeSurface import extractSurface, contourEngines
+from KneeStructures import structureSettings
+
+# Function to turn a surface into bytes, so it can be sent back from a worker process
+def serializeSurface(surface):
+  writer = vtk.vtkXMLPolyDataWriter()
+  writer.WriteToOutputStringOn()
+  writer.SetInputData(surface)
+  writer.SetDataModeToAppended()
+  writer.EncodeAppendedDataOff()
+  writer.SetCompressorTypeToLZ4()
+  writer.Write()
+  return writer.GetOutputString()
+
+# Function to turn the bytes of serializeSurface back into a surface
+def deserializeSurface(data):
+  reader = vtk.vtkXMLPolyDataReader()
+  reader.ReadFromInputStringOn()
+  reader.SetInputString(data)
+  reader.Update()
+  surface = vtk.vtkPolyData()
+  surface.ShallowCopy(reader.GetOutput())
+  return surface
+
+# Function run by a worker process: extract one surface and return it serialized with the wall time of the job
+def extractJob(directory, fileName, value, smooth, engine):
+  start = time.perf_counter()
+  surface = extractSurface(cropImage(readImage(os.path.join(directory, fileName))), value, smooth, engine)
+  return serializeSurface(surface), time.perf_counter() - start
+
+# Function to get the surface jobs of all anatomic structures and time steps as (file, threshold value, smoothing iterations)
+def allSurfaceJobs():
+  jobs = []
+  for fileList, value, smooth in structureSettings.values():
+    for fileName in fileList:
+      jobs.append((fileName, value, smooth))
+  return jobs
+
+# Function to extract all surfaces that are not stored yet on a pool of worker processes.
+# The surfaces are sent back serialized and stored by this process, so only one process writes the cache.
+def precomputeSurfaces(meshCache, jobs, workers, log=sys.stdout):
+  directory = meshCache.volumeCache.directory
+  pending = [job for job in jobs if not meshCache.isStored(*job)]
+  log.write("%d of %d surfaces to extract on %d workers\n" % (len(pending), len(jobs), workers))
+  if not pending:
+    return
+
+  start = time.perf_counter()
+  jobTime = 0.0
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    futures = {}
+    for job in pending:
+      futures[pool.submit(extractJob, directory, *job, meshCache.engine)] = job
+    for future in as_completed(futures):
+      fileName, value, smooth = futures[future]
+      data, seconds = future.result()
+      meshCache.store(fileName, value, smooth, deserializeSurface(data))
+      jobTime += seconds
+      log.write("  %-18s %6.2f s\n" % (fileName, seconds))
+
+  wall = time.perf_counter() - start
+  log.write("Extracted %d surfaces in %.2f s wall time, %.2f s summed over the jobs\n" % (len(pending), wall, jobTime))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Extract the isosurfaces of all structures and time steps in parallel and store them in the mesh cache")
+  parser.add_argument("--directory", default="Structures", help="directory with the structure files (default Structures)")
+  parser.add_argument("--mesh-cache", default=".knee_cache/meshes", help="directory of the stored isosurfaces (default .knee_cache/meshes)")
+  parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: number of cores)")
+  parser.add_argument("--contour-engine", choices=contourEngines, default="marchingcubes", help="contour algorithm of the isosurfaces (default marchingcubes)")
+  args = parser.parse_args()
+
+  meshCache = MeshCache(TimestepCache(args.directory, 0), args.mesh_cache, 0, args.contour_engine)
+  precomputeSurfaces(meshCache, allSurfaceJobs(), args.workers)
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Class for the prefetch of the time steps next to the one on screen, on a pool of worker threads.
+# A time step is loaded by a function that reads the images and runs the filters of all structures and returns
+# the result as a frame. The frames of the next and previous time steps, in the direction the user moves,
+# are loaded while the current one is shown and kept in a buffer of a few frames that setTimestep takes from.
+class Prefetcher():
+    def __init__(self, loadFrame, frameCount, workers=1, depth=2):
+        self.loadFrame = loadFrame
+        self.frameCount = frameCount
+        self.depth = depth
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.frames = OrderedDict()
+        self.last = None
+        self.direction = 1
+        self.hits = 0
+        self.misses = 0
+
+    #Check if the frame of a time step is in the buffer and done loading
+    def isReady(self, i):
+      future = self.frames.get(i)
+      return future is not None and future.done() and not future.cancelled()
+
+    #Return the frame of a time step: from the buffer, waiting for it when it is still being loaded, or loaded now
+    def take(self, i):
+      future = self.frames.pop(i, None)
+      if future is not None and not future.cancelled():
+        self.hits += 1
+        return future.result()
+      self.misses += 1
+      return self.loadFrame(i)
+
+    #Start loading the time steps around the one on screen, the next one in the direction of movement first.
+    #Frames that are no longer around it are dropped from the buffer, so it holds at most depth frames.
+    def prefetch(self, i):
+      if self.last is not None and i != self.last:
+        #A jump from the last to the first time step is the next step of a loop, not a move back
+        step = i - self.last
+        if abs(step) > self.frameCount // 2:
+          step = -step
+        self.direction = 1 if step > 0 else -1
+      self.last = i
+
+      wanted = []
+      for distance in range(1, self.depth + 1):
+        for frame in [i + distance * self.direction, i - distance * self.direction]:
+          frame = frame % self.frameCount
+          if frame != i and frame not in wanted:
+            wanted.append(frame)
+      wanted = wanted[:self.depth]
+
+      for frame in list(self.frames):
+        if frame not in wanted:
+          self.frames.pop(frame).cancel()
+      for frame in wanted:
+        if frame not in self.frames:
+          self.frames[frame] = self.pool.submit(self.loadFrame, frame)
+
+    #Stop the worker threads, the frames that are being loaded are finished first
+    def shutdown(self):
+      for future in self.frames.values():
+        future.cancel()
+      self.frames.clear()
+      self.pool.shutdown(wait=True)
+
+# Class for the refinement of a draft frame: the final frame of a time step is loaded on a worker thread
+# and a repeating timer of the interactor checks if it is done, so it is swapped in on the thread of the event loop.
+class Refiner():
+    def __init__(self, interactor, loadFrame, showFrame, interval=50):
+        self.interactor = interactor
+        self.loadFrame = loadFrame
+        self.showFrame = showFrame
+        self.interval = interval
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refine")
+        self.future = None
+        self.timestep = None
+        self.timerId = None
+        self.interactor.AddObserver("TimerEvent", self.onTimer)
+
+    #Start loading the final frame of a time step, a refinement that is still pending is dropped
+    def refine(self, i):
+      self.cancel()
+      self.future = self.pool.submit(self.loadFrame, i)
+      self.timestep = i
+      self.timerId = self.interactor.CreateRepeatingTimer(self.interval)
+
+    #Drop the pending refinement, for example when the slider is dragged again
+    def cancel(self):
+      if self.timerId is not None:
+        self.interactor.DestroyTimer(self.timerId)
+        self.timerId = None
+      if self.future is not None:
+        self.future.cancel()
+        self.future = None
+
+    #On a tick of the timer, show the final frame when it is done
+    def onTimer(self, caller, event):
+      if self.timerId is None or caller.GetTimerEventId() != self.timerId or not self.future.done():
+        return
+      self.showRefined()
+
+    #Show the final frame now, waiting for it when it is still loading. Used where the timer does not fire, as in the benchmark.
+    def flush(self):
+      if self.future is not None:
+        self.showRefined()
+
+    #Stop the timer, then show the final frame that was loaded. A load that failed is reported and the draft stays on screen.
+    def showRefined(self):
+      future, timestep = self.future, self.timestep
+      self.cancel()
+      try:
+        frame = future.result()
+      except Exception as error:
+        print("Refinement of frame %d failed: %s" % (timestep, error))
+        return
+      self.showFrame(timestep, frame)
+      self.interactor.GetRenderWindow().Render()
+
+    #Stop the worker thread
+    def shutdown(self):
+      self.cancel()
+      self.pool.shutdown(wait=True)
@@ -0,0 +1,157 @@
+import KneeVTK as vtk
+import csv
+import json
+import time
+import threading
+from KneeStructures import structureSettings
+
+#Columns of the report, a row per run of a stage
+reportFields = ["stage", "structure", "timestep", "seconds", "voxels", "triangles", "bytes"]
+
+# Function to get the structure and time step of a structure file, None for both when it is not a structure file
+def fileLabel(fileName):
+  for name, (fileList, value, smooth) in structureSettings.items():
+    if fileName in fileList:
+      return name, fileList.index(fileName)
+  return None, None
+
+# Function to get the size of a data object: the voxels of an image, the triangles of a surface and the bytes of both
+def dataSize(data):
+  if data is None:
+    return 0, 0, 0
+  voxels = data.GetNumberOfPoints() if data.IsA("vtkImageData") else 0
+  triangles = 0
+  if data.IsA("vtkPolyData"):
+    strips = data.GetStrips()
+    triangles = data.GetNumberOfPolys() + strips.GetNumberOfConnectivityIds() - 2 * strips.GetNumberOfCells()
+  return voxels, triangles, data.GetActualMemorySize() * 1024
+
+# Class for the profiler of the pipelines: it hooks the StartEvent and EndEvent of the algorithms and records
+# the wall time of every stage per structure and time step with the size of its output.
+# The render window is timed per frame, and the frame time can be shown in an overlay.
+class PipelineProfiler():
+    def __init__(self):
+        self.records = []
+        self.frameTimes = []
+        self.timestep = None
+        self.overlay = None
+        self.lock = threading.Lock()
+
+    #Add a run of a stage, the structure and time step come from the structure file it ran for
+    def record(self, stage, fileName, seconds, data=None, structure=None, timestep=None):
+      if fileName is not None:
+        structure, timestep = fileLabel(fileName)
+      voxels, triangles, bytes = dataSize(data)
+      with self.lock:
+        self.records.append({"stage": stage, "structure": structure, "timestep": timestep, "seconds": seconds,
+                             "voxels": voxels, "triangles": triangles, "bytes": bytes})
+
+    #Time the runs of an algorithm, the stage is the class of the algorithm
+    def watch(self, algorithm, structure=None, timestep=None):
+      start = []
+      def onStart(caller, event):
+        start.append(time.perf_counter())
+      def onEnd(caller, event):
+        if start:
+          data = caller.GetOutputDataObject(0) if caller.GetNumberOfOutputPorts() > 0 else None
+          self.record(caller.GetClassName(), None, time.perf_counter() - start.pop(), data, structure,
+                      self.timestep if timestep is None else timestep)
+      algorithm.AddObserver("StartEvent", onStart)
+      algorithm.AddObserver("EndEvent", onEnd)
+
+    #Watch function for the algorithms that run for a structure file, the structure name can be replaced
+    def watcher(self, fileName, structure=None):
+      name, timestep = fileLabel(fileName)
+      return lambda algorithm: self.watch(algorithm, structure or name, timestep)
+
+    #Time the mapper of an actor or volume of a structure, the pipeline update and for volumes the ray cast
+    def watchMapper(self, mapper, structure):
+      self.watch(mapper, structure)
+      if mapper.IsA("vtkVolumeMapper"):
+        start = []
+        def onStart(caller, event):
+          start.append(time.perf_counter())
+        def onEnd(caller, event):
+          if start:
+            self.record(caller.GetClassName() + " ray cast", None, time.perf_counter() - start.pop(), None, structure, self.timestep)
+        mapper.AddObserver("VolumeMapperRenderStartEvent", onStart)
+        mapper.AddObserver("VolumeMapperRenderEndEvent", onEnd)
+
+    #Time every render of a window, with an overlay the frame time of the last render is shown in a renderer
+    def watchRender(self, renderWindow, renderer=None):
+      if renderer is not None:
+        self.overlay = vtk.vtkTextActor()
+        self.overlay.GetTextProperty().SetColor(1, 1, 0)
+        self.overlay.GetTextProperty().SetFontSize(14)
+        self.overlay.GetPositionCoordinate().SetCoordinateSystemToNormalizedDisplay()
+        self.overlay.GetPositionCoordinate().SetValue(0.02, 0.96)
+        renderer.AddViewProp(self.overlay)
+      start = []
+      def onStart(caller, event):
+        start.append(time.perf_counter())
+      def onEnd(caller, event):
+        if start:
+          seconds = time.perf_counter() - start.pop()
+          self.frameTimes.append(seconds)
+          self.record("render", None, seconds, None, None, self.timestep)
+          if self.overlay is not None:
+            #Shown with the next frame, the text of this frame is already drawn
+            recent = self.frameTimes[-10:]
+            mean = sum(recent) / len(recent)
+            self.overlay.SetInput("frame %.1f ms, mean %.1f ms (%.1f fps), time step %s" %
+                                  (1000 * seconds, 1000 * mean, 1.0 / max(mean, 1e-6), self.timestep))
+      renderWindow.AddObserver("StartEvent", onStart)
+      renderWindow.AddObserver("EndEvent", onEnd)
+
+    #Total time per stage, with the number of runs, the slowest stages first
+    def summary(self):
+      stages = {}
+      with self.lock:
+        for record in self.records:
+          total = stages.setdefault(record["stage"], {"stage": record["stage"], "runs": 0, "seconds": 0.0, "bytes": 0})
+          total["runs"] += 1
+          total["seconds"] += record["seconds"]
+          total["bytes"] += record["bytes"]
+      return sorted(stages.values(), key=lambda total: -total["seconds"])
+
+    #Print the total time per stage
+    def printSummary(self):
+      print("%-40s %6s %10s %10s %10s" % ("stage", "runs", "total s", "mean ms", "MB"))
+      for total in self.summary():
+        print("%-40s %6d %10.3f %10.2f %10.1f" % (total["stage"], total["runs"], total["seconds"],
+                                                  1000 * total["seconds"] / total["runs"], total["bytes"] / 1024.0 / 1024.0))
+
+    #Write the report, CSV with a row per run or JSON with the runs and the totals per stage
+    def writeReport(self, path):
+      with self.lock:
+        records = list(self.records)
+      if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+          writer = csv.DictWriter(f, fieldnames=reportFields)
+          writer.writeheader()
+          writer.writerows(records)
+      else:
+        with open(path, "w") as f:
+          json.dump({"stages": self.summary(), "records": records}, f, indent=1)
+
+# Class for the timing of the startup up to the first frame, a phase ends at its mark and starts at the mark before it
+class StartupProfiler():
+    def __init__(self, start):
+        self.marks = [("start", start)]
+
+    #End a phase now
+    def mark(self, phase):
+      self.marks.append((phase, time.perf_counter()))
+
+    #Seconds per phase
+    def phases(self):
+      return [(phase, end - begin) for (previous, begin), (phase, end) in zip(self.marks, self.marks[1:])]
+
+    #Print the seconds per phase and the total, with a target a startup above it is reported
+    def printReport(self, target=None):
+      for phase, seconds in self.phases():
+        print("%-24s %8.3f s" % (phase, seconds))
+      total = self.marks[-1][1] - self.marks[0][1]
+      print("%-24s %8.3f s" % ("startup", total))
+      if target:
+        print("Startup %s the target of %.3f s" % ("is within" if total <= target else "EXCEEDS", target))
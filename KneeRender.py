@@ -0,0 +1,38 @@
+# Class for the scheduler of the renders of the render window. Render requests are merged: the first request starts a
+# one shot timer of the interactor for the next frame and all requests until it fires are served by a single render.
+# The interactor is set to request its renders here instead of rendering them, so the renders of the widgets and the
+# interactor style while a slider or the camera is dragged are merged too. A render done directly, for example by the
+# animation, serves the requests that are pending.
+class RenderScheduler():
+    def __init__(self, interactor, fps=60.0):
+        self.interactor = interactor
+        self.renderWindow = interactor.GetRenderWindow()
+        self.interval = max(int(1000 / fps), 1)
+        self.timerId = None
+        self.requests = 0
+        self.renders = 0
+        self.interactor.EnableRenderOff()
+        self.interactor.AddObserver("RenderEvent", self.request)
+        self.interactor.AddObserver("TimerEvent", self.onTimer)
+        self.renderWindow.AddObserver("StartEvent", self.onRender)
+
+    #Ask for a render, it is done at the next frame together with the other requests until then
+    def request(self, caller=None, event=None):
+      self.requests += 1
+      if self.timerId is None:
+        self.timerId = self.interactor.CreateOneShotTimer(self.interval)
+
+    def onTimer(self, caller, event):
+      if self.timerId is not None and caller.GetTimerEventId() == self.timerId:
+        self.renderWindow.Render()
+
+    #Every render of the window serves the pending requests
+    def onRender(self, caller, event):
+      self.renders += 1
+      if self.timerId is not None:
+        self.interactor.DestroyTimer(self.timerId)
+        self.timerId = None
+
+    #Number of render requests and renders
+    def report(self):
+      return "Render requests %d, renders %d" % (self.requests, self.renders)
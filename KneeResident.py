@@ -0,0 +1,73 @@
+import KneeVTK as vtk
+
+# Function to estimate the GPU memory of a surface: positions and normals as floats and three indices per triangle
+def surfaceGpuBytes(surface):
+  triangles = surface.GetNumberOfPolys()
+  strips = surface.GetStrips()
+  if strips.GetNumberOfCells() > 0:
+    triangles += strips.GetNumberOfConnectivityIds() - 2 * strips.GetNumberOfCells()
+  return surface.GetNumberOfPoints() * 2 * 3 * 4 + triangles * 3 * 4
+
+# Function to estimate the GPU memory of a volume: its scalars are uploaded as a 3D texture of the same type
+def volumeGpuBytes(image):
+  scalars = image.GetPointData().GetScalars()
+  return image.GetNumberOfPoints() * scalars.GetNumberOfComponents() * scalars.GetDataTypeSize()
+
+# Function to estimate the GPU memory of all resident props, the data is given per template as a list over the time steps
+def residentBytes(surfaceData, volumeData):
+  return (sum(surfaceGpuBytes(surface) for surfaces in surfaceData for surface in surfaces) +
+          sum(volumeGpuBytes(image) for images in volumeData for image in images))
+
+# Function to create a prop that looks like a template prop but shows other data. The property is shared,
+# so a change of the opacity or the transfer functions of the template applies to all its time steps.
+def residentProp(template, data):
+  if isinstance(template, vtk.vtkVolume):
+    mapper = vtk.vtkGPUVolumeRayCastMapper()
+    mapper.SetBlendMode(template.GetMapper().GetBlendMode())
+    prop = vtk.vtkVolume()
+  else:
+    mapper = vtk.vtkPolyDataMapper()
+    prop = vtk.vtkActor()
+  mapper.SetInputData(data)
+  prop.SetMapper(mapper)
+  prop.SetProperty(template.GetProperty())
+  return prop
+
+# Class for the resident animation: a prop per structure and time step, built once, so the geometry and
+# 3D textures of a time step are uploaded to the GPU the first time it is shown and kept there.
+# A time step or render style change only switches the visibility of the props.
+class ResidentFrames():
+    def __init__(self, surfaceTemplates, surfaceData, volumeTemplates, volumeData):
+        frameCount = len(surfaceData[0])
+        self.surfaceFrames = [[residentProp(template, data[i]) for template, data in zip(surfaceTemplates, surfaceData)]
+                              for i in range(frameCount)]
+        self.volumeFrames = [[residentProp(template, data[i]) for template, data in zip(volumeTemplates, volumeData)]
+                             for i in range(frameCount)]
+        self.bytes = residentBytes(surfaceData, volumeData)
+        self.propCount = frameCount * (len(surfaceTemplates) + len(volumeTemplates))
+        self.frame = 0
+        self.volumeStyle = False
+
+    #Add all props to a renderer, in the order of the templates for every time step
+    def addTo(self, renderer):
+      for props in self.surfaceFrames + self.volumeFrames:
+        for prop in props:
+          renderer.AddViewProp(prop)
+      self.updateVisibility()
+
+    #Show a time step
+    def setFrame(self, i):
+      self.frame = i
+      self.updateVisibility()
+
+    #Show the volume render or the isosurfaces
+    def setVolumeStyle(self, volumeStyle):
+      self.volumeStyle = volumeStyle
+      self.updateVisibility()
+
+    #Only the props of the current time step and render style are visible
+    def updateVisibility(self):
+      for frames, visible in [(self.surfaceFrames, not self.volumeStyle), (self.volumeFrames, self.volumeStyle)]:
+        for i, props in enumerate(frames):
+          for prop in props:
+            prop.SetVisibility(visible and i == self.frame)
@@ -0,0 +1,357 @@
+import KneeVTK as vtk
+import json
+import sys
+import math
+import time
+import threading
+import traceback
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from vtkmodules.util import numpy_support
+from KneeBenchmark import frameStatistics
+
+#Formats of the frames and their content types
+frameFormats = {"jpeg": "image/jpeg", "png": "image/png"}
+
+#Number of recent latencies and encode times the metrics are computed from
+metricsWindow = 1000
+
+#Seconds a request waits for its frame before it gets the frame that is there
+waitTimeout = 120.0
+
+#Camera values of a command: the turns and zoom are numbers, the others points or vectors
+cameraTurns = ["azimuth", "elevation", "roll", "zoom"]
+cameraVectors = ["position", "focalPoint", "viewUp"]
+
+# Function to check if a value of a command is a finite number, JSON true and false are not
+def isNumber(value):
+  return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+# Class for a rendered frame: the pixels of the window as they were grabbed, the last command it shows and its encoded images.
+# A frame is shared by all clients, every format is encoded once.
+class RenderedFrame():
+    def __init__(self, version, image):
+        self.version = version
+        self.image = image
+        self.encoded = {}
+        self.lock = threading.Lock()
+
+# Class for the render server: one offscreen render window with the scene resident, driven by commands of local clients over HTTP.
+# The commands of all clients are queued and the render loop applies the queue at most once per frame interval: the camera moves
+# are applied in order, of the flexion frame, render style and opacities only the last value is shown, and a single render
+# serves all of them. Every client gets the latest frame, so the clients share the caches of the scene and its renders.
+# The frame, render style and opacity are changed through the functions of the application, the camera directly.
+# The latency of every command, from its arrival until a frame that shows it is rendered, and the encode times are measured.
+class RenderServer():
+    def __init__(self, renderWindow, renderer, showFrame, setStyle, setOpacity, frameCount, opacityGroups, fps=30.0, quality=80):
+        self.renderWindow = renderWindow
+        self.renderer = renderer
+        self.showFrame = showFrame
+        self.setStyle = setStyle
+        self.setOpacity = setOpacity
+        self.frameCount = frameCount
+        self.opacityGroups = opacityGroups
+        self.interval = 1.0 / fps
+        self.quality = quality
+        self.state = {"frame": 0, "style": "iso", "opacity": dict((group, 100.0) for group in opacityGroups)}
+        self.commands = []
+        self.received = 0
+        self.frame = None
+        self.lastRender = 0.0
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.grabber = vtk.vtkWindowToImageFilter()
+        self.grabber.SetInput(renderWindow)
+        self.grabber.SetInputBufferTypeToRGB()
+        self.grabber.ReadFrontBufferOff()
+        self.renders = 0
+        self.errors = 0
+        self.streams = 0
+        self.sent = 0
+        self.latencies = deque(maxlen=metricsWindow)
+        self.renderTimes = deque(maxlen=metricsWindow)
+        self.encodeTimes = dict((format, deque(maxlen=metricsWindow)) for format in frameFormats)
+        self.encodedBytes = dict((format, 0) for format in frameFormats)
+
+    #Check a command and queue it, returns its version: the frames from that version on show it.
+    #A command is a dict with any of camera, frame, style and opacity, a ValueError tells what is wrong with it.
+    def submit(self, command):
+      unknown = set(command) - set(["camera", "frame", "style", "opacity"])
+      if unknown:
+        raise ValueError("Unknown command %s, use camera, frame, style or opacity" % ", ".join(sorted(unknown)))
+      if "frame" in command and (not isinstance(command["frame"], int) or isinstance(command["frame"], bool) or
+                                 not 0 <= command["frame"] < self.frameCount):
+        raise ValueError("The frame is a number from 0 to %d" % (self.frameCount - 1))
+      if "style" in command and command["style"] not in ["iso", "volume"]:
+        raise ValueError("The style is iso or volume")
+      if not isinstance(command.get("opacity", {}), dict):
+        raise ValueError("The opacity is an object with a percentage per structure")
+      for group, value in command.get("opacity", {}).items():
+        if group not in self.opacityGroups:
+          raise ValueError("Unknown structure %s, choose from %s" % (group, ", ".join(self.opacityGroups)))
+        if not isNumber(value) or not 0 <= value <= 100:
+          raise ValueError("The opacity is a percentage from 0 to 100")
+      if not isinstance(command.get("camera", {}), dict):
+        raise ValueError("The camera is an object with turns in degrees, a zoom factor or vectors")
+      for key, value in command.get("camera", {}).items():
+        if key in cameraTurns:
+          if not isNumber(value) or (key == "zoom" and value <= 0):
+            raise ValueError("The camera %s is a number%s" % (key, ", above 0" if key == "zoom" else ""))
+        elif key in cameraVectors:
+          if not isinstance(value, list) or len(value) != 3 or not all(isNumber(v) for v in value):
+            raise ValueError("The camera %s is a list of 3 numbers" % key)
+        else:
+          raise ValueError("Unknown camera value %s, use %s" % (key, ", ".join(cameraTurns + cameraVectors)))
+      with self.condition:
+        self.received += 1
+        self.commands.append((self.received, time.perf_counter(), command))
+        self.condition.notify_all()
+        return self.received
+
+    #Report a command or render that failed, the render loop goes on with the next one
+    def failed(self, what):
+      self.errors += 1
+      sys.stderr.write("Server: %s failed\n" % what)
+      traceback.print_exc()
+
+    #Apply the queued commands to the scene: all camera moves, and the last flexion frame, render style and opacities.
+    #A command that fails is left out, the others are applied.
+    def apply(self, commands):
+      camera = self.renderer.GetActiveCamera()
+      frame, style, opacity = None, None, {}
+      for version, received, command in commands:
+        try:
+          moves = command.get("camera", {})
+          for key, setter in [("position", camera.SetPosition), ("focalPoint", camera.SetFocalPoint), ("viewUp", camera.SetViewUp)]:
+            if key in moves:
+              setter(moves[key])
+          for key, move in [("azimuth", camera.Azimuth), ("elevation", camera.Elevation), ("roll", camera.Roll), ("zoom", camera.Zoom)]:
+            if key in moves:
+              move(moves[key])
+          camera.OrthogonalizeViewUp()
+        except Exception:
+          self.failed("camera of command %d" % version)
+        frame = command.get("frame", frame)
+        style = command.get("style", style)
+        opacity.update(command.get("opacity", {}))
+      #The render style first, the parts that become visible are loaded once for the frame that is shown
+      try:
+        if style is not None and style != self.state["style"]:
+          self.setStyle(style == "volume")
+          self.state["style"] = style
+        for group, value in opacity.items():
+          if value != self.state["opacity"][group]:
+            self.setOpacity(group, value)
+            self.state["opacity"][group] = value
+        if frame is not None and frame != self.state["frame"]:
+          self.showFrame(frame)
+          self.state["frame"] = frame
+        self.renderer.ResetCameraClippingRange()
+      except Exception:
+        self.failed("commands up to %d" % commands[-1][0])
+
+    #Render the scene and grab its pixels as the frame of a version
+    def render(self, version):
+      start = time.perf_counter()
+      self.renderWindow.Render()
+      self.grabber.Modified()
+      self.grabber.Update()
+      image = vtk.vtkImageData()
+      image.DeepCopy(self.grabber.GetOutput())
+      self.renderTimes.append(time.perf_counter() - start)
+      self.renders += 1
+      return RenderedFrame(version, image)
+
+    #Return the image of a frame in a format, it is encoded by the first client that asks for it
+    def encode(self, frame, format):
+      with frame.lock:
+        if format not in frame.encoded:
+          start = time.perf_counter()
+          writer = vtk.vtkJPEGWriter() if format == "jpeg" else vtk.vtkPNGWriter()
+          if format == "jpeg":
+            writer.SetQuality(self.quality)
+          writer.SetInputData(frame.image)
+          writer.WriteToMemoryOn()
+          writer.Write()
+          frame.encoded[format] = numpy_support.vtk_to_numpy(writer.GetResult()).tobytes()
+          self.encodeTimes[format].append(time.perf_counter() - start)
+          self.encodedBytes[format] += len(frame.encoded[format])
+      with self.condition:
+        self.sent += 1
+      return frame.encoded[format]
+
+    #Return the first frame that shows a version, waiting for its render. After the timeout the latest frame is returned.
+    def waitFrame(self, version=0):
+      with self.condition:
+        self.condition.wait_for(lambda: self.stopped or (self.frame is not None and self.frame.version >= version), waitTimeout)
+        return self.frame
+
+    #Render loop, it runs on the thread of the render window until stop is called. It waits for commands and then for the
+    #end of the frame interval, so the commands that arrive meanwhile are served by the same render.
+    def run(self):
+      self.frame = self.render(0)
+      self.lastRender = time.perf_counter()
+      while True:
+        with self.condition:
+          self.condition.wait_for(lambda: self.stopped or self.commands)
+          if self.stopped:
+            return
+        delay = self.lastRender + self.interval - time.perf_counter()
+        if delay > 0:
+          time.sleep(delay)
+        with self.condition:
+          commands, self.commands = self.commands, []
+        self.apply(commands)
+        try:
+          frame = self.render(commands[-1][0])
+        except Exception:
+          #The clients that wait for these commands get the last frame that was rendered
+          self.failed("render of commands up to %d" % commands[-1][0])
+          frame = RenderedFrame(commands[-1][0], self.frame.image)
+        self.lastRender = time.perf_counter()
+        for version, received, command in commands:
+          self.latencies.append(self.lastRender - received)
+        with self.condition:
+          self.frame = frame
+          self.condition.notify_all()
+
+    #End the render loop and release the clients that wait for a frame
+    def stop(self):
+      with self.condition:
+        self.stopped = True
+        self.condition.notify_all()
+
+    #Counts, latencies and encode times in ms, of the recent commands and frames
+    def metrics(self):
+      return {"commands": self.received, "renders": self.renders, "commandsPerRender": self.received / float(max(self.renders - 1, 1)),
+              "framesSent": self.sent, "errors": self.errors, "streams": self.streams, "latencyMs": frameStatistics(list(self.latencies)),
+              "renderMs": frameStatistics(list(self.renderTimes)),
+              "encodeMs": dict((format, frameStatistics(list(seconds))) for format, seconds in self.encodeTimes.items()),
+              "encodedBytes": self.encodedBytes, "state": self.state}
+
+    #Print the metrics
+    def printReport(self):
+      metrics = self.metrics()
+      print("Server: %d commands, %d renders, %d frames sent, %d errors" % (metrics["commands"], metrics["renders"], metrics["framesSent"],
+                                                                           metrics["errors"]))
+      for name, statistics in [("latency", metrics["latencyMs"]), ("render", metrics["renderMs"])] + \
+                              [("encode " + format, statistics) for format, statistics in metrics["encodeMs"].items()]:
+        if statistics["frames"]:
+          print("  %-12s %6d runs %8.2f ms mean %8.2f ms p95" % (name, statistics["frames"], statistics["mean"], statistics["p95"]))
+
+# Class for the HTTP requests of the clients:
+#   POST /command   a JSON command, answered with the first frame that shows it, or with its version when wait=0
+#   GET /frame      the latest frame, or the first frame after version=N
+#   GET /stream     the frames as they are rendered, as a multipart stream that a browser shows in an img element
+#   GET /metrics    the metrics of the server as JSON
+# The frames are JPEG unless format=png is asked for.
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    #The requests are not logged, the metrics count them
+    def log_message(self, format, *args):
+      pass
+
+    def sendJson(self, status, content):
+      body = json.dumps(content).encode()
+      self.send_response(status)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def sendFrame(self, frame, format):
+      body = self.server.renderServer.encode(frame, format)
+      self.send_response(200)
+      self.send_header("Content-Type", frameFormats[format])
+      self.send_header("Content-Length", str(len(body)))
+      self.send_header("X-Frame-Version", str(frame.version))
+      self.send_header("Cache-Control", "no-store")
+      self.end_headers()
+      self.wfile.write(body)
+
+    #The options of the query, with the format of the frames checked
+    def options(self):
+      url = urlparse(self.path)
+      query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+      if query.get("format", "jpeg") not in frameFormats:
+        raise ValueError("The format is jpeg or png")
+      return url.path, query
+
+    def do_GET(self):
+      renderServer = self.server.renderServer
+      try:
+        path, query = self.options()
+        format = query.get("format", "jpeg")
+        if path == "/frame":
+          self.sendFrame(renderServer.waitFrame(int(query.get("version", 0))), format)
+        elif path == "/stream":
+          self.stream(format)
+        elif path == "/metrics":
+          self.sendJson(200, renderServer.metrics())
+        else:
+          self.sendJson(404, {"error": "Unknown path %s, use /command, /frame, /stream or /metrics" % path})
+      except ValueError as error:
+        self.sendJson(400, {"error": str(error)})
+
+    def do_POST(self):
+      renderServer = self.server.renderServer
+      try:
+        path, query = self.options()
+        if path != "/command":
+          self.sendJson(404, {"error": "Commands are posted to /command"})
+          return
+        command = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not isinstance(command, dict):
+          raise ValueError("A command is a JSON object")
+        version = renderServer.submit(command)
+        if query.get("wait", "1") == "0":
+          self.sendJson(200, {"version": version})
+        else:
+          self.sendFrame(renderServer.waitFrame(version), query.get("format", "jpeg"))
+      except ValueError as error:
+        self.sendJson(400, {"error": str(error)})
+
+    #Send every new frame until the client closes the connection or the server stops
+    def stream(self, format):
+      renderServer = self.server.renderServer
+      self.send_response(200)
+      self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+      self.send_header("Cache-Control", "no-store")
+      self.end_headers()
+      with renderServer.condition:
+        renderServer.streams += 1
+      version = -1
+      try:
+        while not renderServer.stopped:
+          frame = renderServer.waitFrame(version + 1)
+          if frame.version <= version:
+            continue
+          version = frame.version
+          body = renderServer.encode(frame, format)
+          self.wfile.write(("--frame\r\nContent-Type: %s\r\nContent-Length: %d\r\nX-Frame-Version: %d\r\n\r\n" %
+                            (frameFormats[format], len(body), version)).encode())
+          self.wfile.write(body + b"\r\n")
+          self.wfile.flush()
+      except (BrokenPipeError, ConnectionResetError):
+        pass
+      finally:
+        with renderServer.condition:
+          renderServer.streams -= 1
+
+# Function to serve the scene on a port of localhost until interrupted: the HTTP requests are handled on threads
+# and the render loop runs on this thread, which owns the render window
+def serve(renderServer, port):
+  httpServer = ThreadingHTTPServer(("127.0.0.1", port), RenderRequestHandler)
+  httpServer.daemon_threads = True
+  httpServer.renderServer = renderServer
+  thread = threading.Thread(target=httpServer.serve_forever, name="http", daemon=True)
+  thread.start()
+  print("Serving the knee on http://127.0.0.1:%d (POST /command, GET /frame, /stream, /metrics), Ctrl+C to stop" % httpServer.server_address[1])
+  try:
+    renderServer.run()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    renderServer.stop()
+    httpServer.shutdown()
+    httpServer.server_close()
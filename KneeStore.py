@@ -0,0 +1,108 @@
+import KneeVTK as vtk
+import os
+import json
+import argparse
+import numpy
+from vtkmodules.util import numpy_support
+from TimestepCache import readImage
+from KneeStructures import structureSettings
+
+#Name of the store in the structure directory, a raw uint8 array with a JSON header next to it
+storeName = "knee_store"
+
+# Function to get the modification time and size of a file
+def fileStamp(path):
+  stat = os.stat(path)
+  return [stat.st_mtime, stat.st_size]
+
+# Function to convert all time steps of all structures into one store: a contiguous uint8 array with
+# the shape (time steps, structures, z, y, x) and a small JSON header with the geometry and the source files
+def convertStore(directory):
+  names = list(structureSettings)
+  files = [[fileList[timestep] for fileList, value, smooth in structureSettings.values()] for timestep in range(len(structureSettings[names[0]][0]))]
+  first = readImage(os.path.join(directory, files[0][0]))
+  dimensions = first.GetDimensions()
+  shape = [len(files), len(names), dimensions[2], dimensions[1], dimensions[0]]
+
+  #Write the volumes one by one into the array file, so never more than one volume is in memory
+  rawPath = os.path.join(directory, storeName + ".raw")
+  volumes = numpy.memmap(rawPath + ".tmp", dtype=numpy.uint8, mode="w+", shape=tuple(shape))
+  for timestep, fileNames in enumerate(files):
+    for structure, fileName in enumerate(fileNames):
+      image = readImage(os.path.join(directory, fileName))
+      if image.GetDimensions() != dimensions or image.GetSpacing() != first.GetSpacing() or image.GetOrigin() != first.GetOrigin():
+        raise ValueError("Structure file does not have the grid of the other files: " + fileName)
+      if image.GetPointData().GetScalars().GetDataType() != vtk.VTK_UNSIGNED_CHAR:
+        raise ValueError("Structure file is not uint8: " + fileName)
+      volumes[timestep, structure] = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(shape[2:])
+  volumes.flush()
+  del volumes
+
+  header = {"shape": shape, "dtype": "uint8", "spacing": list(first.GetSpacing()), "origin": list(first.GetOrigin()),
+            "extent": list(first.GetExtent()), "structures": names, "files": files,
+            "stamps": dict((fileName, fileStamp(os.path.join(directory, fileName))) for fileNames in files for fileName in fileNames)}
+  os.replace(rawPath + ".tmp", rawPath)
+  with open(os.path.join(directory, storeName + ".json"), "w") as f:
+    json.dump(header, f, indent=1)
+  return header
+
+# Class for the store of convertStore, it is memory-mapped and every volume is wrapped as vtkImageData without copying.
+# A volume is only used while its source file is unchanged since the conversion. The source file has to be there: the crop boxes
+# of the region index and the keys of the mesh cache are made from it.
+class VolumeStore():
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, storeName + ".json")) as f:
+          self.header = json.load(f)
+        self.volumes = numpy.memmap(os.path.join(directory, storeName + ".raw"), dtype=numpy.uint8, mode="r",
+                                    shape=tuple(self.header["shape"]))
+        self.positions = {}
+        for timestep, fileNames in enumerate(self.header["files"]):
+          for structure, fileName in enumerate(fileNames):
+            self.positions[fileName] = (timestep, structure)
+
+    #Check if the store has an up to date volume of a structure file
+    def has(self, fileName):
+      if fileName not in self.positions:
+        return False
+      path = os.path.join(self.directory, fileName)
+      return os.path.isfile(path) and fileStamp(path) == self.header["stamps"][fileName]
+
+    #Return the volume of a structure file. Without extent it shares the memory of the mapped file,
+    #with an extent only that part is copied out of it.
+    def getImage(self, fileName, extent=None):
+      timestep, structure = self.positions[fileName]
+      whole = self.header["extent"]
+      values = self.volumes[timestep, structure]
+      if extent is None:
+        extent = whole
+      else:
+        values = numpy.ascontiguousarray(values[extent[4] - whole[4]:extent[5] - whole[4] + 1,
+                                                extent[2] - whole[2]:extent[3] - whole[2] + 1,
+                                                extent[0] - whole[0]:extent[1] - whole[0] + 1])
+
+      #The VTK array keeps a reference to the NumPy array, and so to the mapped file
+      scalars = numpy_support.numpy_to_vtk(values.reshape(-1), deep=0)
+      scalars.SetName("Scalars_")
+      image = vtk.vtkImageData()
+      image.SetExtent(extent)
+      image.SetSpacing(self.header["spacing"])
+      image.SetOrigin(self.header["origin"])
+      image.GetPointData().SetScalars(scalars)
+      return image
+
+# Function to open the store of a structure directory, None when it has not been converted
+def openStore(directory):
+  if not os.path.isfile(os.path.join(directory, storeName + ".json")):
+    return None
+  return VolumeStore(directory)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Convert the structure files of all time steps into one memory-mappable store")
+  parser.add_argument("--directory", default="Structures", help="directory with the structure files (default Structures)")
+  args = parser.parse_args()
+
+  header = convertStore(args.directory)
+  print("Stored %s volumes of %s voxels in %s" % (header["shape"][0] * header["shape"][1],
+                                                  "x".join(str(n) for n in header["shape"][:1:-1]),
+                                                  os.path.join(args.directory, storeName + ".raw")))
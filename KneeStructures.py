@@ -0,0 +1,30 @@
+#List of all anatomic structures for different time steps
+skin_list       = ['skin_1.vti','skin_2.vti','skin_3.vti','skin_4.vti','skin_5.vti','skin_6.vti','skin_7.vti']
+bone_list       = ['bone1.vti','bone2.vti','bone3.vti','bone4.vti','bone5.vti','bone6.vti','bone7.vti']
+muscle_list1    = ['muscle1_1.vti','muscle1_2.vti','muscle1_3.vti','muscle1_4.vti','muscle1_5.vti','muscle1_6.vti','muscle1_7.vti']
+muscle_list2    = ['muscle2_1.vti','muscle2_2.vti','muscle2_3.vti','muscle2_4.vti','muscle2_5.vti','muscle2_6.vti','muscle2_7.vti']
+ligament1_list  = ['ligament1_1.vti','ligament1_2.vti','ligament1_3.vti','ligament1_4.vti','ligament1_5.vti','ligament1_6.vti','ligament1_7.vti']
+ligament2_list  = ['ligament2_1.vti','ligament2_2.vti','ligament2_3.vti','ligament2_4.vti','ligament2_5.vti','ligament2_6.vti','ligament2_7.vti']
+tendon1_list    = ['tendon1_1.vti','tendon1_2.vti','tendon1_3.vti','tendon1_4.vti','tendon1_5.vti','tendon1_6.vti','tendon1_7.vti']
+tendon2_list    = ['tendon2_1.vti','tendon2_2.vti','tendon2_3.vti','tendon2_4.vti','tendon2_5.vti','tendon2_6.vti','tendon2_7.vti']
+menis_list      = ['kneecap_1.vti','kneecap_2.vti','kneecap_3.vti','kneecap_4.vti','kneecap_5.vti','kneecap_6.vti','kneecap_7.vti']
+
+#Per anatomic structure the files of the time steps, the threshold value and the smoothing iterations of the isosurface
+structureSettings = {
+  "skin":      (skin_list, 10, 20),
+  "bone":      (bone_list, 10, 10),
+  "muscle1":   (muscle_list1, 10, 15),
+  "muscle2":   (muscle_list2, 10, 15),
+  "ligament1": (ligament1_list, 5, 5),
+  "ligament2": (ligament2_list, 5, 5),
+  "tendon1":   (tendon1_list, 10, 5),
+  "tendon2":   (tendon2_list, 10, 5),
+  "menis":     (menis_list, 10, 10),
+}
+
+# Function to get the files of all anatomic structures of all time steps
+def allStructureFiles():
+  files = []
+  for fileList, value, smooth in structureSettings.values():
+    files += fileList
+  return files
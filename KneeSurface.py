@@ -0,0 +1,221 @@
+import KneeVTK as vtk
+import numpy
+from vtkmodules.util import numpy_support
+
+#Parameters of the isosurface pipeline, the same for all anatomic structures
+thresholdRange = [5, 1150]
+gaussianRadius = 1
+gaussianStandardDeviation = 2.0
+passBand = 0.001
+featureAngle = 90
+
+#Engines for the contour stage, marching cubes is the reference the others are compared to
+contourEngines = ["marchingcubes", "flyingedges", "discrete"]
+
+#Fractions of the triangles of a surface that its decimated levels of detail keep, from fine to coarse
+lodFractions = [0.5, 0.1]
+
+#Shrink factor of the draft surfaces in x and y, the voxels are about three times longer in z than in x and y
+draftShrink = 2
+
+# Function to create the contour filter of an engine at the threshold value.
+# The discrete engine contours the thresholded labels directly, so it does not use the gaussian and the threshold value.
+def createContour(engine, value):
+  if engine == "marchingcubes":
+    contour = vtk.vtkMarchingCubes()
+    contour.SetValue(0, value)
+  elif engine == "flyingedges":
+    contour = vtk.vtkFlyingEdges3D()
+    contour.SetValue(0, value)
+  elif engine == "discrete":
+    contour = vtk.vtkDiscreteFlyingEdges3D()
+    contour.SetValue(0, 255)
+  else:
+    raise ValueError("Unknown contour engine: " + engine)
+  contour.ComputeScalarsOff()
+  contour.ComputeGradientsOff()
+  contour.ComputeNormalsOff()
+  return contour
+
+# Function to extract the isosurface of a structure image with the threshold value and smoothing iterations as input.
+# The filters are not kept, so only the final triangle strips stay in memory.
+# A watch function, for example of the profiler, is called with every filter before it runs.
+def extractSurface(image, value, smooth, engine="marchingcubes", watch=None):
+  #Function to select tissue at a threshold
+  selectTissue = vtk.vtkImageThreshold()
+  selectTissue.ThresholdBetween(thresholdRange[0], thresholdRange[1])
+  selectTissue.SetInValue(255)
+  selectTissue.SetOutValue(0)
+  selectTissue.SetInputData(image)
+
+  #Gaussian function for marching cubes
+  gaussian = vtk.vtkImageGaussianSmooth()
+  gaussian.SetStandardDeviations(gaussianStandardDeviation, gaussianStandardDeviation, gaussianStandardDeviation)
+  gaussian.SetRadiusFactors(gaussianRadius, gaussianRadius, gaussianRadius)
+  gaussian.SetInputConnection(selectTissue.GetOutputPort())
+
+  #Contour algorithm, marching cubes unless another engine is chosen
+  contour = createContour(engine, value)
+  if engine == "discrete":
+    contour.SetInputConnection(selectTissue.GetOutputPort())
+  else:
+    contour.SetInputConnection(gaussian.GetOutputPort())
+  if watch is not None:
+    for algorithm in [selectTissue, gaussian, contour]:
+      watch(algorithm)
+
+  #Smooth the contour and return the surface
+  return smoothSurface(contour.GetOutputPort(), smooth, watch)
+
+# Function to smooth a contour with the smoothing iterations as input, and to add normals and make triangle strips.
+# The surface is returned detached from the pipeline.
+def smoothSurface(port, smooth, watch=None):
+  #Smoothing function
+  smoother = vtk.vtkWindowedSincPolyDataFilter()
+  smoother.SetInputConnection(port)
+  smoother.SetNumberOfIterations(smooth)
+  smoother.BoundarySmoothingOn()
+  smoother.FeatureEdgeSmoothingOn()
+  smoother.SetFeatureAngle(featureAngle)
+  smoother.SetPassBand(passBand)
+  smoother.NonManifoldSmoothingOff()
+  smoother.NormalizeCoordinatesOn()
+
+  #Function for vtk poly data normals
+  normals = vtk.vtkPolyDataNormals()
+  normals.SetInputConnection(smoother.GetOutputPort())
+  normals.SetFeatureAngle(featureAngle)
+
+  #Function for vtk stripper
+  stripper = vtk.vtkStripper()
+  stripper.SetInputConnection(normals.GetOutputPort())
+  if watch is not None:
+    for algorithm in [smoother, normals, stripper]:
+      watch(algorithm)
+  stripper.Update()
+
+  #Return the surface detached from the pipeline
+  surface = vtk.vtkPolyData()
+  surface.ShallowCopy(stripper.GetOutput())
+  return surface
+
+# Function to extract the surfaces of all structures from a label image in a single discrete contouring sweep.
+# The mesh is split by label and every part gets the smoothing iterations of its structure (label n+1 for smooths[n]).
+def extractLabelSurfaces(labelImage, smooths, watch=None):
+  contour = vtk.vtkDiscreteFlyingEdges3D()
+  contour.SetInputData(labelImage)
+  contour.GenerateValues(len(smooths), 1, len(smooths))
+  contour.ComputeScalarsOn()
+  contour.ComputeGradientsOff()
+  contour.ComputeNormalsOff()
+  if watch is not None:
+    watch(contour)
+  contour.Update()
+
+  surfaces = []
+  for label, part in enumerate(splitLabels(contour.GetOutput(), len(smooths)), 1):
+    source = vtk.vtkTrivialProducer()
+    source.SetOutput(part)
+    surfaces.append(smoothSurface(source.GetOutputPort(), smooths[label - 1], watch))
+  return surfaces
+
+# Function to split the triangles of a discrete contour by their label, all points of a triangle have the label as scalar.
+# Every part only gets the points it uses and no scalars, so the mappers do not color it by label.
+def splitLabels(mesh, count):
+  points = numpy_support.vtk_to_numpy(mesh.GetPoints().GetData())
+  triangles = numpy_support.vtk_to_numpy(mesh.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+  labels = numpy_support.vtk_to_numpy(mesh.GetPointData().GetScalars())[triangles[:, 0]]
+
+  parts = []
+  for label in range(1, count + 1):
+    used, connectivity = numpy.unique(triangles[labels == label], return_inverse=True)
+    partPoints = vtk.vtkPoints()
+    partPoints.SetData(numpy_support.numpy_to_vtk(points[used], deep=1))
+    offsets = numpy.arange(0, connectivity.size + 1, 3)
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=1),
+                  numpy_support.numpy_to_vtkIdTypeArray(connectivity.ravel(), deep=1))
+    part = vtk.vtkPolyData()
+    part.SetPoints(partPoints)
+    part.SetPolys(cells)
+    parts.append(part)
+  return parts
+
+# Function to extract a draft isosurface of a structure image, shown while a slider is dragged. It is about ten times
+# faster than extractSurface: the grid is shrunk in x and y, the contour uses flying edges with the gradient
+# as normals, and there is no smoothing and no triangle strips.
+def extractDraftSurface(image, value, watch=None):
+  selectTissue = vtk.vtkImageThreshold()
+  selectTissue.ThresholdBetween(thresholdRange[0], thresholdRange[1])
+  selectTissue.SetInValue(255)
+  selectTissue.SetOutValue(0)
+  selectTissue.SetInputData(image)
+
+  shrink = vtk.vtkImageShrink3D()
+  shrink.SetShrinkFactors(draftShrink, draftShrink, 1)
+  shrink.AveragingOn()
+  shrink.SetInputConnection(selectTissue.GetOutputPort())
+
+  #The same gaussian as the final surface in world units, on the larger voxels
+  gaussian = vtk.vtkImageGaussianSmooth()
+  gaussian.SetStandardDeviations(gaussianStandardDeviation / draftShrink, gaussianStandardDeviation / draftShrink, gaussianStandardDeviation)
+  gaussian.SetRadiusFactors(gaussianRadius, gaussianRadius, gaussianRadius)
+  gaussian.SetInputConnection(shrink.GetOutputPort())
+
+  contour = vtk.vtkFlyingEdges3D()
+  contour.SetValue(0, value)
+  contour.ComputeScalarsOff()
+  contour.ComputeGradientsOff()
+  contour.ComputeNormalsOn()
+  contour.SetInputConnection(gaussian.GetOutputPort())
+  if watch is not None:
+    for algorithm in [selectTissue, shrink, gaussian, contour]:
+      watch(algorithm)
+  contour.Update()
+
+  surface = vtk.vtkPolyData()
+  surface.ShallowCopy(contour.GetOutput())
+  return surface
+
+# Function to decimate a surface to a fraction of its triangles with quadric decimation, for a level of detail.
+# The surface is returned with new normals and as triangle strips, detached from the pipeline.
+def decimateSurface(surface, fraction, watch=None):
+  #Quadric decimation needs triangles, the surfaces are triangle strips
+  triangles = vtk.vtkTriangleFilter()
+  triangles.SetInputData(surface)
+
+  decimate = vtk.vtkQuadricDecimation()
+  decimate.SetInputConnection(triangles.GetOutputPort())
+  decimate.SetTargetReduction(1.0 - fraction)
+  decimate.VolumePreservationOn()
+
+  normals = vtk.vtkPolyDataNormals()
+  normals.SetInputConnection(decimate.GetOutputPort())
+  normals.SetFeatureAngle(featureAngle)
+
+  stripper = vtk.vtkStripper()
+  stripper.SetInputConnection(normals.GetOutputPort())
+  if watch is not None:
+    for algorithm in [triangles, decimate, normals, stripper]:
+      watch(algorithm)
+  stripper.Update()
+
+  level = vtk.vtkPolyData()
+  level.ShallowCopy(stripper.GetOutput())
+  return level
+
+# Function to get the parameters that determine the surface of a structure, used to key cached surfaces
+def surfaceParameters(value, smooth, engine="marchingcubes"):
+  return [engine, value, smooth, thresholdRange, gaussianRadius, gaussianStandardDeviation, passBand, featureAngle]
+
+# Function to get the parameters that determine a level of detail of a surface, every level is decimated from the one before it
+def lodParameters(level):
+  return ["lod", lodFractions[:level + 1], featureAngle]
+
+# Function to get the parameters that determine the draft surface of a structure, used to key cached surfaces
+def draftSurfaceParameters(value):
+  return ["draft", value, draftShrink, thresholdRange, gaussianRadius, gaussianStandardDeviation]
+
+# Function to get the parameters that determine the surfaces extracted from a label image, used to key cached surfaces
+def labelSurfaceParameters(smooths):
+  return ["labelmap", smooths, passBand, featureAngle]
@@ -0,0 +1,35 @@
+#The VTK classes of the application, imported from their own modules: import vtk would load every VTK module.
+#The other modules use it in place of vtk, as: import KneeVTK as vtk
+from vtkmodules.vtkCommonCore import vtkCommand, vtkPoints, vtkDoubleArray, vtkLookupTable, VTK_UNSIGNED_CHAR
+from vtkmodules.vtkCommonColor import vtkNamedColors
+from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkImageData, vtkPiecewiseFunction, vtkCellArray
+from vtkmodules.vtkCommonExecutionModel import vtkTrivialProducer
+from vtkmodules.vtkFiltersCore import vtkTriangleFilter, vtkStripper, vtkPolyDataNormals, vtkFlyingEdges3D, vtkWindowedSincPolyDataFilter
+from vtkmodules.vtkFiltersCore import vtkQuadricDecimation, vtkMassProperties, vtkMarchingCubes, vtkCleanPolyData, vtkImplicitPolyDataDistance
+from vtkmodules.vtkFiltersGeneral import vtkDiscreteFlyingEdges3D
+from vtkmodules.vtkIOImage import vtkPNGWriter, vtkPNGReader, vtkJPEGWriter
+from vtkmodules.vtkIOXML import vtkXMLPolyDataWriter, vtkXMLPolyDataReader, vtkXMLImageDataReader
+from vtkmodules.vtkImagingCore import vtkImageThreshold, vtkImageShrink3D, vtkExtractVOI
+from vtkmodules.vtkImagingGeneral import vtkImageGaussianSmooth, vtkImageEuclideanDistance
+from vtkmodules.vtkInteractionStyle import vtkInteractorStyleTrackballCamera
+from vtkmodules.vtkInteractionWidgets import vtkSliderWidget, vtkSliderRepresentation2D, vtkTextWidget, vtkTextRepresentation
+from vtkmodules.vtkRenderingCore import vtkActor, vtkCamera, vtkCameraInterpolator, vtkColorTransferFunction, vtkPolyDataMapper
+from vtkmodules.vtkRenderingCore import vtkRenderer, vtkRenderWindow, vtkRenderWindowInteractor, vtkTextActor, vtkVolume
+from vtkmodules.vtkRenderingCore import vtkVolumeProperty, vtkWindowToImageFilter
+from vtkmodules.vtkRenderingUI import vtkGenericRenderWindowInteractor
+
+#The OpenGL implementations of the render classes and the fonts of the text
+import vtkmodules.vtkRenderingOpenGL2
+import vtkmodules.vtkRenderingFreeType
+
+#The modules of the volume mapper and the video writer are imported on first use, the isosurfaces and the
+#interactive application do not need them
+def __getattr__(name):
+  if name == "vtkGPUVolumeRayCastMapper":
+    from vtkmodules.vtkRenderingVolume import vtkGPUVolumeRayCastMapper
+    import vtkmodules.vtkRenderingVolumeOpenGL2
+    return vtkGPUVolumeRayCastMapper
+  if name == "vtkOggTheoraWriter":
+    from vtkmodules.vtkIOOggTheora import vtkOggTheoraWriter
+    return vtkOggTheoraWriter
+  raise AttributeError("module KneeVTK has no attribute " + name)
@@ -0,0 +1,83 @@
+import KneeVTK as vtk
+import numpy
+from vtkmodules.util import numpy_support
+
+#Structure voxels have a scalar above this value, the same edge as the transfer functions of the separate volumes
+labelThreshold = 50
+
+# Function to merge the structure images of a time step into one label image, the n-th image gets label n+1.
+# Later images win where structures overlap, so the skin, which encloses the other structures, should come first.
+# The images may be cropped to different extents, the label image covers all of them.
+def mergeLabels(images):
+  extents = [image.GetExtent() for image in images]
+  extent = []
+  for axis in range(3):
+    extent += [min(e[2 * axis] for e in extents), max(e[2 * axis + 1] for e in extents)]
+  labels = numpy.zeros((extent[5] - extent[4] + 1, extent[3] - extent[2] + 1, extent[1] - extent[0] + 1), dtype=numpy.uint8)
+
+  for label, image in enumerate(images, 1):
+    e = image.GetExtent()
+    values = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+    values = values.reshape(e[5] - e[4] + 1, e[3] - e[2] + 1, e[1] - e[0] + 1)
+    region = labels[e[4] - extent[4]:e[5] - extent[4] + 1, e[2] - extent[2]:e[3] - extent[2] + 1, e[0] - extent[0]:e[1] - extent[0] + 1]
+    region[values > labelThreshold] = label
+
+  labelImage = vtk.vtkImageData()
+  labelImage.SetExtent(extent)
+  labelImage.SetOrigin(images[0].GetOrigin())
+  labelImage.SetSpacing(images[0].GetSpacing())
+  scalars = numpy_support.numpy_to_vtk(labels.ravel(), deep=1)
+  scalars.SetName("Labels")
+  labelImage.GetPointData().SetScalars(scalars)
+  return labelImage
+
+# Class for the volume render of all anatomic structures as one label map.
+# All structures are rendered in a single ray cast pass, with a color and opacity per label
+# that are edited in place when an opacity slider changes. The mapper is created on first use.
+# It does not look like the separate volumes: the labels are sampled without interpolation and without the gradient
+# opacity of the separate volumes, so the edges of the structures are blocky and speckled, and thin structures such as
+# the tendons are nearly hidden inside the muscles and the skin. It trades that look for a single ray cast pass.
+class LabelVolume():
+    def __init__(self, names, colors, opacities):
+        self.names = names
+
+        #Input of the mapper, it gets the label image of the current time step
+        self.producer = vtk.vtkTrivialProducer()
+
+        #Color and opacity per label, the background label 0 is transparent
+        self.colorFunction = vtk.vtkColorTransferFunction()
+        self.opacityFunction = vtk.vtkPiecewiseFunction()
+        self.colorFunction.AddRGBPoint(0, 0.0, 0.0, 0.0)
+        self.opacityFunction.AddPoint(0, 0.0)
+        for label, name in enumerate(names, 1):
+          self.colorFunction.AddRGBPoint(label, colors[name][0], colors[name][1], colors[name][2])
+          self.opacityFunction.AddPoint(label, opacities[name])
+
+        #Labels must not be interpolated, a sample between two labels would get the color of a third one
+        volumeProperty = vtk.vtkVolumeProperty()
+        volumeProperty.SetColor(self.colorFunction)
+        volumeProperty.SetScalarOpacity(self.opacityFunction)
+        volumeProperty.SetInterpolationTypeToNearest()
+        volumeProperty.ShadeOn()
+        volumeProperty.SetAmbient(0.5)
+        volumeProperty.SetDiffuse(0.5)
+        volumeProperty.SetSpecular(0.5)
+
+        self.volume = vtk.vtkVolume()
+        self.volume.SetProperty(volumeProperty)
+
+    #Create the mapper of the volume render
+    def createMapper(self):
+      volumeMapper = vtk.vtkGPUVolumeRayCastMapper()
+      volumeMapper.SetInputConnection(self.producer.GetOutputPort())
+      volumeMapper.SetBlendModeToComposite()
+      self.volume.SetMapper(volumeMapper)
+
+    #Show the label image of a time step
+    def setLabelImage(self, labelImage):
+      self.producer.SetOutput(labelImage)
+
+    #Change the opacity of a structure by editing its node of the opacity function
+    def setOpacity(self, name, opacity):
+      label = self.names.index(name) + 1
+      self.opacityFunction.SetNodeValue(label, [label, opacity, 0.5, 0.0])
@@ -0,0 +1,315 @@
+import KneeVTK as vtk
+import os
+import glob
+import json
+import threading
+import hashlib
+from collections import OrderedDict
+from TimestepCache import PendingLoads
+from KneeSurface import extractSurface, surfaceParameters, extractLabelSurfaces, labelSurfaceParameters
+from KneeSurface import extractDraftSurface, draftSurfaceParameters, decimateSurface, lodParameters, lodFractions
+from KneeInbetween import inbetweenParameters
+
+#Number of draft surfaces kept in memory, enough for all structures and time steps of a dataset
+maxDrafts = 64
+
+#Version of the stored surfaces, increase it when extractSurface changes in a way its parameters do not show
+cacheVersion = 1
+
+# Function to get the memory used by a surface in bytes
+def surfaceBytes(surface):
+  return surface.GetActualMemorySize() * 1024
+
+# Function to get a short hash of a string
+def shortHash(text):
+  return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+# Class for a persistent cache of the extracted isosurfaces.
+# A surface is stored on disk as .vtp under a key built from the hash of the source file and the
+# pipeline parameters, so it is only extracted once per dataset. Surfaces in use are also kept in
+# memory up to a cap, with the least recently used ones evicted first.
+# The cache can be used from worker threads. The lock only guards the dict of surfaces, a surface is read or extracted without it,
+# so a thread is only held up by a thread that reads or extracts the same surface.
+# With a profiler the filters of every extraction and the reader of every stored surface are timed.
+class MeshCache():
+    def __init__(self, volumeCache, directory, maxBytes, engine="marchingcubes", profiler=None):
+        self.volumeCache = volumeCache
+        self.engine = engine
+        self.profiler = profiler
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.surfaces = OrderedDict()
+        self.kinds = {}
+        self.bytes = 0
+        self.fileHashes = {}
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.pending = PendingLoads()
+        self.lock = threading.RLock()
+        self.drafts = OrderedDict()
+        self.draftBytes = 0
+        self.draftLock = threading.Lock()
+        if self.directory is not None:
+          os.makedirs(self.directory, exist_ok=True)
+
+    #Return the surface of a structure file, from memory, from disk or by extracting it
+    def getSurface(self, fileName, value, smooth):
+      key = self.key(fileName, value, smooth)
+      return self.fetch(key, lambda: self.readOrExtract(key, fileName, lambda: extractSurface(self.volumeCache.getImage(fileName), value,
+                                                                                                 smooth, self.engine, self.watcher(fileName))))
+
+    #Return the surface of a key from memory, or load it without the lock when no other thread is loading it already
+    def fetch(self, key, load, kind="surfaces"):
+      with self.lock:
+        surface = self.surfaces.get(key)
+        if surface is not None:
+          self.surfaces.move_to_end(key)
+          self.hits += 1
+          return surface
+        future, loading = self.pending.claim(key)
+      if not loading:
+        return future.result()
+      return self.pending.load(key, future, self.lock, load, lambda surface: self.keep(key, surface, kind))
+
+    #Read a surface from disk, or extract and store it when it is not there
+    def readOrExtract(self, key, fileName, extract):
+      surface = self.read(key, fileName)
+      with self.lock:
+        if surface is not None:
+          self.diskHits += 1
+        else:
+          self.misses += 1
+      if surface is None:
+        surface = extract()
+        self.write(key, surface)
+      return surface
+
+    #Return the surfaces of all structure files of a time step, extracted together in one sweep over their label image.
+    #The label image is only asked for when a surface is neither in memory nor on disk.
+    def getLabelSurfaces(self, fileNames, smooths, getLabelImage):
+      keys = self.labelKeys(fileNames, smooths)
+      with self.lock:
+        surfaces = [self.surfaces.get(key) for key in keys]
+        if None not in surfaces:
+          for key in keys:
+            self.surfaces.move_to_end(key)
+          self.hits += len(keys)
+          return surfaces
+        future, loading = self.pending.claim(tuple(keys))
+      if not loading:
+        return future.result()
+
+      def load():
+        surfaces = [self.read(key, fileName) for key, fileName in zip(keys, fileNames)]
+        if None not in surfaces:
+          with self.lock:
+            self.diskHits += len(keys)
+          return surfaces
+        with self.lock:
+          self.misses += len(keys)
+        #The label surfaces of a time step are extracted together, they are profiled as one label map structure
+        surfaces = extractLabelSurfaces(getLabelImage(), smooths, self.watcher(fileNames[0], "labelmap"))
+        for key, surface in zip(keys, surfaces):
+          self.write(key, surface)
+        return surfaces
+      def add(surfaces):
+        for key, surface in zip(keys, surfaces):
+          self.keep(key, surface)
+      return self.pending.load(tuple(keys), future, self.lock, load, add)
+
+    #Return the surface of an in-between of two structure files at a weight, from memory, from disk or by extracting it.
+    #The in-between image is only asked for when the surface is neither in memory nor on disk.
+    def getInbetweenSurface(self, fileNameA, fileNameB, weight, value, smooth, getImage):
+      key = self.inbetweenKey(fileNameA, fileNameB, weight, value, smooth)
+      return self.fetch(key, lambda: self.readOrExtract(key, fileNameA, lambda: extractSurface(getImage(), value, smooth, self.engine,
+                                                                                                  self.watcher(fileNameA))), "inbetweens")
+
+    #Check if the surface of an in-between is in memory or on disk, so it can be shown without blending and extracting it
+    def hasInbetweenSurface(self, fileNameA, fileNameB, weight, value, smooth):
+      key = self.inbetweenKey(fileNameA, fileNameB, weight, value, smooth)
+      return key in self.surfaces or (self.directory is not None and os.path.isfile(os.path.join(self.directory, key + ".vtp")))
+
+    #Return the decimated levels of detail of the surface of a structure file, from fine to coarse
+    def getLevels(self, fileName, value, smooth):
+      return self.levels(self.key(fileName, value, smooth), self.getSurface(fileName, value, smooth), fileName)
+
+    #Return the decimated levels of detail of the surface of an in-between, from fine to coarse
+    def getInbetweenLevels(self, fileNameA, fileNameB, weight, value, smooth, getImage):
+      return self.levels(self.inbetweenKey(fileNameA, fileNameB, weight, value, smooth),
+                         self.getInbetweenSurface(fileNameA, fileNameB, weight, value, smooth, getImage), fileNameA)
+
+    #Return the levels of detail of the surfaces of all structure files of a time step extracted from their label image
+    def getLabelLevels(self, fileNames, smooths, getLabelImage):
+      surfaces = self.getLabelSurfaces(fileNames, smooths, getLabelImage)
+      return [self.levels(key, surface, fileName) for key, surface, fileName in zip(self.labelKeys(fileNames, smooths), surfaces, fileNames)]
+
+    #Levels of detail of a surface with its key, from memory, from disk or by decimating the level before it.
+    #A level has the key of the surface with the level of detail added to the parameters, so it is replaced with the surface.
+    def levels(self, key, surface, fileName):
+      stem, parameters, content = key.rsplit("-", 2)
+      levels = []
+      for level in range(len(lodFractions)):
+        levelKey = stem + "-" + shortHash(json.dumps([parameters] + lodParameters(level))) + "-" + content
+        fraction = lodFractions[level] / (lodFractions[level - 1] if level > 0 else 1.0)
+        finer = levels[-1] if levels else surface
+        levels.append(self.fetch(levelKey, lambda: self.readOrExtract(levelKey, fileName, lambda: decimateSurface(finer, fraction,
+                                                                                                                   self.watcher(fileName))),
+                                 "levels"))
+      return levels
+
+    #Check if the surface of a structure file is in memory or on disk, so it can be shown without extracting it.
+    #It does not wait for the lock, a thread that is extracting surfaces would keep it too long.
+    def hasSurface(self, fileName, value, smooth):
+      return self.key(fileName, value, smooth) in self.surfaces or self.isStored(fileName, value, smooth)
+
+    #Return the draft surface of a structure file, it is kept in memory but not stored on disk.
+    #The drafts have their own dict and lock, so a draft is never held up by a thread that is loading final surfaces.
+    #They are small and capped by number, the memory cap of the final surfaces does not count them.
+    def getDraftSurface(self, fileName, value):
+      parameters = json.dumps([cacheVersion] + draftSurfaceParameters(value))
+      key = os.path.splitext(os.path.basename(fileName))[0] + "-" + shortHash(parameters) + "-" + self.fileHash(fileName)
+      with self.draftLock:
+        surface = self.drafts.get(key)
+        if surface is not None:
+          self.drafts.move_to_end(key)
+          return surface
+      surface = extractDraftSurface(self.volumeCache.getImage(fileName), value, self.watcher(fileName))
+      with self.draftLock:
+        if key not in self.drafts:
+          self.drafts[key] = surface
+          self.draftBytes += surfaceBytes(surface)
+        while len(self.drafts) > maxDrafts:
+          self.draftBytes -= surfaceBytes(self.drafts.popitem(last=False)[1])
+        return self.drafts[key]
+
+    #Check if the surface of a structure file is stored on disk with the current source file and parameters
+    def isStored(self, fileName, value, smooth):
+      if self.directory is None:
+        return False
+      return os.path.isfile(os.path.join(self.directory, self.key(fileName, value, smooth) + ".vtp"))
+
+    #Add a surface that was extracted elsewhere, for example by a worker process
+    def store(self, fileName, value, smooth, surface):
+      key = self.key(fileName, value, smooth)
+      self.write(key, surface)
+      with self.lock:
+        self.keep(key, surface)
+
+    #Keep a surface in memory, the kind tells final surfaces, levels of detail and in-betweens apart in the memory report
+    def keep(self, key, surface, kind="surfaces"):
+      if key in self.surfaces:
+        self.bytes -= surfaceBytes(self.surfaces.pop(key))
+      self.surfaces[key] = surface
+      self.kinds[key] = kind
+      self.bytes += surfaceBytes(surface)
+      self.evict()
+
+    #Number and bytes of the surfaces in memory per kind
+    def kindBytes(self):
+      with self.lock:
+        kinds = {}
+        for key, surface in self.surfaces.items():
+          count, bytes = kinds.get(self.kinds[key], (0, 0))
+          kinds[self.kinds[key]] = (count + 1, bytes + surfaceBytes(surface))
+      with self.draftLock:
+        if self.drafts:
+          kinds["drafts"] = (len(self.drafts), self.draftBytes)
+      return kinds
+
+    #Watch function for the filters of an extraction: the output of every filter is released as soon as the next one has
+    #run, so only the final surface stays in memory, and with a profiler the filters are timed
+    def watcher(self, fileName, structure=None):
+      profile = None if self.profiler is None else self.profiler.watcher(fileName, structure)
+      def watch(algorithm):
+        algorithm.ReleaseDataFlagOn()
+        if profile is not None:
+          profile(algorithm)
+      return watch
+
+    #Key of a surface: structure name, hash of the engine and pipeline parameters and hash of the source file.
+    #The first two parts group the entries that are replaced when the source file changes.
+    def key(self, fileName, value, smooth):
+      parameters = json.dumps([cacheVersion] + surfaceParameters(value, smooth, self.engine))
+      stem = os.path.splitext(os.path.basename(fileName))[0]
+      return stem + "-" + shortHash(parameters) + "-" + self.fileHash(fileName)
+
+    #Key of the surface of an in-between: name of the first structure file, hash of the pipeline and blend parameters with the
+    #weight and hash of both source files
+    def inbetweenKey(self, fileNameA, fileNameB, weight, value, smooth):
+      parameters = json.dumps([cacheVersion] + surfaceParameters(value, smooth, self.engine) + inbetweenParameters(weight))
+      stem = os.path.splitext(os.path.basename(fileNameA))[0]
+      return stem + "-" + shortHash(parameters) + "-" + shortHash(self.fileHash(fileNameA) + self.fileHash(fileNameB))
+
+    #Keys of the surfaces extracted from a label image. A label surface depends on all structures of the time step,
+    #because they share the voxels
+    def labelKeys(self, fileNames, smooths):
+      parameters = json.dumps([cacheVersion] + labelSurfaceParameters(smooths))
+      content = shortHash("".join(self.fileHash(fileName) for fileName in fileNames))
+      return [os.path.splitext(os.path.basename(fileName))[0] + "-" + shortHash(parameters) + "-" + content for fileName in fileNames]
+
+    #Hash of the content of a source file, only recomputed when the file is modified
+    def fileHash(self, fileName):
+      path = os.path.join(self.volumeCache.directory, fileName)
+      stat = os.stat(path)
+      stamp = (stat.st_mtime, stat.st_size)
+      known = self.fileHashes.get(path)
+      if known is not None and known[0] == stamp:
+        return known[1]
+      with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+      self.fileHashes[path] = (stamp, digest)
+      return digest
+
+    #Read a stored surface, returns None when it is not on disk or cannot be read
+    def read(self, key, fileName=None):
+      if self.directory is None:
+        return None
+      path = os.path.join(self.directory, key + ".vtp")
+      if not os.path.isfile(path):
+        return None
+      reader = vtk.vtkXMLPolyDataReader()
+      reader.SetFileName(path)
+      if self.profiler is not None and fileName is not None:
+        self.profiler.watcher(fileName)(reader)
+      reader.Update()
+      if reader.GetErrorCode() != 0:
+        os.remove(path)
+        return None
+      surface = vtk.vtkPolyData()
+      surface.ShallowCopy(reader.GetOutput())
+      return surface
+
+    #Store a surface and remove the stale entries of the same structure and parameters
+    def write(self, key, surface):
+      if self.directory is None:
+        return
+      group = key.rsplit("-", 1)[0]
+      for stale in glob.glob(os.path.join(self.directory, group + "-*.vtp")):
+        os.remove(stale)
+
+      #Write raw binary with fast compression to a temporary file, then move it in place
+      path = os.path.join(self.directory, key + ".vtp")
+      writer = vtk.vtkXMLPolyDataWriter()
+      writer.SetFileName(path + ".tmp")
+      writer.SetInputData(surface)
+      writer.SetDataModeToAppended()
+      writer.EncodeAppendedDataOff()
+      writer.SetCompressorTypeToLZ4()
+      writer.Write()
+      os.replace(path + ".tmp", path)
+
+    #Drop the least recently used surfaces until the cache fits in the memory cap again
+    def evict(self):
+      while self.bytes > self.maxBytes and len(self.surfaces) > 1:
+        self.evictOldest()
+
+    #Drop the least recently used surface, returns False when the cache is empty
+    def evictOldest(self):
+      with self.lock:
+        if not self.surfaces:
+          return False
+        key, surface = self.surfaces.popitem(last=False)
+        del self.kinds[key]
+        self.bytes -= surfaceBytes(surface)
+        return True
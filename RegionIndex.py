@@ -0,0 +1,86 @@
+import KneeVTK as vtk
+import os
+import json
+import numpy
+import threading
+from vtkmodules.util import numpy_support
+from KneeSurface import gaussianRadius, gaussianStandardDeviation
+
+#Voxels kept around the non-zero box of a structure. The gaussian spreads a structure by its kernel radius,
+#and those voxels need another kernel radius of zeros around them to get the same value as on the full grid.
+cropPadding = 2 * int(gaussianStandardDeviation * gaussianRadius)
+
+# Function to get the extent of the non-zero voxels of an image, None when all voxels are zero
+def nonZeroExtent(image):
+  extent = image.GetExtent()
+  dimensions = image.GetDimensions()
+  values = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(dimensions[2], dimensions[1], dimensions[0])
+  box = []
+  #Axis x, y and z of the image are axis 2, 1 and 0 of the array
+  for axis, others in [(2, (0, 1)), (1, (0, 2)), (0, (1, 2))]:
+    used = numpy.flatnonzero(values.any(axis=others))
+    if used.size == 0:
+      return None
+    start = extent[2 * (2 - axis)]
+    box += [start + int(used[0]), start + int(used[-1])]
+  return box
+
+# Function to pad a box within the whole extent, an empty structure gets the smallest box in the corner
+def cropExtent(box, whole, padding=cropPadding):
+  if box is None:
+    return [whole[0], min(whole[0] + 1, whole[1]), whole[2], min(whole[2] + 1, whole[3]), whole[4], min(whole[4] + 1, whole[5])]
+  extent = []
+  for axis in range(3):
+    extent += [max(box[2 * axis] - padding, whole[2 * axis]), min(box[2 * axis + 1] + padding, whole[2 * axis + 1])]
+  return extent
+
+# Function to crop an image to an extent, the origin and spacing stay the same so world coordinates do not change
+def extractExtent(image, extent, watch=None):
+  voi = vtk.vtkExtractVOI()
+  voi.SetInputData(image)
+  voi.SetVOI(*extent)
+  if watch is not None:
+    watch(voi)
+  voi.Update()
+  cropped = vtk.vtkImageData()
+  cropped.ShallowCopy(voi.GetOutput())
+  return cropped
+
+# Function to crop an image to its padded non-zero box
+def cropImage(image):
+  return extractExtent(image, cropExtent(nonZeroExtent(image), image.GetExtent()))
+
+# Class for a small index with the whole extent and the padded non-zero box of every structure file.
+# It is stored as JSON, an entry is only used while the file has the same modification time and size.
+# Files can be added from several threads, the index is written by one at a time.
+class RegionIndex():
+    def __init__(self, path):
+        self.path = path
+        self.regions = {}
+        self.lock = threading.Lock()
+        if self.path is not None and os.path.isfile(self.path):
+          with open(self.path) as f:
+            self.regions = json.load(f)
+
+    #Return the whole extent and the crop extent of a file, None when they are not known for this version of the file
+    def get(self, filePath):
+      region = self.regions.get(os.path.abspath(filePath))
+      if region is None or region["stamp"] != fileStamp(filePath):
+        return None
+      return region["whole"], region["crop"]
+
+    #Add the extents of a file and store the index
+    def put(self, filePath, whole, crop):
+      region = {"stamp": fileStamp(filePath), "whole": list(whole), "crop": list(crop)}
+      with self.lock:
+        self.regions[os.path.abspath(filePath)] = region
+        if self.path is not None:
+          os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+          with open(self.path + ".tmp", "w") as f:
+            json.dump(self.regions, f)
+          os.replace(self.path + ".tmp", self.path)
+
+# Function to get the modification time and size of a file
+def fileStamp(filePath):
+  stat = os.stat(filePath)
+  return [stat.st_mtime, stat.st_size]
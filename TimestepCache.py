@@ -0,0 +1,166 @@
+import KneeVTK as vtk
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from RegionIndex import nonZeroExtent, cropExtent, extractExtent
+
+# Function to get the memory used by an image in bytes
+def imageBytes(image):
+  return image.GetActualMemorySize() * 1024
+
+# Function to read a structure file, or only an extent of it. The reader is not kept so the image is detached from it.
+# A watch function, for example of the profiler, is called with the reader before it runs.
+def readImage(path, extent=None, watch=None):
+  if not os.path.isfile(path):
+    raise IOError("Structure file not found: " + path)
+  reader = vtk.vtkXMLImageDataReader()
+  reader.SetFileName(path)
+  if watch is not None:
+    watch(reader)
+  if extent is None:
+    reader.Update()
+  else:
+    reader.UpdateInformation()
+    reader.UpdateExtent(extent)
+  image = vtk.vtkImageData()
+  image.ShallowCopy(reader.GetOutput())
+  return image
+
+# Class for the loads in flight of a cache, per key. The first thread that misses a key loads it without the lock of the cache,
+# the threads that miss the same key meanwhile wait for that load only, and threads that ask for other keys are not held up.
+class PendingLoads():
+    def __init__(self):
+        self.futures = {}
+
+    #Return the future of the load of a key and whether the caller has to load it, called with the lock of the cache held
+    def claim(self, key):
+      future = self.futures.get(key)
+      if future is not None:
+        return future, False
+      future = Future()
+      self.futures[key] = future
+      return future, True
+
+    #Run the load of a claimed key without the lock, then add its result to the cache with the lock held and hand it to the
+    #threads that wait for it. A load that fails raises in all of them, the next miss of the key loads it again.
+    def load(self, key, future, lock, load, add):
+      try:
+        result = load()
+      except BaseException as error:
+        with lock:
+          del self.futures[key]
+        future.set_exception(error)
+        raise
+      with lock:
+        add(result)
+        del self.futures[key]
+      future.set_result(result)
+      return result
+
+# Class for an in-memory cache of the decoded structure volumes of all time steps.
+# Every .vti file is decoded once (on first access or by preload) and kept as vtkImageData,
+# when the memory cap is exceeded the least recently used images are evicted.
+# With a region index the images are cropped to the padded box of their non-zero voxels,
+# with a volume store the images come from the memory-mapped store instead of the .vti files.
+# The cache can be used from worker threads. The lock only guards the dict of images, an image is decoded without it,
+# so a thread is only held up by a thread that decodes the same file.
+# With a profiler the reader and crop filter of every load are timed.
+class TimestepCache():
+    def __init__(self, directory, maxBytes, regions=None, store=None, profiler=None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.regions = regions
+        self.store = store
+        self.profiler = profiler
+        self.wholeExtents = {}
+        self.images = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.pending = PendingLoads()
+        self.lock = threading.RLock()
+
+    #Return the image of a structure file, decode it when it is not in memory
+    def getImage(self, fileName):
+      with self.lock:
+        image = self.images.get(fileName)
+        if image is not None:
+          self.images.move_to_end(fileName)
+          self.hits += 1
+          return image
+        future, loading = self.pending.claim(fileName)
+        if loading:
+          self.misses += 1
+      if not loading:
+        return future.result()
+      return self.pending.load(fileName, future, self.lock, lambda: self.load(fileName), lambda image: self.add(fileName, image))
+
+    #Add a decoded image, called with the lock held
+    def add(self, fileName, image):
+      self.images[fileName] = image
+      self.bytes += imageBytes(image)
+      self.evict()
+
+    #Decode all given structure files, for example all time steps before the animation starts
+    def preload(self, fileNames):
+      for fileName in fileNames:
+        self.getImage(fileName)
+
+    #Load the image of a structure file, only the crop extent when it is in the region index
+    def load(self, fileName):
+      path = os.path.join(self.directory, fileName)
+      if self.regions is None:
+        return self.read(fileName)
+
+      region = self.regions.get(path)
+      if region is not None:
+        whole, crop = region
+        image = self.read(fileName, crop)
+      else:
+        image = self.read(fileName)
+        whole = image.GetExtent()
+        crop = cropExtent(nonZeroExtent(image), whole)
+        image = extractExtent(image, crop, self.watcher(fileName))
+        self.regions.put(path, whole, crop)
+      self.wholeExtents[fileName] = whole
+      return image
+
+    #Read the image of a structure file, or an extent of it, from the volume store or else from the .vti file
+    def read(self, fileName, extent=None):
+      if self.store is not None and self.store.has(fileName):
+        if self.profiler is None:
+          return self.store.getImage(fileName, extent)
+        start = time.perf_counter()
+        image = self.store.getImage(fileName, extent)
+        self.profiler.record("VolumeStore", fileName, time.perf_counter() - start, image)
+        return image
+      return readImage(os.path.join(self.directory, fileName), extent, self.watcher(fileName))
+
+    #Watch function of the profiler for the filters that load a structure file, None without profiler
+    def watcher(self, fileName):
+      return None if self.profiler is None else self.profiler.watcher(fileName)
+
+    #Return the center of the full grid of a structure file, also when the image is cropped
+    def getCenter(self, fileName):
+      image = self.getImage(fileName)
+      whole = self.wholeExtents.get(fileName, image.GetExtent())
+      origin = image.GetOrigin()
+      spacing = image.GetSpacing()
+      return [origin[axis] + spacing[axis] * (whole[2 * axis] + whole[2 * axis + 1]) / 2.0 for axis in range(3)]
+
+    #Drop the least recently used images until the cache fits in the memory cap again.
+    #The most recently used image is always kept, even if it alone exceeds the cap.
+    def evict(self):
+      while self.bytes > self.maxBytes and len(self.images) > 1:
+        self.evictOldest()
+
+    #Drop the least recently used image, returns False when the cache is empty
+    def evictOldest(self):
+      with self.lock:
+        if not self.images:
+          return False
+        fileName, image = self.images.popitem(last=False)
+        self.bytes -= imageBytes(image)
+        return True